@@ -14,8 +14,11 @@ if [ -z "$old_container_id" ]; then
     docker stop previous_container
   fi
 else
+  # Containers used to be restarted daily by a script; stop it if it is still running from an older deployment
   restarter="$(pgrep restart_24.sh)"
-  kill "$restarter"
+  if [ -n "$restarter" ]; then
+    kill "$restarter"
+  fi
   docker stop "$old_container_id" > /dev/null 2>&1
 fi
 
@@ -31,5 +34,3 @@ if [ "$run_status" != 0 ]; then
   >&2 echo "error on docker run"
   exit "$run_status"
 fi
-
-nohup ./restart_24.sh "$container_id" 1>&2  2>./restart.log &
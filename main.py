@@ -1,35 +1,12 @@
 from src.complements_bot import ComplementsBot
-
-# import logging.config
-#
-# logging_config = {
-#     'version': 1,
-#     'formatters': {
-#         'detailed': {
-#             'format': '%(asctime)s [%(levelname)s] %(message)s',
-#         },
-#     },
-#     'handlers': {
-#         'file': {
-#             'class': 'logging.handlers.RotatingFileHandler',
-#             'filename': '/complements-bot-py/app.log',
-#             'maxBytes': 50e6,
-#             'backupCount': 3,
-#             'formatter': 'detailed',
-#         },
-#         'console': {
-#             'class': 'logging.StreamHandler',
-#             'formatter': 'detailed',
-#         },
-#     },
-#     'root': {
-#         'handlers': ['file', 'console'],
-#         'level': 'INFO',
-#     },
-# }
-
-# logging.config.dictConfig(logging_config)
+from src.complements_bot.cluster import ClusterNodeBot
+from src.complements_bot.logs import configure_logging_from_env
+from src.env_reader import NODE_ID
 
 if __name__ == "__main__":
-    bot: ComplementsBot = ComplementsBot()
-    bot.run()
+    log_listener = configure_logging_from_env()
+    try:
+        bot: ComplementsBot = ClusterNodeBot(NODE_ID) if NODE_ID else ComplementsBot()
+        bot.run()
+    finally:
+        log_listener.stop()
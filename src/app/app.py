@@ -3,13 +3,32 @@ All of the API's endpoints
 """
 
 import asyncio
+from typing import Awaitable, Callable
 
-# from hypercorn.asyncio import serve
-# from hypercorn.config import Config
-# from quart import Quart
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from quart import Quart, Response
 from twitchio.ext import commands
 
-# app = Quart(__name__)
+from ..metrics import REGISTRY, monitor_event_loop_lag
+
+app = Quart(__name__)
+
+
+async def _render_metrics() -> str:
+    return REGISTRY.render()
+
+
+# Where the metrics served come from; the metrics of this process, unless they are gathered from elsewhere
+_METRICS_SOURCE: Callable[[], Awaitable[str]] = _render_metrics
+
+
+def set_metrics_source(source: Callable[[], Awaitable[str]]) -> None:
+    """
+    :param source: returns the metrics to serve, in Prometheus' text format (e.g. those of several processes merged)
+    """
+    global _METRICS_SOURCE  # pylint: disable=global-statement
+    _METRICS_SOURCE = source
 
 
 # @app.route('/webhook', methods=['POST'])
@@ -22,15 +41,24 @@ from twitchio.ext import commands
 #     return 'Success!', 200
 
 
-# async def run_hypercorn_app():
-#     """
-#     Start the app
-#     """
-#     config = Config()
-#     config.bind = ["0.0.0.0:50995"]
-#     config.workers = 1
-#     config.loglevel = "info"
-#     await serve(app, config)
+@app.route('/metrics', methods=['GET'])
+async def metrics() -> Response:
+    """
+    Everything measured about the bot, in Prometheus' text format
+    :return: the metrics
+    """
+    return Response(await _METRICS_SOURCE(), status=200, content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+async def run_hypercorn_app():
+    """
+    Start the app
+    """
+    config = Config()
+    config.bind = ["0.0.0.0:50995"]
+    config.workers = 1
+    config.loglevel = "info"
+    await serve(app, config)
 
 
 async def run_app_and_bot(bot: commands.Bot):
@@ -39,8 +67,10 @@ async def run_app_and_bot(bot: commands.Bot):
     :param bot: the bot that we are using
     """
     # Start the Hypercorn server
-    # hypercorn_task = asyncio.ensure_future(run_hypercorn_app())
+    hypercorn_task = asyncio.ensure_future(run_hypercorn_app())
+    # Measure how busy the event loop shared by the two is
+    lag_task = asyncio.ensure_future(monitor_event_loop_lag())
     # Start the bot
     bot_task = asyncio.ensure_future(bot.connect())
     await bot_task
-    # await hypercorn_task
+    await asyncio.gather(hypercorn_task, lag_task)
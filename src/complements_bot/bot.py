@@ -3,28 +3,36 @@ Holds all commands (and their logic) for how ComplementsBot should complement Tw
 """
 import asyncio
 import itertools
+import logging
 import os
 import random
-import sys
 import textwrap
-from typing import Awaitable, Callable, Iterable, Optional, Tuple, Union
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple, Union, cast
 
-from twitchio import Message
+from twitchio import Channel, Chatter, Message
 from twitchio.ext import commands  # , routines , eventsub
 
-from . import database
-from .utilities import Awaitables, remove_chars, run_with_appropriate_awaiting
+from . import database, logs, message_context, tracing
+from .. import metrics
+from .complement_stream import ComplementStream
+from .connection_supervisor import ConnectionSupervisor
+from .resolver import UserResolver
+from .join_scheduler import JoinPriority, JoinScheduler
+from .send_queue import Priority, SendQueue
+from .utilities import Awaitables, ShuffleBag, remove_chars, run_with_appropriate_awaiting
 from ..app.app import run_app_and_bot
-from ..env_reader import CLIENT_SECRET, TMI_TOKEN
+from ..env_reader import CLIENT_SECRET, COMPLEMENT_BATCH_WINDOW_MS, SLOW_MESSAGE_THRESHOLD_MS, TMI_TOKEN, \
+    TWITCH_JOIN_LIMIT, TWITCH_MESSAGE_LIMIT
 
 
-# logger = logging.getLogger(__name__)
+_CHAT_LOG: logging.Logger = logging.getLogger(logs.CHAT)
+_COMPLEMENTS_LOG: logging.Logger = logging.getLogger(logs.COMPLEMENTS)
+_COMMANDS_LOG: logging.Logger = logging.getLogger(logs.COMMANDS)
+_BOT_LOG: logging.Logger = logging.getLogger(logs.BOT)
 
 # TODO:
-#  why does complements bot crash every now and then? currently have it set up so that if no activity is detected after an
-#       hour, it restarts itself
 #  Write tests - LOL what even are tests?
-#  If failed to join channel (or left channel due to lost connection?), try rejoining it every few hours
 #  (paid feature - paid per message that has to go through the OpenAI API) integrate OpenAI API calls that generate
 #       complements based on streamer's existing complements (or default ones) + last few messages from chat
 #  Disabled for first x-hundred users; post advert every some amount of time (that they can pay to get rid of); advert can be
@@ -41,8 +49,6 @@ from ..env_reader import CLIENT_SECRET, TMI_TOKEN
 #  test if an error in building/running the docker container on the VPS causes github actions to fail
 #  use asyncio.create_task() instead of calling a coroutine as if it is a function - create_task() starts the task up straight
 #       away, whereas calling it as a function only creates a coroutine that will start only once awaited
-#  add caching when random complement gets generated - create a stream of n random complements from the user's list;
-#       this is in case twitch API usage goes too high
 #  create discord integration, so the bot can be used on discord as well
 #  |
 #  make a website where users can see all of their info
@@ -51,26 +57,24 @@ from ..env_reader import CLIENT_SECRET, TMI_TOKEN
 #  allow users to make complement redeems in their channel
 
 
-def custom_log(msg: str, should_log: bool = True) -> None:
-    """
-    Any messages which we want to log should be passed through this method
-    """
-    if should_log:
-        print(msg, file=sys.stderr)
-
-
-class ComplementsBot(commands.Bot):
+class ComplementsBot(commands.Bot):  # pylint: disable=too-many-instance-attributes
     """
     Inherits from TwitchIO's commands.Bot class, and adds twitch chat commands for using the bot
     """
 
     CMD_PREFIX: str = '!'
-    DEFAULT_MAX_MSG_LEN: int = 500
+    DEFAULT_MAX_MSG_LEN: int = SendQueue.MAX_MESSAGE_LENGTH
     MAX_COMPLEMENT_LENGTH: int = 350
     F_USER: str = "{user}"
-    SHOULD_LOG: bool = True
     OWNER_NICK: str = 'ereiarrus'
     OWNER_ID: str = "118034879"
+    # The most user ids a single Helix request can be about
+    MAX_HELIX_IDS: int = 100
+    # For how long (in seconds) a random complement is still worth sending, if chat is too busy to send it straight away
+    RANDOM_COMPLEMENT_TIMEOUT: float = 10.0
+    # Messages which take at least this long (in seconds) to handle get where the time went logged; None traces nothing
+    SLOW_MESSAGE_THRESHOLD: Optional[float] = (None if SLOW_MESSAGE_THRESHOLD_MS is None
+                                               else float(SLOW_MESSAGE_THRESHOLD_MS) / 1000)
 
     def __init__(self) -> None:
         super().__init__(
@@ -86,9 +90,195 @@ class ComplementsBot(commands.Bot):
             for line in complements_file:
                 self.complements_list.append(line.strip())
 
+        # Coalesces and caches the username <-> user id lookups that nearly every message and command needs
+        self.user_resolver: UserResolver = UserResolver(self.fetch_users)
+        # How many chat messages each stage of the random complement decision dropped ('complemented' for those that
+        #  made it through every stage)
+        self.message_stage_counts: Counter[str] = Counter()
+        # Each channel's complements, merged into one tuple, along with the complements version they were built from
+        self.complement_pools: Dict[str, Tuple[int, Tuple[str, ...]]] = {}
+        # For channels which shuffle their complements: the order in which the channel's pool is being gone through
+        self.shuffle_bags: Dict[str, Tuple[Optional[int], ShuffleBag]] = {}
+        # Complements drawn in advance for each channel, so that complementing someone is only a matter of taking one
+        self.complement_streams: Dict[str, ComplementStream] = {}
+        # Everything sent to chat goes through here, so that the bot never goes over Twitch's rate limits
+        self.send_queue: SendQueue = SendQueue(int(TWITCH_MESSAGE_LIMIT or 20),
+                                               float(COMPLEMENT_BATCH_WINDOW_MS or 0) / 1000)
+        # Reconnects and rejoins whatever is lost, so that the bot never has to be restarted to get back into chat
+        self.connection_supervisor: ConnectionSupervisor = ConnectionSupervisor(self)
+        # Every channel is joined through here, so that the bot never goes over Twitch's join rate limit
+        self.join_scheduler: JoinScheduler = JoinScheduler(self.join_channels, int(TWITCH_JOIN_LIMIT or 20),
+                                                           self.connection_supervisor.gave_up)
+        # Checks the stored usernames of the joined channels against Twitch, after startup
+        self.channel_verification: Optional[asyncio.Task] = None
+        self.register_metrics()
+
+    def register_metrics(self) -> None:
+        """
+        Exports the bot's own counters (messages seen, the send queue) alongside the other metrics
+        """
+        metrics.REGISTRY.register(metrics.Collected(
+                "complements_bot_messages_total",
+                "How many chat messages each stage of the random complement decision dropped",
+                "counter",
+                lambda: (({"stage": stage}, count) for stage, count in self.message_stage_counts.items())))
+        metrics.REGISTRY.register(metrics.Collected(
+                "complements_bot_send_queue_depth",
+                "How many messages of each priority are waiting to be sent",
+                "gauge",
+                lambda: (({"priority": priority}, depth) for priority, depth in self.send_queue.depth().items())))
+        metrics.REGISTRY.register(metrics.Collected(
+                "complements_bot_sent_messages_total",
+                "How many messages of each priority were sent, dropped, or joined onto another",
+                "counter",
+                lambda: (({"outcome": outcome, "priority": priority}, count)
+                         for (outcome, priority), count in self.send_queue.outcome_counts.items())))
+        metrics.REGISTRY.register(metrics.Collected(
+                "complements_bot_join_queue",
+                "How many channels are waiting to be joined ('queued') or for their join to be confirmed ('in_flight')",
+                "gauge",
+                lambda: (({"state": state}, count) for state, count in self.join_scheduler.progress().items())))
+        metrics.REGISTRY.register(metrics.Collected(
+                "complements_bot_joins_total",
+                "How many channel joins succeeded, were retried or were given up on",
+                "counter",
+                lambda: (({"outcome": outcome}, count)
+                         for outcome, count in self.join_scheduler.outcome_counts.items())))
+        metrics.REGISTRY.register(metrics.Collected(
+                "complements_bot_connection_events_total",
+                "How many times the connection to chat was replaced, channels were rejoined, or the event loop stalled",
+                "counter",
+                lambda: (({"event": event}, count)
+                         for event, count in self.connection_supervisor.outcome_counts.items())))
+
+    async def invoke(self, context: commands.Context) -> None:
+        if not context.is_valid or context.command is None:
+            await super().invoke(context)
+            return
+        with metrics.COMMAND_LATENCY.time(command=context.command.name):
+            await super().invoke(context)
+
+    async def start_services(self) -> None:
+        """
+        Connects the bot, along with anything that runs alongside it (the API)
+        """
+        await run_app_and_bot(self)
+
+    def owns_channel(self, userid: str) -> bool:  # pylint: disable=unused-argument
+        """
+        :param userid: the user id of a joined channel
+        :return: whether this bot is the one that should be in the channel; always, unless channels are split between
+            several bots
+        """
+        return True
+
+    async def serve_channel(self, userid: str, username: str) -> None:  # pylint: disable=unused-argument
+        """
+        Starts complementing in a channel which was just joined; it is joined ahead of any other channels waiting
+        :param userid: the user id of the channel
+        :param username: the channel's (current) username
+        """
+        self.connection_supervisor.wanted.add(username.lower())
+        self.join_scheduler.schedule(username, JoinPriority.REQUESTED)
+
+    async def stop_serving_channel(self, userid: str, username: str) -> None:  # pylint: disable=unused-argument
+        """
+        Stops complementing in a channel which was just left
+        :param userid: the user id of the channel
+        :param username: the channel's username, as the bot joined it
+        """
+        self.connection_supervisor.wanted.discard(username.lower())
+        self.join_scheduler.cancel(username)
+        await self.part_channels([username])
+
+    async def schedule_joins(self, channels: Dict[str, str]) -> None:
+        """
+        Queues channels to be joined straight away, then moves those which are live right now to the front of the queue
+        :param channels: the usernames of the channels to join, by user id
+        """
+        for username in channels.values():
+            self.connection_supervisor.wanted.add(username.lower())
+            self.join_scheduler.schedule(username)
+
+        userids: list[int] = [int(userid) for userid in channels]
+        try:
+            streams = await asyncio.gather(*(self.fetch_streams(user_ids=userids[i: i + ComplementsBot.MAX_HELIX_IDS])
+                                             for i in range(0, len(userids), ComplementsBot.MAX_HELIX_IDS)))
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            _BOT_LOG.warning("Could not find out which channels are live, so joining in no particular order: %s", error)
+            return
+        for stream in itertools.chain.from_iterable(streams):
+            if str(stream.user.id) in channels:
+                self.join_scheduler.schedule(channels[str(stream.user.id)], JoinPriority.LIVE)
+
+    async def verify_channel_names(self, channels: Dict[str, Optional[str]]) -> None:
+        """
+        Checks the stored usernames of channels against Twitch, MAX_HELIX_IDS at a time, moving the bot over to the new
+        username of any channel that was renamed, and joining those whose usernames were never stored
+        :param channels: the stored usernames of the channels (None if never stored), by user id
+        """
+        userids: list[str] = list(channels)
+        for i in range(0, len(userids), ComplementsBot.MAX_HELIX_IDS):
+            chunk: list[str] = userids[i: i + ComplementsBot.MAX_HELIX_IDS]
+            try:
+                found: list = await self.fetch_channels(broadcaster_ids=[int(userid) for userid in chunk])
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                _BOT_LOG.warning("Could not check the usernames of %d channels: %s", len(chunk), error)
+                continue
+            await asyncio.gather(*(self.rename_channel(str(channel.user.id), channels[str(channel.user.id)],
+                                                       channel.user.name)
+                                   for channel in found
+                                   if (channels.get(str(channel.user.id)) or "").lower() != channel.user.name.lower()))
+
+    async def rename_channel(self, userid: str, old_username: Optional[str], new_username: str) -> None:
+        """
+        Leaves a channel under its old username (if it was joined under one) and joins it under its new one
+        :param userid: the user id of the channel
+        :param old_username: the username the channel was stored (and joined) under, if any
+        :param new_username: the channel's username, according to Twitch
+        """
+        _BOT_LOG.info("Channel %s is now called %s", old_username or userid, new_username)
+        if old_username is not None:
+            await self.stop_serving_channel(userid, old_username)
+        await asyncio.gather(self.serve_channel(userid, new_username),
+                             database.set_username(new_username, userid=userid))
+
+    def is_connected(self) -> bool:
+        """
+        :return: whether the connection to chat is open
+        """
+        return self._connection.is_alive
+
+    def joined_channel_names(self) -> set[str]:
+        """
+        :return: the names of the channels the bot is in
+        """
+        return {channel.name for channel in self.connected_channels if channel is not None}
+
+    def rejoin(self, channels: list[str]) -> int:
+        """
+        :param channels: the names of channels to join again; whatever their order, the most recently active are
+            joined first
+        :return: how many of them were not already waiting to be joined
+        """
+        return sum(self.join_scheduler.schedule(channel) for channel in channels)
+
+    async def reconnect(self) -> None:
+        """
+        Closes the connection to chat, if it is still open; TwitchIO opens a new one (retrying until it can) whenever
+        its connection closes, so a connection that is already closed is left to it
+        """
+        if self._connection.is_alive:
+            await self._connection._websocket.close()  # pylint: disable=protected-access
+
+    async def close(self) -> None:
+        self.connection_supervisor.stop()
+        await super().close()
+
     def run(self):
         try:
-            task = self.loop.create_task(run_app_and_bot(self))
+            self.loop.run_until_complete(database.open_connections())
+            task = self.loop.create_task(self.start_services())
             self.loop.run_until_complete(task)
             self.loop.run_forever()
         except KeyboardInterrupt:
@@ -96,48 +286,108 @@ class ComplementsBot(commands.Bot):
         finally:
             if not self._closing.is_set():
                 self.loop.run_until_complete(self.close())
+            self.loop.run_until_complete(database.close_connections())
 
             self.loop.close()
 
+    @tracing.traced("name_to_id")
     async def name_to_id(self, username: str) -> Optional[str]:
         """
         :param username: the username of the user whose user id we want
         :return: the user id of the specified user, if the user exists; otherwise 'None'
         """
-        res = await self.fetch_users(names=[username])
-        if len(res) > 0:
-            return str(res[0].id)
-        return None
+        return await self.user_resolver.name_to_id(username)
 
+    @tracing.traced("id_to_name")
     async def id_to_name(self, uid: str) -> Optional[str]:
         """
         :param uid: the user id of the user whose username we want
         :return: the username of the specified user, if the user exists; otherwise 'None'
         """
-        res = await self.fetch_users(ids=[int(uid)])
-        if len(res) > 0:
-            return res[0].name
-        return None
+        return await self.user_resolver.id_to_name(uid)
+
+    async def author_id(self, message: Message) -> Optional[str]:
+        """
+        :param message: a message sent in chat
+        :return: the user id of the message's sender; taken from the message's tags, so that no request is needed,
+            unless they are missing (in which case it is looked up at most once per message)
+        """
+        userid: Optional[str] = (message.tags or {}).get("user-id")
+        if userid:
+            self.user_resolver.remember(str(userid), message.author.name)
+            return str(userid)
+        return await message_context.memoized(message, "author_id", lambda: self.name_to_id(message.author.name))
+
+    async def channel_id(self, message: Message) -> Optional[str]:
+        """
+        :param message: a message sent in chat
+        :return: the user id of the channel the message was sent in; taken from the message's tags, so that no request
+            is needed, unless they are missing (in which case it is looked up at most once per message)
+        """
+        room_id: Optional[str] = (message.tags or {}).get("room-id")
+        if room_id:
+            self.user_resolver.remember(str(room_id), message.channel.name)
+            return str(room_id)
+        return await message_context.memoized(message, "channel_id", lambda: self.name_to_id(message.channel.name))
+
+    async def channel_settings(self, message: Message, userid: Optional[str] = None) -> database.ChannelSettings:
+        """
+        :param message: the message being handled
+        :param userid: the user id of the channel whose settings we want; if None, the channel the message was sent in
+        :return: the channel's settings, read at most once per message
+        """
+        channel: str = userid or str(await self.channel_id(message))
+        return await message_context.memoized(message, f"settings:{channel}",
+                                              lambda: database.get_channel_settings(userid=channel))
+
+    async def is_author_ignored(self, message: Message) -> bool:
+        """
+        :param message: the message being handled
+        :return: whether the message's sender is ignored by the bot, looked up at most once per message
+        """
+        userid: Optional[str] = await self.author_id(message)
+        return await message_context.memoized(message, "author_ignored",
+                                              lambda: database.is_user_ignored(userid=userid))
 
     async def event_ready(self) -> None:
         """
-        Called once when the bot goes online; purely informational
+        Called whenever the bot connects to chat; everything is loaded and every channel looked up the first time, and
+        after that only the channels are joined again
         """
 
-        joined_channels: list[int] = list(map(int, await database.get_joined_channels()))
-        # joined_channels = [118034879, 845759020]
-        max_num_user_reqs: int = 100
-        awaitables: Awaitables = Awaitables([])
-        chunks = [joined_channels[i: i + max_num_user_reqs] for i in range(0, len(joined_channels), max_num_user_reqs)]
-        for chunk in chunks:
-            awaitables.add_task(self.fetch_channels(broadcaster_ids=chunk))
+        if self.connection_supervisor.is_running:
+            self.connection_supervisor.connected()
+            _BOT_LOG.info("%s is back online!", self.nick)
+            return
 
-        channels: list = list(itertools.chain.from_iterable(await awaitables.gather()))
-        channel_names: list[str] = list(map(lambda x: x.user.name, channels))
-        await asyncio.gather(self.join_channels(channel_names),
+        database.start_settings_cache()
+        database.start_ignored_index()
+        database.start_joined_index()
+        # Joining starts straight away, under the usernames stored when the channels were joined; checking them against
+        #  Twitch (and joining the channels with no username stored) is left to the background
+        channels: Dict[str, Optional[str]] = {userid: username for userid, username
+                                              in (await database.get_joined_channel_usernames()).items()
+                                              if self.owns_channel(userid)}
+        self.channel_verification = asyncio.ensure_future(self.verify_channel_names(channels))
+        await asyncio.gather(self.schedule_joins({userid: username for userid, username in channels.items()
+                                                  if username is not None}),
                              database.join_channel(username=self.nick, name_to_id=self.name_to_id))
 
-        custom_log(f"{self.nick} is online!", ComplementsBot.SHOULD_LOG)
+        self.connection_supervisor.start()
+        _BOT_LOG.info("%s is online!", self.nick)
+
+    async def event_channel_joined(self, channel: Channel) -> None:
+        self.join_scheduler.joined(channel.name)
+
+    async def event_channel_join_failure(self, channel: str) -> None:
+        self.join_scheduler.failed(channel)
+
+    async def event_part(self, user: Chatter) -> None:
+        if user.name is not None and user.name.lower() == self.nick.lower() and user.channel is not None:
+            self.connection_supervisor.parted(user.channel.name)
+
+    async def event_raw_data(self, data: str) -> None:  # pylint: disable=unused-argument
+        self.connection_supervisor.saw_data()
 
     @staticmethod
     def is_bot(username: str) -> bool:
@@ -151,15 +401,17 @@ class ComplementsBot(commands.Bot):
                 username in ("streamlabs", "streamelements"))
 
     async def event_message(self, message: Message) -> None:
-        to_send = await self.event_message_h(message)
-        if to_send:
-            await message.channel.send(to_send)
-            custom_log(
-                    f"In channel {message.channel.name} at {message.timestamp}, {message.author.name} "
-                    f"was complemented (randomly) with: {to_send}",
-                    ComplementsBot.SHOULD_LOG
-            )
-
+        self.join_scheduler.note_activity(message.channel.name)
+        with tracing.trace("event_message", ComplementsBot.SLOW_MESSAGE_THRESHOLD,
+                           channel=message.channel.name, user=message.author.name if message.author else None), \
+                message_context.handling(message):
+            to_send = await self.event_message_h(message)
+            if to_send and await self.send_complement(message, to_send, Priority.RANDOM_COMPLEMENT):
+                _COMPLEMENTS_LOG.info("%s was complemented (randomly) with: %s", message.author.name, to_send,
+                                      extra={"channel": message.channel.name, "user": message.author.name,
+                                             "kind": "random"})
+
+    @tracing.traced("event_message_h")
     async def event_message_h(self, message: Message) -> Optional[str]:
         """
         Runs every time a message is sent in chat. This also includes any commands.
@@ -170,115 +422,180 @@ class ComplementsBot(commands.Bot):
 
         if message.echo:
             # make sure the bot ignores itself
+            self.message_stage_counts["echo"] += 1
             return None
-        custom_log(
-                f"In channel {message.channel.name} at {message.timestamp} {message.author.name} said: {message.content}",
-                ComplementsBot.SHOULD_LOG
-        )
-
-        sender_id: Optional[str]
-        channel_id: Optional[str]
-        sender_id, channel_id = await asyncio.gather(
-                self.name_to_id(message.author.name),
-                self.name_to_id(message.channel.name)
-        )
-        assert sender_id
-        assert channel_id
-        sender_id, channel_id = str(sender_id), str(channel_id)
-
-        sender: str = message.author.name
-        awaitables: Awaitables = Awaitables([
-            database.is_user_ignored(userid=sender_id),
-            database.get_complement_chance(userid=channel_id),
-            database.is_ignoring_bots(userid=channel_id),
-            database.get_random_complement_enabled(userid=channel_id)
-        ])
-        is_author_ignored: bool
-        chance: float
-        is_ignoring_bots: bool
-        random_complements_enabled: bool
+        _CHAT_LOG.info("%s said: %s", message.author.name, message.content,
+                       extra={"channel": message.channel.name, "user": message.author.name})
 
+        awaitables: Awaitables = Awaitables([self.random_complement(message)])
         if message.content[:len(ComplementsBot.CMD_PREFIX)] == ComplementsBot.CMD_PREFIX:
             # Handle commands
-            awaitables.add_task(self.handle_commands(message))
-            is_author_ignored, chance, is_ignoring_bots, random_complements_enabled, _ = await awaitables.gather()
-        else:
-            is_author_ignored, chance, is_ignoring_bots, random_complements_enabled = await awaitables.gather()
-        should_rng_choose: bool = (100 - chance) <= 100 * random.random() < 100
-        is_author_bot: bool = is_ignoring_bots and ComplementsBot.is_bot(sender)
+            awaitables.add_task(tracing.traced("handle_commands")(self.handle_commands)(message))
+        comp_msg: Optional[str] = (await awaitables.gather())[0]
+        return comp_msg
+
+    @tracing.traced("random_complement")
+    async def random_complement(self, message: Message) -> Optional[str]:
+        """
+        Decides whether to complement the sender of a message, in stages ordered from cheapest to most expensive, so
+            that most messages are dropped before anything has to be loaded: the chance roll (on the channel's cached
+            settings), whether the sender is a bot, whether random complements are enabled, whether the sender is
+            ignored, and finally whether there is any complement to send. Counts how many messages each stage drops.
+        :return: the complement to send, if the sender should be complemented
+        """
+
+        settings: database.ChannelSettings = await self.channel_settings(message)
 
         comp_msg: Optional[str] = None
-        if (should_rng_choose
-                and (not is_author_ignored)
-                and (not is_author_bot)
-                and random_complements_enabled):
-            random_complements_muted: bool = await database.are_random_complements_muted(userid=channel_id)
-            comp_msg, complement_exists = await self.complement_msg(
+        drop_stage: Optional[str] = None
+        if not (100 - settings.complement_chance) <= 100 * random.random() < 100:
+            drop_stage = "chance"
+        elif settings.should_ignore_bots and ComplementsBot.is_bot(message.author.name):
+            drop_stage = "bot"
+        elif not settings.random_complement_enabled:
+            drop_stage = "disabled"
+        elif await self.is_author_ignored(message):
+            drop_stage = "ignored"
+        else:
+            comp_msg, complement_exists = self.complement_msg(
                     message.author.name,
-                    message.channel.name,
-                    random_complements_muted
+                    settings,
+                    settings.random_complement_muted
             )
-            comp_msg = None if not complement_exists else comp_msg
+            if not complement_exists:
+                comp_msg, drop_stage = None, "no_complements"
+
+        self.message_stage_counts[drop_stage or "complemented"] += 1
         return comp_msg
 
-    async def choose_complement(self, channel: str) -> Tuple[str, bool]:
+    def choose_complement(self, settings: database.ChannelSettings) -> Tuple[str, bool]:
         """
         Chooses a complement with which to complement a user. This is based on the default complements, custom
             complements, and the status of whether either of these two are enabled or disabled for that channel.
+        :param settings: the settings of the channel in which the complement will be sent
         :return complement: the chosen complement (if one exists - otherwise an empty string)
         :return exists: whether there are any valid complements (for example, if  both custom and default complements
             are disabled, this would be False)
         """
 
-        custom_complements: list[str] = []
-        custom_complements_enabled: bool
-        default_complements_enabled: bool
-        channel_id: str = str(await self.name_to_id(channel))
-        custom_complements_enabled, default_complements_enabled = \
-            await asyncio.gather(database.are_custom_complements_enabled(userid=channel_id),
-                                 database.are_default_complements_enabled(userid=channel_id))
+        with tracing.span("choose_complement"):
+            pool: Tuple[str, ...] = self.complement_pool(settings)
+            if len(pool) == 0:
+                # No complements to dish out
+                return "", False
+            if not settings.shuffle_complements:
+                return pool[random.randrange(len(pool))], True
 
-        if custom_complements_enabled:
-            custom_complements = await database.get_custom_complements(userid=channel_id)
-        default_complements: list[str] = []
-        if default_complements_enabled:
-            default_complements = self.complements_list
+            bagged: Optional[Tuple[Optional[int], ShuffleBag]] = self.shuffle_bags.get(settings.userid)
+            if bagged is None or bagged[0] != settings.complements_version or bagged[1].size != len(pool):
+                # The pool changed since the bag was made, so start a new one
+                bagged = (settings.complements_version, ShuffleBag(len(pool)))
+                self.shuffle_bags[settings.userid] = bagged
+            return pool[bagged[1].draw()], True
 
-        if len(custom_complements) == 0 and len(default_complements) == 0:
-            # No complements to dish out
-            return "", False
+    def complement_pool(self, settings: database.ChannelSettings) -> Tuple[str, ...]:
+        """
+        :param settings: the settings of the channel in which the complement will be sent
+        :return: every complement the channel may be sent (default and custom, depending on which are enabled); only
+            rebuilt when the channel's complements version changes
+        """
+
+        pooled: Optional[Tuple[int, Tuple[str, ...]]] = self.complement_pools.get(settings.userid)
+        if pooled is not None and pooled[0] == settings.complements_version:
+            return pooled[1]
+
+        pool: Tuple[str, ...] = ((tuple(self.complements_list) if settings.default_complements_enabled else ())
+                                 + (settings.custom_complements if settings.custom_complements_enabled else ()))
+        if settings.complements_version is not None:
+            self.complement_pools[settings.userid] = (settings.complements_version, pool)
+        return pool
+
+    def next_complement(self, settings: database.ChannelSettings) -> Tuple[str, bool]:
+        """
+        Takes the next complement from the channel's stream of complements drawn in advance, only drawing one on the
+            spot if none is ready
+        :param settings: the settings of the channel in which the complement will be sent
+        :return complement: the chosen complement (if one exists - otherwise an empty string)
+        :return exists: whether there are any valid complements
+        """
 
-        default_complements_length: int = len(default_complements)
-        index: int = random.randint(0, default_complements_length + len(custom_complements) - 1)
-        if index < default_complements_length:
-            return default_complements[index], True
-        return custom_complements[index - default_complements_length], True
+        if settings.complements_version is None:
+            # Nothing drawn in advance could be known to still be valid
+            return self.choose_complement(settings)
 
-    async def complement_msg(self, who: str, channel: str, is_tts_muted: bool = True) -> Tuple[str, bool]:
+        stream: Optional[ComplementStream] = self.complement_streams.get(settings.userid)
+        if stream is None:
+            userid: str = settings.userid
+            stream = ComplementStream(lambda count: self.draw_complements(userid, count))
+            self.complement_streams[userid] = stream
+        complement: Optional[str] = stream.pop(settings.complements_version)
+        if complement is None:
+            return self.choose_complement(settings)
+        return complement, True
+
+    async def draw_complements(self, channel_id: str, count: int) -> Tuple[Optional[int], list[str]]:
+        """
+        :param channel_id: the user id of the channel to draw complements for
+        :param count: how many complements to draw
+        :return: the channel's complements version, and the complements drawn (none if the channel has none)
+        """
+
+        settings: database.ChannelSettings = await database.get_channel_settings(userid=channel_id)
+        drawn: list[str] = []
+        for _ in range(count):
+            complement, complement_exists = self.choose_complement(settings)
+            if not complement_exists:
+                break
+            drawn.append(complement)
+        return settings.complements_version, drawn
+
+    def complement_msg(self, who: str, settings: database.ChannelSettings, is_tts_muted: bool = True) -> Tuple[str, bool]:
         """
         Format the complement message correctly. This includes any TTS mute prefixes and an '@' in front of the user's
             name if not included to notify them of the complement.
         :param who: the name of the person that the complement is aimed at
-        :param channel: the channel name where the message was sent
+        :param settings: the settings of the channel where the message was sent
         :param is_tts_muted: whether the channel mutes TTS for this complement
         :return complement: the complement chosen, prepended with who it's aimed at and perhaps a TTS muting symbol
         :return complement_exists: whether there are any valid complements (for example, if  both custom and default
             complements are disabled, this would be False)
         """
 
-        prefix: str = "@"
+        with tracing.span("complement_msg"):
+            complement: str
+            complement_exists: bool
+            complement, complement_exists = self.next_complement(settings)
+            return f"{ComplementsBot.mute_prefix(settings, is_tts_muted)}@{who} {complement}", complement_exists
 
-        awaitables: Awaitables = Awaitables([self.choose_complement(channel)])
-        complement: str
-        complement_exists: bool
-        if is_tts_muted:
-            tts_mute_prefix: str
-            awaitables.add_task(database.get_tts_mute_prefix(channel, name_to_id=self.name_to_id))
-            (complement, complement_exists), tts_mute_prefix = await awaitables.gather()
-            prefix = f"{tts_mute_prefix} {prefix}"
-        else:
-            complement, complement_exists = (await awaitables.gather())[0]
-        return f"{prefix}{who} {complement}", complement_exists
+    @staticmethod
+    def mute_prefix(settings: database.ChannelSettings, is_tts_muted: bool) -> str:
+        """
+        :param settings: the settings of the channel where the complement will be sent
+        :param is_tts_muted: whether the channel mutes TTS for this complement
+        :return: what goes in front of the complement to mute TTS (nothing if it is not muted)
+        """
+        return f"{settings.tts_mute_prefix} " if is_tts_muted else ""
+
+    async def send_complement(self, message: Message, comp_msg: str, priority: Priority) -> bool:
+        """
+        Sends a complement to the channel the message was sent in; if complements are being batched, it may be joined
+            with other complements sent to the channel at about the same time, with the mute prefix (if any) only at the
+            start of the joined message
+        :param message: the message which led to the complement
+        :param comp_msg: the complement, as formatted by 'complement_msg'
+        :param priority: Priority.RANDOM_COMPLEMENT for random complements (which are dropped if they cannot be sent
+            soon enough), Priority.COMMAND_REPLY for those asked for with a command
+        :return: whether the complement was sent
+        """
+
+        settings: database.ChannelSettings = await self.channel_settings(message)
+        if priority is Priority.RANDOM_COMPLEMENT:
+            return await self.send_queue.send(message.channel, comp_msg, priority,
+                                              ComplementsBot.RANDOM_COMPLEMENT_TIMEOUT,
+                                              ComplementsBot.mute_prefix(settings, settings.random_complement_muted))
+        return await self.send_queue.send(message.channel, comp_msg, priority,
+                                          join_prefix=ComplementsBot.mute_prefix(settings,
+                                                                                 settings.command_complement_muted))
 
     @commands.command()
     async def complement(self, ctx: commands.Context) -> None:
@@ -290,14 +607,12 @@ class ComplementsBot(commands.Bot):
             behaviour of the command.
         """
         to_send = await self.complement_h(ctx)
-        if to_send:
-            await ctx.channel.send(to_send)
-            custom_log(
-                    f"In {ctx.channel.name} at {ctx.message.timestamp}, {ctx.message.author.name} "
-                    f"was complemented (by command) with: {to_send}",
-                    ComplementsBot.SHOULD_LOG
-            )
+        if to_send and await self.send_complement(ctx.message, to_send, Priority.COMMAND_REPLY):
+            _COMPLEMENTS_LOG.info("%s was complemented (by command) with: %s", ctx.message.author.name, to_send,
+                                  extra={"channel": ctx.channel.name, "user": ctx.message.author.name,
+                                         "kind": "command"})
 
+    @tracing.traced("complement_h")
     async def complement_h(self, ctx: commands.Context) -> Optional[str]:
         """
         helper for complement()
@@ -310,32 +625,17 @@ class ComplementsBot(commands.Bot):
         else:
             who = ctx.message.author.name
 
-        sender_id_raw: Optional[str]
-        channel_id_raw: Optional[str]
-        sender_id_raw, channel_id_raw = await asyncio.gather(self.name_to_id(ctx.author.name),
-                                                             self.name_to_id(ctx.channel.name))
-        assert sender_id_raw
-        assert channel_id_raw
-        sender_id: str
-        channel_id: str
-        sender_id, channel_id = str(sender_id_raw), str(channel_id_raw)
-
-        awaitables: Awaitables = Awaitables([database.is_user_ignored(userid=sender_id),
-                                             database.get_cmd_complement_enabled(userid=channel_id)])
+        awaitables: Awaitables = Awaitables([self.is_author_ignored(ctx.message), self.channel_settings(ctx.message)])
         is_user_ignored: bool
-        cmd_complement_enabled: bool
-        is_user_ignored, cmd_complement_enabled = await awaitables.gather()
+        settings: database.ChannelSettings
+        is_user_ignored, settings = await awaitables.gather()
 
-        if is_user_ignored or (not cmd_complement_enabled and not self.is_by_broadcaster_or_mod(ctx)):
+        if is_user_ignored or (not settings.command_complement_enabled and not self.is_by_broadcaster_or_mod(ctx)):
             return None
 
         comp_msg: Optional[str]
         complement_exists: bool
-        comp_msg, complement_exists = await self.complement_msg(
-                who,
-                ctx.channel.name,
-                await database.is_cmd_complement_muted(userid=channel_id)
-        )
+        comp_msg, complement_exists = self.complement_msg(who, settings, settings.command_complement_muted)
         if complement_exists:
             comp_msg = None if not complement_exists else comp_msg
         return comp_msg
@@ -347,17 +647,16 @@ class ComplementsBot(commands.Bot):
         complement using the 'complement' command will work.
         """
 
-        userid: str = str(await self.name_to_id(ctx.author.name))
+        userid: str = str(await self.author_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 lambda x: True,
                 None,
-                ComplementsBot.DoIfElse((lambda _: database.is_user_ignored(userid=userid)),
+                ComplementsBot.DoIfElse((lambda _: database.unignore(userid=userid)),
                                         None,
                                         None,
-                                        (lambda _: database.unignore(userid=userid)),
-                                        None)
+                                        is_check_mutating=True)
         )
 
     @commands.command()
@@ -366,17 +665,16 @@ class ComplementsBot(commands.Bot):
         The user of this command will not get any complements sent their way from ComplementsBot
         """
 
-        userid: str = str(await self.name_to_id(ctx.author.name))
+        userid: str = str(await self.author_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 lambda x: True,
                 None,
-                ComplementsBot.DoIfElse((lambda _: database.is_user_ignored(userid=userid)),
-                                        None,
+                ComplementsBot.DoIfElse((lambda _: database.ignore(userid=userid)),
                                         None,
                                         None,
-                                        (lambda _: database.ignore(userid=userid)))
+                                        is_check_mutating=True)
         )
 
     # -------------------- bot channel only commands --------------------
@@ -386,7 +684,7 @@ class ComplementsBot(commands.Bot):
         Checks if the context was created in the bot's channel (or the creator's)
         """
 
-        return await self.name_to_id(ctx.channel.name) in (str(self.user_id), ComplementsBot.OWNER_ID)
+        return await self.channel_id(ctx.message) in (str(self.user_id), ComplementsBot.OWNER_ID)
 
     @staticmethod
     async def send_and_log(ctx: commands.Context, msg: Optional[str]) -> None:
@@ -397,8 +695,9 @@ class ComplementsBot(commands.Bot):
         if msg is None:
             return
 
-        await ctx.channel.send(msg)
-        custom_log(msg, ComplementsBot.SHOULD_LOG)
+        bot: ComplementsBot = cast(ComplementsBot, ctx.bot)
+        if await bot.send_queue.send(ctx.channel, msg, Priority.COMMAND_REPLY):
+            _COMMANDS_LOG.info("%s", msg, extra={"channel": ctx.channel.name, "user": ctx.author.name})
 
     class DoIfElse:
         """
@@ -419,7 +718,9 @@ class ComplementsBot(commands.Bot):
                      do_false: Optional[Union[
                          Callable[[commands.Context], Awaitable[None]],
                          Callable[[commands.Context], None]
-                     ]] = None) -> None:
+                     ]] = None,
+                     *,
+                     is_check_mutating: bool = False) -> None:
             """
             :param if_check: what the condition for entering 'if' statement is
             :param do_true: what to do when the if_check succeeds (done before sending message to chat);
@@ -431,6 +732,8 @@ class ComplementsBot(commands.Bot):
                 if 'None', does nothing
             :param false_msg: what to send to chat when the if_check fails; any occurrence of complements_bot.F_USER
                 in the string is replaced with the name of the user in chat who called the original command
+            :param is_check_mutating: whether if_check itself makes the change (e.g. an atomic toggle which returns
+                the old value); if so, it is only run once the permission check has passed, rather than alongside it
             """
 
             self.if_check: Union[Callable[[commands.Context], Awaitable[bool]], Callable[[commands.Context], bool]] \
@@ -444,8 +747,30 @@ class ComplementsBot(commands.Bot):
             self.do_false: Union[Callable[[commands.Context], None], Callable[
                 [commands.Context], Awaitable[None]]] = do_false or (
                 lambda _: None)
+            self.is_check_mutating: bool = is_check_mutating
 
     @staticmethod
+    async def permitted_if_check(ctx: commands.Context,
+                                 permission_check_task: asyncio.Task,
+                                 do_if_else: DoIfElse) -> Optional[bool]:
+        """
+        :param ctx: context from the original call
+        :param permission_check_task: the (already started) check of whether the command may be run
+        :param do_if_else: holds the if_check to run
+        :return: the result of the if_check, or 'None' if the permission check failed; a check which does not change
+            anything is run alongside the permission check, while one which does is only run after it has passed
+        """
+        if do_if_else.is_check_mutating:
+            if not await permission_check_task:
+                return None
+            return bool(await run_with_appropriate_awaiting(do_if_else.if_check, ctx))
+
+        permission_check_res, if_check_res = await asyncio.gather(permission_check_task,
+                                                                  run_with_appropriate_awaiting(do_if_else.if_check, ctx))
+        return bool(if_check_res) if permission_check_res else None
+
+    @staticmethod
+    @tracing.traced("cmd_body")
     async def cmd_body(ctx: commands.Context,
                        permission_check: Union[
                            Callable[[commands.Context], bool], Callable[[commands.Context], Awaitable[bool]]],
@@ -473,9 +798,8 @@ class ComplementsBot(commands.Bot):
         permission_check_task: asyncio.Task = asyncio.create_task(run_with_appropriate_awaiting(permission_check, ctx))
 
         if do_if_else is not None:
-            permission_check_res, if_check_res = await asyncio.gather(permission_check_task,
-                                                                      run_with_appropriate_awaiting(do_if_else.if_check, ctx))
-            if not permission_check_res:
+            if_check_res: Optional[bool] = await ComplementsBot.permitted_if_check(ctx, permission_check_task, do_if_else)
+            if if_check_res is None:
                 return False
 
             to_send: Optional[str] = None
@@ -507,26 +831,27 @@ class ComplementsBot(commands.Bot):
         Also used to reset channel name if streamer changed their username
         """
 
-        raw_userid: Optional[str] = str(await self.name_to_id(ctx.author.name))
+        raw_userid: Optional[str] = str(await self.author_id(ctx.message))
         assert raw_userid
         userid: str = str(raw_userid)
-        old_username: Optional[str] = await database.get_username(userid=userid)
+        # Everything the command needs to know about the channel, in one read
+        settings: database.ChannelSettings = await self.channel_settings(ctx.message, userid)
 
         async def do_false(ctx: commands.Context) -> None:
-            # Have to save to database and update in memory so bot starts working straight away
+            # Have to save to database and update in memory so bot starts working straight away;
+            #  either database call below writes everything it changes in a single update
 
-            awaitables: Awaitables = Awaitables([])
-            if not await database.is_channel_joined(userid=userid):
+            awaitables: Awaitables = Awaitables([self.serve_channel(userid, ctx.author.name)])
+            if not settings.is_joined:
                 awaitables.add_task(database.join_channel(userid=userid, username=ctx.author.name))
-            elif ctx.author.name != old_username:
-                awaitables.add_task(self.part_channels([old_username]))
+            elif ctx.author.name != settings.username:
+                if settings.username is not None:
+                    awaitables.add_task(self.stop_serving_channel(userid, settings.username))
                 awaitables.add_task(database.set_username(ctx.author.name, userid=userid))
-            awaitables.add_task(self.join_channels([ctx.author.name]))
             await awaitables.gather()
 
         async def if_check(ctx: commands.Context) -> bool:
-            return (await database.is_channel_joined(userid=userid)
-                    and ctx.author.name == old_username)
+            return settings.is_joined and ctx.author.name == settings.username
 
         await ComplementsBot.cmd_body(
                 ctx,
@@ -546,12 +871,12 @@ class ComplementsBot(commands.Bot):
         Bot leaves the user's channel and no longer complements chatters there.
         """
 
-        userid: str = str(await self.name_to_id(ctx.author.name))
+        userid: str = str(await self.author_id(ctx.message))
 
         async def do_true(ctx: commands.Context) -> None:
             # Update database and in realtime for "instant" effect
             awaitables: Awaitables = Awaitables([database.leave_channel(userid=userid),
-                                                 self.part_channels([ctx.author.name])])
+                                                 self.stop_serving_channel(userid, ctx.author.name)])
             await awaitables.gather()
 
         await ComplementsBot.cmd_body(
@@ -576,12 +901,12 @@ class ComplementsBot(commands.Bot):
         Same as the 'leaveme' command, but on top, also delete any records of the user (e.g. custom complements)
         """
 
-        userid: str = str(await self.name_to_id(ctx.author.name))
+        userid: str = str(await self.author_id(ctx.message))
 
         async def do_true(ctx: commands.Context) -> None:
             # Remove any user records from database and leave their channel NOW
             awaitables: Awaitables = Awaitables([database.delete_channel(userid=userid),
-                                                 self.part_channels([ctx.author.name])])
+                                                 self.stop_serving_channel(userid, ctx.author.name)])
             await awaitables.gather()
 
         await ComplementsBot.cmd_body(
@@ -606,18 +931,17 @@ class ComplementsBot(commands.Bot):
         The user of this command will not get any complements sent their way from ComplementsBot
         """
 
-        userid: str = str(await self.name_to_id(ctx.author.name))
+        userid: str = str(await self.author_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_in_bot_channel,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.is_user_ignored(userid=userid)),
+                        (lambda _: database.ignore(userid=userid)),
                         f"@{ComplementsBot.F_USER} I am already ignoring you.",
                         f"@{ComplementsBot.F_USER} I am now ignoring you.",
-                        None,
-                        (lambda _: database.ignore(userid=userid))
+                        is_check_mutating=True
                 )
         )
 
@@ -628,7 +952,7 @@ class ComplementsBot(commands.Bot):
         """
 
         userid: Optional[str] = await self.name_to_id(self.isolate_args(ctx.message.content))
-        userid = userid or (await self.name_to_id(ctx.author.name))
+        userid = userid or (await self.author_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
@@ -661,18 +985,17 @@ class ComplementsBot(commands.Bot):
         complement using the 'complement' command will work.
         """
 
-        userid: str = str(await self.name_to_id(ctx.author.name))
+        userid: str = str(await self.author_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_in_bot_channel,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.is_user_ignored(userid=userid)),
+                        (lambda _: database.unignore(userid=userid)),
                         f"@{ComplementsBot.F_USER} I am no longer ignoring you!",
                         f"@{ComplementsBot.F_USER} I am not ignoring you!",
-                        (lambda _: database.unignore(userid=userid)),
-                        None
+                        is_check_mutating=True
                 )
         )
 
@@ -753,7 +1076,7 @@ class ComplementsBot(commands.Bot):
             return to_send
 
         assert chance
-        await database.set_complement_chance(chance, channel, name_to_id=self.name_to_id)
+        await database.set_complement_chance(chance, userid=await self.channel_id(ctx.message))
         return f"@{channel} complement chance set to {chance}!"
 
     @commands.command(aliases=[
@@ -770,19 +1093,18 @@ class ComplementsBot(commands.Bot):
         Prevent chatter from being able to use the !complement command in user's channel
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.get_cmd_complement_enabled(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.COMMAND_COMPLEMENT_ENABLED, False)),
                         f"@{ComplementsBot.F_USER} your viewers will no longer be able to make use of the "
                         f"!complement command.",
                         f"@{ComplementsBot.F_USER} your viewers already cannot make use of the !complement command.",
-                        (lambda _: database.set_cmd_complement_enabled(False, userid=userid)),
-                        None
+                        is_check_mutating=True
                 )
         )
 
@@ -792,19 +1114,18 @@ class ComplementsBot(commands.Bot):
         Allow chatters in user's chat to use the !complement command
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.get_cmd_complement_enabled(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.COMMAND_COMPLEMENT_ENABLED, True)),
                         f"@{ComplementsBot.F_USER} your viewers can already make use of the !complement command!",
 
                         f"@{ComplementsBot.F_USER} your viewers will now be able to make use of the !complement command!",
-                        None,
-                        (lambda _: database.set_cmd_complement_enabled(True, userid=userid))
+                        is_check_mutating=True
                 )
         )
 
@@ -814,18 +1135,17 @@ class ComplementsBot(commands.Bot):
         Prevent the bot from randomly complementing chatters in user's chat
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.get_random_complement_enabled(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.RANDOM_COMPLEMENT_ENABLED, False)),
                         f"@{ComplementsBot.F_USER} your viewers will no longer randomly receive complements.",
                         f"@{ComplementsBot.F_USER} your viewers already do not randomly receive complements.",
-                        (lambda _: database.set_random_complement_enabled(False, userid=userid)),
-                        None
+                        is_check_mutating=True
                 )
         )
 
@@ -835,18 +1155,17 @@ class ComplementsBot(commands.Bot):
         Allow the bot to randomly complement chatters in user's chat
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.get_random_complement_enabled(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.RANDOM_COMPLEMENT_ENABLED, True)),
                         f"@{ComplementsBot.F_USER} I already randomly send out complements!",
                         f"@{ComplementsBot.F_USER} your viewers will now randomly receive complements!",
-                        None,
-                        (lambda _: database.set_random_complement_enabled(True, userid=userid))
+                        is_check_mutating=True
                 )
         )
 
@@ -873,7 +1192,7 @@ class ComplementsBot(commands.Bot):
             return f"@{user} complement is too long. It may not be over " \
                    f"{ComplementsBot.MAX_COMPLEMENT_LENGTH} characters long."
 
-        await database.add_complement(complement, user, name_to_id=self.name_to_id)
+        await database.add_complement(complement, userid=await self.channel_id(ctx.message))
         return f"@{user} new complement added: '{complement}'"
 
     @commands.command(aliases=["listcomps"])
@@ -895,7 +1214,8 @@ class ComplementsBot(commands.Bot):
             return []
 
         user: str = ctx.channel.name
-        custom_complements: list[str] = await database.get_custom_complements(user, name_to_id=self.name_to_id)
+        custom_complements: list[str] = await database.get_custom_complements(
+                userid=await self.channel_id(ctx.message))
         comps_msg: str = '"' + '", "'.join(custom_complements) + '"'
 
         msgs: list[str] = textwrap.wrap(f"@{user} complements: {comps_msg}", ComplementsBot.DEFAULT_MAX_MSG_LEN)
@@ -932,7 +1252,7 @@ class ComplementsBot(commands.Bot):
         to_remove_comps: list[str]
         to_keep_comps: list[str]
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
         to_remove_comps, to_keep_comps = database.complements_to_remove(
                 await database.get_custom_complements(userid=userid),
                 phrase
@@ -955,10 +1275,13 @@ class ComplementsBot(commands.Bot):
         Remove all custom complements a user has added
         """
 
+        async def do_always(ctx: commands.Context) -> None:
+            await database.remove_all_complements(userid=await self.channel_id(ctx.message))
+
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
-                (lambda ctx: database.remove_all_complements(ctx.channel.name, name_to_id=self.name_to_id)),
+                do_always,
                 None,
                 f"@{ComplementsBot.F_USER} all of your custom complements have been removed."
         )
@@ -981,7 +1304,7 @@ class ComplementsBot(commands.Bot):
         msg: str = ctx.message.content
         msg = msg.strip()
         prefix: str = msg[msg.find(" ") + 1:]
-        await database.set_tts_mute_prefix(prefix, ctx.channel.name, name_to_id=self.name_to_id)
+        await database.set_tts_mute_prefix(prefix, userid=await self.channel_id(ctx.message))
         return f"@{ctx.author.name} mute TTS prefix changed to '{prefix}'."
 
     @commands.command(aliases=["mutecommandcomplement", "mutecommandcomp", "mutecmdcomp"])
@@ -990,18 +1313,17 @@ class ComplementsBot(commands.Bot):
         Mutes TTS for complements sent with !complement command
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.is_cmd_complement_muted(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.COMMAND_COMPLEMENT_MUTED, True)),
                         f"@{ComplementsBot.F_USER} command complements are already muted!",
                         f"@{ComplementsBot.F_USER} command complements are now muted.",
-                        None,
-                        (lambda _: database.set_cmd_complement_is_muted(True, userid=userid))
+                        is_check_mutating=True
                 )
         )
 
@@ -1011,18 +1333,17 @@ class ComplementsBot(commands.Bot):
         Mutes TTS for complements given out randomly
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.are_random_complements_muted(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.RANDOM_COMPLEMENT_MUTED, True)),
                         f"@{ComplementsBot.F_USER} random complements are already muted!",
                         f"@{ComplementsBot.F_USER} random complements are now muted.",
-                        None,
-                        (lambda _: database.set_random_complements_are_muted(True, userid=userid))
+                        is_check_mutating=True
                 )
         )
 
@@ -1032,18 +1353,17 @@ class ComplementsBot(commands.Bot):
         Unmutes TTS for complements sent with !complement command
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.is_cmd_complement_muted(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.COMMAND_COMPLEMENT_MUTED, False)),
                         f"@{ComplementsBot.F_USER} command complements are no longer muted!",
                         f"@{ComplementsBot.F_USER} command complements are already unmuted!",
-                        (lambda _: database.set_cmd_complement_is_muted(False, userid=userid)),
-                        None
+                        is_check_mutating=True
                 )
         )
 
@@ -1053,18 +1373,17 @@ class ComplementsBot(commands.Bot):
         Unmutes TTS for complements given out randomly
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.are_random_complements_muted(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.RANDOM_COMPLEMENT_MUTED, False)),
                         f"@{ComplementsBot.F_USER} random complements are no longer muted!",
                         f"@{ComplementsBot.F_USER} random complements are already unmuted!",
-                        (lambda _: database.set_random_complements_are_muted(False, userid=userid)),
-                        None
+                        is_check_mutating=True
                 )
         )
 
@@ -1074,18 +1393,17 @@ class ComplementsBot(commands.Bot):
         All custom complements will be added to the pool that we choose complements for chatters from
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.are_custom_complements_enabled(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.CUSTOM_COMPLEMENTS_ENABLED, True)),
                         f"@{ComplementsBot.F_USER} custom complements are already enabled!",
                         f"@{ComplementsBot.F_USER} custom complements are now enabled!",
-                        None,
-                        (lambda _: database.set_are_custom_complements_enabled(True, userid=userid))
+                        is_check_mutating=True
                 )
         )
 
@@ -1095,18 +1413,17 @@ class ComplementsBot(commands.Bot):
         All default complements will be added to the pool that we choose complements for chatters from
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.are_default_complements_enabled(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.DEFAULT_COMPLEMENTS_ENABLED, True)),
                         f"@{ComplementsBot.F_USER} default complements are already enabled!",
                         f"@{ComplementsBot.F_USER} default complements are now enabled!",
-                        None,
-                        (lambda _: database.set_are_default_complements_enabled(True, userid=userid))
+                        is_check_mutating=True
                 )
         )
 
@@ -1117,18 +1434,17 @@ class ComplementsBot(commands.Bot):
             delete the custom complements.
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.are_custom_complements_enabled(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.CUSTOM_COMPLEMENTS_ENABLED, False)),
                         f"@{ComplementsBot.F_USER} custom complements are now disabled.",
                         f"@{ComplementsBot.F_USER} custom complements are already disabled.",
-                        (lambda _: database.set_are_custom_complements_enabled(False, userid=userid)),
-                        None
+                        is_check_mutating=True
                 )
         )
 
@@ -1138,18 +1454,58 @@ class ComplementsBot(commands.Bot):
         All default complements will be removed from the pool that we choose complements for chatters from
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.are_default_complements_enabled(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.DEFAULT_COMPLEMENTS_ENABLED, False)),
                         f"@{ComplementsBot.F_USER} default complements are now disabled.",
                         f"@{ComplementsBot.F_USER} default complements are already disabled!",
-                        (lambda _: database.set_are_default_complements_enabled(False, userid=userid)),
-                        None
+                        is_check_mutating=True
+                )
+        )
+
+    @commands.command(aliases=["enableshufflecomps", "shufflecomplements", "shufflecomps"])
+    async def enableshufflecomplements(self, ctx: commands.Context) -> None:
+        """
+        Complements will be given out in a shuffled order, so that none is repeated before all others have been used
+        """
+
+        userid: str = str(await self.channel_id(ctx.message))
+
+        await ComplementsBot.cmd_body(
+                ctx,
+                self.is_by_broadcaster_or_mod,
+                None,
+                ComplementsBot.DoIfElse(
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.SHUFFLE_COMPLEMENTS, True)),
+                        f"@{ComplementsBot.F_USER} complements are already being shuffled!",
+                        f"@{ComplementsBot.F_USER} complements will now be shuffled, so none repeats until all "
+                        f"have been used!",
+                        is_check_mutating=True
+                )
+        )
+
+    @commands.command(aliases=["disableshufflecomps", "unshufflecomplements", "unshufflecomps"])
+    async def disableshufflecomplements(self, ctx: commands.Context) -> None:
+        """
+        Complements will be chosen completely at random again (undoes !enableshufflecomplements)
+        """
+
+        userid: str = str(await self.channel_id(ctx.message))
+
+        await ComplementsBot.cmd_body(
+                ctx,
+                self.is_by_broadcaster_or_mod,
+                None,
+                ComplementsBot.DoIfElse(
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.SHUFFLE_COMPLEMENTS, False)),
+                        f"@{ComplementsBot.F_USER} complements will now be chosen completely at random.",
+                        f"@{ComplementsBot.F_USER} complements are already chosen completely at random.",
+                        is_check_mutating=True
                 )
         )
 
@@ -1159,18 +1515,17 @@ class ComplementsBot(commands.Bot):
         Chatters that count as bots might be complemented by ComplementsBot
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.is_ignoring_bots(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.SHOULD_IGNORE_BOTS, False)),
                         f"@{ComplementsBot.F_USER} bots have a chance of being complemented!",
                         f"@{ComplementsBot.F_USER} bots can already get complements!",
-                        (lambda _: database.set_should_ignore_bots(False, userid=userid)),
-                        None
+                        is_check_mutating=True
                 )
         )
 
@@ -1180,18 +1535,17 @@ class ComplementsBot(commands.Bot):
         Chatters that count as bots will not be complemented by ComplementsBot
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         await ComplementsBot.cmd_body(
                 ctx,
                 self.is_by_broadcaster_or_mod,
                 None,
                 ComplementsBot.DoIfElse(
-                        (lambda _: database.is_ignoring_bots(userid=userid)),
+                        (lambda _: database.toggle_flag(userid, database.ChannelFlag.SHOULD_IGNORE_BOTS, True)),
                         f"@{ComplementsBot.F_USER} bots are already not getting complements.",
                         f"@{ComplementsBot.F_USER} bots will no longer get complemented.",
-                        None,
-                        (lambda _: database.set_should_ignore_bots(True, userid=userid))
+                        is_check_mutating=True
                 )
         )
 
@@ -1201,12 +1555,12 @@ class ComplementsBot(commands.Bot):
         Allows the user to kick ComplementsBot out of their channel from their own channel chat
         """
 
-        userid: str = str(await self.name_to_id(ctx.channel.name))
+        userid: str = str(await self.channel_id(ctx.message))
 
         async def do_true(ctx: commands.Context) -> None:
             # Update database and in realtime for "instant" effect
             awaitables: Awaitables = Awaitables([database.leave_channel(userid=userid),
-                                                 self.part_channels([ctx.channel.name])])
+                                                 self.stop_serving_channel(userid, ctx.channel.name)])
             await awaitables.gather()
 
         await ComplementsBot.cmd_body(
@@ -0,0 +1,190 @@
+"""
+Splits the joined channels between bot instances on several hosts sharing one database: every instance sends
+heartbeats, channels are spread over the live instances by consistent hashing, and a lease on each channel makes sure
+that no two instances ever serve it at once
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Optional
+
+from . import database, logs
+from .bot import ComplementsBot
+from .sharding import HashRing
+
+_LOG: logging.Logger = logging.getLogger(logs.BOT)
+
+# Starts or stops serving a channel, given its user id and username
+ChannelAction = Callable[[str, str], Awaitable[None]]
+
+
+class ChannelCoordinator:
+    """
+    Decides which channels this instance serves: each step it renews its heartbeat, works out from the live instances
+    which channels it owns, and hands channels over so that none is ever served twice. A channel moving to another
+    instance is first parted here and its lease released, and only then taken (and joined) by its new owner, which
+    keeps trying every step until it gets the lease; if an instance dies, its leases are up for grabs once its
+    heartbeat runs out
+    """
+
+    HEARTBEAT_INTERVAL: float = 5.0
+    NODE_LEASE: float = 15.0
+
+    def __init__(self, node_id: str, serve: ChannelAction, stop_serving: ChannelAction,
+                 id_to_name: Callable[[str], Awaitable[Optional[str]]], *, virtual_nodes: int = 64) -> None:
+        """
+        :param node_id: this instance's id; has to be unique among the instances sharing the database
+        :param serve: joins a channel
+        :param stop_serving: parts a channel
+        :param id_to_name: looks up the username of a channel whose username was never stored
+        :param virtual_nodes: at how many points of the hash ring each instance is placed
+        """
+        self.node_id: str = node_id
+        self._serve: ChannelAction = serve
+        self._stop_serving: ChannelAction = stop_serving
+        self._id_to_name: Callable[[str], Awaitable[Optional[str]]] = id_to_name
+        self._ring: HashRing = HashRing(virtual_nodes=virtual_nodes)
+        # The channels being served by this instance, by user id, with the username they were joined under
+        self._serving: Dict[str, str] = {}
+
+    @property
+    def serving(self) -> Dict[str, str]:
+        """
+        :return: the user ids of the channels this instance serves, mapped to their usernames
+        """
+        return dict(self._serving)
+
+    def owns(self, userid: str) -> bool:
+        """
+        :return: whether the channel belongs to this instance, as of the last step; nothing does before the first one
+        """
+        return self._ring.owner(userid) == self.node_id
+
+    async def step(self) -> Dict[str, str]:
+        """
+        Renews this instance's heartbeat, then stops serving the channels it no longer owns and starts serving the
+        ones it has come to own
+        :return: the user ids of the channels this instance started serving, mapped to their usernames
+        """
+        await database.heartbeat(self.node_id, ChannelCoordinator.NODE_LEASE)
+        nodes: set[str] = {*await database.live_nodes(), self.node_id}
+        for node in self._ring.nodes - nodes:
+            self._ring.remove(node)
+        for node in nodes:
+            self._ring.add(node)
+
+        owned: Dict[str, Optional[str]] = {userid: username for userid, username
+                                           in (await database.get_joined_channel_usernames()).items()
+                                           if self.owns(userid)}
+        # Handing channels over comes first, so that their new owners can take them as soon as possible; a channel
+        #  whose streamer changed their username is parted under the old one and joined again under the new one
+        await asyncio.gather(*(self.release(userid) for userid, username in self.serving.items()
+                               if userid not in owned or owned[userid] not in (None, username)))
+        unnamed: list[str] = [userid for userid, username in owned.items()
+                              if username is None and userid not in self._serving]
+        owned.update(zip(unnamed, await asyncio.gather(*map(self._id_to_name, unnamed))))
+        to_claim: Dict[str, str] = {userid: username for userid, username in owned.items()
+                                    if username is not None and userid not in self._serving}
+        claimed: list[bool] = await asyncio.gather(*(self.claim(userid, username)
+                                                     for userid, username in to_claim.items()))
+        return {userid: username for (userid, username), is_claimed in zip(to_claim.items(), claimed) if is_claimed}
+
+    async def claim(self, userid: str, username: str) -> bool:
+        """
+        Starts serving a channel, if no other live instance still holds its lease
+        :return: whether the channel is now served by this instance
+        """
+        if userid in self._serving:
+            return True
+        # The instances on the ring are the ones that were alive as of the last step
+        if not await database.acquire_channel_lease(userid, self.node_id, self._ring.nodes):
+            # Its previous owner has not handed it over yet; tried again next step
+            return False
+        self._serving[userid] = username
+        await self._serve(userid, username)
+        return True
+
+    async def release(self, userid: str) -> None:
+        """
+        Stops serving a channel, then lets another instance take it
+        """
+        username: Optional[str] = self._serving.pop(userid, None)
+        if username is None:
+            return
+        await self._stop_serving(userid, username)
+        await database.release_channel_lease(userid, self.node_id)
+
+    async def run(self, on_claimed: Optional[Callable[[Dict[str, str]], None]] = None) -> None:
+        """
+        Steps every HEARTBEAT_INTERVAL seconds until cancelled
+        :param on_claimed: called with the channels (user ids mapped to usernames) that a step started serving, if any
+        """
+        while True:
+            try:
+                claimed: Dict[str, str] = await self.step()
+                if claimed and on_claimed is not None:
+                    on_claimed(claimed)
+            except Exception:  # pylint: disable=broad-exception-caught
+                _LOG.exception("Could not coordinate channels with the other instances")
+            await asyncio.sleep(ChannelCoordinator.HEARTBEAT_INTERVAL)
+
+    async def leave(self) -> None:
+        """
+        Hands every channel over and leaves the cluster, so that the other instances take over straight away
+        """
+        await asyncio.gather(*(self.release(userid) for userid in self.serving))
+        await database.leave_cluster(self.node_id)
+
+
+class ClusterNodeBot(ComplementsBot):
+    """
+    A bot which serves the channels that its coordinator assigns it; channels joined through another instance are
+    picked up by their owner on its next step
+    """
+
+    def __init__(self, node_id: str) -> None:
+        """
+        :param node_id: this instance's id; has to be unique among the instances sharing the database
+        """
+        super().__init__()
+        self.coordinator: ChannelCoordinator = ChannelCoordinator(node_id, super().serve_channel,
+                                                                  super().stop_serving_channel, self.id_to_name)
+        self._coordinating: Optional[asyncio.Task] = None
+        self._verifications: set[asyncio.Task] = set()
+
+    async def event_ready(self) -> None:
+        await super().event_ready()
+        # Channels can only be joined once connected
+        if self._coordinating is None:
+            self._coordinating = asyncio.ensure_future(self.coordinator.run(self.verify_claimed_channel_names))
+
+    def verify_claimed_channel_names(self, channels: Dict[str, str]) -> None:
+        """
+        Checks the usernames of channels which were just claimed against Twitch in the background, since no channel
+        belongs to this instance when the bot checks the stored usernames at startup
+        :param channels: the usernames the channels were joined under, by user id
+        """
+        task: asyncio.Task = asyncio.ensure_future(self.verify_channel_names(dict(channels.items())))
+        self._verifications.add(task)
+        task.add_done_callback(self._verifications.discard)
+
+    async def close(self) -> None:
+        if self._coordinating is not None:
+            self._coordinating.cancel()
+        for task in self._verifications:
+            task.cancel()
+        await self.coordinator.leave()
+        await super().close()
+
+    def owns_channel(self, userid: str) -> bool:
+        # The coordinator joins the channels this instance owns once it holds their leases, and has their usernames
+        #  checked then
+        return False
+
+    async def serve_channel(self, userid: str, username: str) -> None:
+        if self.coordinator.owns(userid) and self.coordinator.serving.get(userid) != username:
+            await self.coordinator.release(userid)
+            await self.coordinator.claim(userid, username)
+
+    async def stop_serving_channel(self, userid: str, username: str) -> None:
+        await self.coordinator.release(userid)
@@ -0,0 +1,76 @@
+"""
+Buffers of complements drawn ahead of time, so that complementing someone never has to wait for anything
+"""
+
+import asyncio
+from collections import deque
+from typing import Awaitable, Callable, Optional, Tuple
+
+
+class ComplementStream:
+    """
+    The next few complements for one channel, drawn in advance; they are stored unformatted (without the '@user' and
+    any mute prefix), as who they go to is only known once they are used. Whenever the buffer runs low, it is refilled
+    in the background, unless a refill found no complements to draw for the channel's current complements version
+    """
+
+    def __init__(self,
+                 fill: Callable[[int], Awaitable[Tuple[Optional[int], list[str]]]],
+                 size: int = 10,
+                 low_water_mark: int = 3) -> None:
+        """
+        :param fill: draws the given number of complements for the channel, returning them along with the complements
+            version of the channel they were drawn for
+        :param size: how many complements to keep drawn in advance
+        :param low_water_mark: once fewer than this many complements are left, the buffer gets refilled
+        """
+        self._fill: Callable[[int], Awaitable[Tuple[Optional[int], list[str]]]] = fill
+        self._size: int = size
+        self._low_water_mark: int = low_water_mark
+        self._buffer: deque[str] = deque()
+        self._version: Optional[int] = None
+        self._refill_task: Optional[asyncio.Task] = None
+        # Whether the channel had no complements to draw as of 'self._version'
+        self._is_exhausted: bool = False
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    def pop(self, version: Optional[int]) -> Optional[str]:
+        """
+        :param version: the channel's current complements version; anything drawn for another version is thrown away
+        :return: the next complement, or 'None' if there is none ready yet
+        """
+        if version != self._version:
+            self._set_version(version)
+        complement: Optional[str] = self._buffer.popleft() if self._buffer else None
+        if len(self._buffer) < self._low_water_mark and not self._is_exhausted:
+            self.refill()
+        return complement
+
+    def refill(self) -> None:
+        """
+        Tops the buffer up in the background, unless that is already happening
+        """
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self._refill())
+
+    async def _refill(self) -> None:
+        try:
+            version, complements = await self._fill(self._size - len(self._buffer))
+        except Exception:  # pylint: disable=broad-exception-caught
+            # Nothing is lost; complements just get drawn on the spot until the next refill succeeds
+            return
+        if version != self._version:
+            self._set_version(version)
+        # Until the complements change, refilling would come back empty again
+        self._is_exhausted = not complements
+        self._buffer.extend(complements[:self._size - len(self._buffer)])
+
+    def _set_version(self, version: Optional[int]) -> None:
+        """
+        Throws away everything drawn for the old complements version
+        """
+        self._buffer.clear()
+        self._version = version
+        self._is_exhausted = False
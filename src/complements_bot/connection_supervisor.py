@@ -0,0 +1,161 @@
+"""
+Keeps the bot connected to chat without restarting it: notices a dead connection, channels the bot was parted from and
+stalls of the event loop, and reconnects or rejoins only what was lost
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, Protocol
+
+from . import logs
+
+_LOG: logging.Logger = logging.getLogger(logs.BOT)
+
+
+class SupervisedBot(Protocol):
+    """
+    What the supervisor needs from the bot it looks after
+    """
+
+    def is_connected(self) -> bool:
+        """
+        :return: whether the connection to chat is open
+        """
+
+    def joined_channel_names(self) -> set[str]:
+        """
+        :return: the names of the channels the bot is in
+        """
+
+    def rejoin(self, channels: list[str]) -> int:
+        """
+        :param channels: the names of channels to join again
+        :return: how many of them were not already waiting to be joined
+        """
+
+    async def reconnect(self) -> None:
+        """
+        Closes the connection to chat, if it is still open, so that a new one is opened
+        """
+
+
+class ConnectionSupervisor:
+    """
+    Checks on the connection every CHECK_INTERVAL seconds. A connection which is still open but over which nothing has
+    arrived for SILENCE_TIMEOUT seconds (Twitch pings every 5 minutes) is closed, so that a new one is opened, waiting
+    exponentially longer between attempts while it does not come back; a connection which is already closed is being
+    replaced by TwitchIO. Channels the bot should be in but is not are joined again
+    """
+
+    CHECK_INTERVAL: float = 30.0
+    SILENCE_TIMEOUT: float = 360.0
+    # Checks coming round this much later (in seconds) than they should mean that the event loop was stalled
+    STALL_THRESHOLD: float = 5.0
+    BASE_BACKOFF: float = 5.0
+    MAX_BACKOFF: float = 300.0
+
+    def __init__(self, bot: SupervisedBot) -> None:
+        """
+        :param bot: the bot to keep connected
+        """
+        self._bot: SupervisedBot = bot
+        # The names of the channels the bot should be in
+        self.wanted: set[str] = set()
+        self._last_data: float = time.monotonic()
+        # How many times in a row reconnecting has not brought the connection back, and when it can next be tried
+        self._failures: int = 0
+        self._next_reconnect: float = 0.0
+        self._checker: Optional[asyncio.Task] = None
+        # How many reconnects were made, channels rejoined, and event loop stalls noticed
+        self.outcome_counts: Dict[str, int] = {"reconnects": 0, "rejoins": 0, "stalls": 0}
+
+    @property
+    def is_running(self) -> bool:
+        """
+        :return: whether the connection is being checked on
+        """
+        return self._checker is not None
+
+    def start(self) -> None:
+        """
+        Starts checking on the connection, if not already
+        """
+        if self._checker is None or self._checker.done():
+            self._checker = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        """
+        Stops checking on the connection
+        """
+        if self._checker is not None:
+            self._checker.cancel()
+            self._checker = None
+
+    def saw_data(self) -> None:
+        """
+        Called whenever anything arrives over the connection, which shows that it is still alive
+        """
+        self._last_data = time.monotonic()
+
+    def connected(self) -> None:
+        """
+        Called once a new connection is ready; none of the channels of the old connection carry over to it, so all are
+        joined again
+        """
+        self._failures = 0
+        self._next_reconnect = 0.0
+        self.saw_data()
+        self.outcome_counts["rejoins"] += self._bot.rejoin(sorted(self.wanted))
+
+    def gave_up(self, channel: str) -> None:
+        """
+        Called when joining a channel has failed too many times; it is no longer joined again, until it is asked for
+        :param channel: the name of the channel
+        """
+        self.wanted.discard(channel.lower())
+
+    def parted(self, channel: str) -> None:
+        """
+        Called when the bot leaves a channel; unless it was meant to, the channel is joined again
+        :param channel: the name of the channel
+        """
+        if channel.lower() in self.wanted:
+            _LOG.warning("Was parted from %s; rejoining it", channel)
+            self.outcome_counts["rejoins"] += self._bot.rejoin([channel.lower()])
+
+    async def check(self, now: float) -> None:
+        """
+        Reconnects if the connection is dead, otherwise rejoins any channels the bot should be in but is not
+        :param now: the current time (time.monotonic)
+        """
+        if not self._bot.is_connected():
+            # TwitchIO is already opening a new connection
+            return
+        if now - self._last_data < ConnectionSupervisor.SILENCE_TIMEOUT:
+            missing: set[str] = self.wanted - self._bot.joined_channel_names()
+            if missing:
+                self.outcome_counts["rejoins"] += self._bot.rejoin(sorted(missing))
+            return
+        if now < self._next_reconnect:
+            return
+        self._failures += 1
+        backoff: float = min(ConnectionSupervisor.MAX_BACKOFF, ConnectionSupervisor.BASE_BACKOFF * 2 ** (self._failures - 1))
+        self._next_reconnect = now + backoff
+        self.outcome_counts["reconnects"] += 1
+        _LOG.warning("Connection to chat has gone silent (attempt %d at bringing it back); reconnecting", self._failures)
+        await self._bot.reconnect()
+
+    async def _run(self) -> None:
+        while True:
+            started: float = time.monotonic()
+            await asyncio.sleep(ConnectionSupervisor.CHECK_INTERVAL)
+            now: float = time.monotonic()
+            stall: float = now - started - ConnectionSupervisor.CHECK_INTERVAL
+            if stall >= ConnectionSupervisor.STALL_THRESHOLD:
+                self.outcome_counts["stalls"] += 1
+                _LOG.warning("The event loop was stalled for %.1fs", stall)
+            try:
+                await self.check(now)
+            except Exception:  # pylint: disable=broad-exception-caught
+                _LOG.exception("Could not check on the connection to chat")
@@ -3,30 +3,60 @@ The API through which items in our database are accessed
 """
 
 import asyncio
+import itertools
+import time
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from datetime import datetime
-from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+from enum import Enum
+from typing import AbstractSet, Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, NamedTuple, Optional, Tuple, Union
+
+from src.env_reader import DATABASE_BACKEND, DATABASE_MAX_CONCURRENT_REQUESTS, DATABASE_MAX_CONNECTIONS, \
+    DATABASE_SQLITE_PATH, DATABASE_URL, DATABASE_WRITE_COALESCE_MS
+from ..metrics import CACHE_REQUESTS
+from .storage import FirebaseBackend, ListenerHandle, MemoryBackend, SQLiteBackend, StorageBackend, apply_change, \
+    split_path
+from .tracing import span, traced
+from .utilities import Awaitables, remove_chars, run_with_appropriate_awaiting
 
-from firebase_admin import credentials, db, initialize_app
+# Database nodes:
+_IGNORED: str = "Ignored"
+_USERS: str = "Users"
+_JOINED: str = "Joined"
+_NODES: str = "Nodes"  # every bot instance sharing the database, with when its heartbeat runs out
+_LEASES: str = "Leases"  # which instance is serving each channel
 
-from src.env_reader import DATABASE_URL
-from .utilities import Awaitables, remove_chars, run_with_appropriate_awaiting
 
-_cred: credentials.Certificate
-try:
-    _cred = credentials.Certificate("src/.firebase_config.json")
-except IOError:
-    _cred = credentials.Certificate(".firebase_config.json")
-initialize_app(_cred, {'databaseURL': DATABASE_URL})
+def _create_backend() -> StorageBackend:
+    """
+    :return: the storage backend named by the 'DATABASE_BACKEND' setting ('firebase' if not set)
+    """
+    backend_name: str = (DATABASE_BACKEND or "firebase").lower()
+    if backend_name == "memory":
+        return MemoryBackend()
+    if backend_name == "sqlite":
+        return SQLiteBackend(DATABASE_SQLITE_PATH or "complements_bot.sqlite3")
+    if backend_name != "firebase":
+        raise ValueError(f"Unknown database backend '{DATABASE_BACKEND}'")
+    assert DATABASE_URL
+    return FirebaseBackend(
+            DATABASE_URL,
+            ("src/.firebase_config.json", ".firebase_config.json"),
+            max_connections=int(DATABASE_MAX_CONNECTIONS or 20),
+            max_concurrent_requests=int(DATABASE_MAX_CONCURRENT_REQUESTS or 50)
+    )
 
-REF: db.Reference = db.reference('/')
-IGNORED_DB_REF: db.Reference = REF.child('Ignored')
-USERS_DB_REF: db.Reference = REF.child('Users')
 
-_event_loop = asyncio.get_event_loop()
+# All reads, writes and listening go through here
+_BACKEND: StorageBackend = _create_backend()
+
+
+def _path(*keys: str) -> str:
+    """
+    :return: the path made up of 'keys'
+    """
+    return "/".join(keys)
 
-_REF: db.Reference = db.reference('/')
-_IGNORED_DB_REF: db.Reference = _REF.child('Ignored')
-_USERS_DB_REF: db.Reference = _REF.child('Users')
 
 # Default values for database:
 _DEFAULT_COMPLEMENT_CHANCE: float = 10.0 / 3.0
@@ -39,6 +69,7 @@ _DEFAULT_RANDOM_COMPLEMENT_MUTED: bool = False
 _DEFAULT_IS_JOINED: bool = True
 _DEFAULT_DEFAULT_COMPLEMENTS_ENABLED: bool = True
 _DEFAULT_CUSTOM_COMPLEMENTS_ENABLED: bool = True
+_DEFAULT_SHUFFLE_COMPLEMENTS: bool = False
 
 # Database keys:
 _COMPLEMENT_CHANCE: str = "complement_chance"
@@ -52,6 +83,7 @@ _COMMAND_COMPLEMENT_MUTED: str = "command_complement_muted"
 _RANDOM_COMPLEMENT_MUTED: str = "random_complement_muted"
 _DEFAULT_COMPLEMENTS_ENABLED: str = "default_complements_enabled"
 _CUSTOM_COMPLEMENTS_ENABLED: str = "custom_complements_enabled"
+_SHUFFLE_COMPLEMENTS: str = "shuffle_complements"
 _CREATED_AT: str = "created_at"
 _USERNAME: str = "last_known_username"  # only stored so that the old channel can be left/parted and avoid its overhead
 
@@ -64,10 +96,112 @@ _DEFAULT_USER: Dict[str, Any] = {_COMPLEMENT_CHANCE: _DEFAULT_COMPLEMENT_CHANCE,
                                  _COMMAND_COMPLEMENT_MUTED: _DEFAULT_COMMAND_COMPLEMENT_MUTED,
                                  _RANDOM_COMPLEMENT_MUTED: _DEFAULT_RANDOM_COMPLEMENT_MUTED,
                                  _CUSTOM_COMPLEMENTS_ENABLED: _DEFAULT_CUSTOM_COMPLEMENTS_ENABLED,
-                                 _DEFAULT_COMPLEMENTS_ENABLED: _DEFAULT_DEFAULT_COMPLEMENTS_ENABLED
+                                 _DEFAULT_COMPLEMENTS_ENABLED: _DEFAULT_DEFAULT_COMPLEMENTS_ENABLED,
+                                 _SHUFFLE_COMPLEMENTS: _DEFAULT_SHUFFLE_COMPLEMENTS
                                  }
 
 
+class ChannelFlag(Enum):
+    """
+    The on/off settings of a channel, valued by their database keys
+    """
+
+    COMMAND_COMPLEMENT_ENABLED = _COMMAND_COMPLEMENT_ENABLED
+    RANDOM_COMPLEMENT_ENABLED = _RANDOM_COMPLEMENT_ENABLED
+    COMMAND_COMPLEMENT_MUTED = _COMMAND_COMPLEMENT_MUTED
+    RANDOM_COMPLEMENT_MUTED = _RANDOM_COMPLEMENT_MUTED
+    DEFAULT_COMPLEMENTS_ENABLED = _DEFAULT_COMPLEMENTS_ENABLED
+    CUSTOM_COMPLEMENTS_ENABLED = _CUSTOM_COMPLEMENTS_ENABLED
+    SHOULD_IGNORE_BOTS = _SHOULD_IGNORE_BOTS
+    SHUFFLE_COMPLEMENTS = _SHUFFLE_COMPLEMENTS
+
+
+class ChannelSettings(NamedTuple):
+    """
+    A snapshot of everything stored about a channel, with defaults filled in for anything that is not set
+    """
+
+    userid: str
+    exists: bool
+    is_joined: bool
+    complement_chance: float
+    should_ignore_bots: bool
+    tts_mute_prefix: str
+    command_complement_enabled: bool
+    random_complement_enabled: bool
+    command_complement_muted: bool
+    random_complement_muted: bool
+    default_complements_enabled: bool
+    custom_complements_enabled: bool
+    # Whether complements are drawn from a shuffle bag, so that none repeats until all have been used
+    shuffle_complements: bool
+    custom_complements: Tuple[str, ...]
+    username: Optional[str]
+    # Changes whenever anything that decides which complements the channel uses changes; 'None' if the settings were
+    #  not read through the (listening) settings cache, in which case nothing derived from them should be kept around
+    complements_version: Optional[int] = None
+
+
+def _value_or_default(data: Dict[str, Any], key: str, default: Any) -> Any:
+    """
+    :param data: the raw contents of a user's node in the database
+    :param key: the database key we are after
+    :param default: what to use if the key has never been set
+    :return: the stored value for 'key', or 'default' if there is none
+    """
+    value = data.get(key)
+    return default if value is None else value
+
+
+def _as_list(value: Any) -> list[Any]:
+    """
+    :param value: a value read from the database that is meant to be a list
+    :return: 'value' as a list; Firebase hands back sparse lists as dicts keyed by index, and missing lists as 'None'
+    """
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        return [value[key] for key in sorted(value, key=int)]
+    return list(value)
+
+
+def _settings_from_data(userid: str, data: Optional[Dict[str, Any]],
+                        complements_version: Optional[int] = None) -> ChannelSettings:
+    """
+    :param userid: the user id whose node 'data' is
+    :param data: the raw contents of the user's node in the database ('None' if the node does not exist)
+    :param complements_version: the version of the channel's complements, if it is being tracked
+    :return: the channel's settings, with defaults filled in for anything missing
+    """
+    exists: bool = data is not None
+    data = data or {}
+    return ChannelSettings(
+            userid=userid,
+            exists=exists,
+            # A missing 'is_joined' should be treated as not joined, as is_channel_joined always has
+            is_joined=bool(data.get(_IS_JOINED)),
+            complement_chance=float(_value_or_default(data, _COMPLEMENT_CHANCE, _DEFAULT_COMPLEMENT_CHANCE)),
+            should_ignore_bots=bool(_value_or_default(data, _SHOULD_IGNORE_BOTS, _DEFAULT_SHOULD_IGNORE_BOTS)),
+            tts_mute_prefix=str(_value_or_default(data, _MUTE_PREFIX, _DEFAULT_TTS_IGNORE_PREFIX)),
+            command_complement_enabled=bool(
+                    _value_or_default(data, _COMMAND_COMPLEMENT_ENABLED, _DEFAULT_COMMAND_COMPLEMENT_ENABLED)),
+            random_complement_enabled=bool(
+                    _value_or_default(data, _RANDOM_COMPLEMENT_ENABLED, _DEFAULT_RANDOM_COMPLEMENT_ENABLED)),
+            command_complement_muted=bool(
+                    _value_or_default(data, _COMMAND_COMPLEMENT_MUTED, _DEFAULT_COMMAND_COMPLEMENT_MUTED)),
+            random_complement_muted=bool(
+                    _value_or_default(data, _RANDOM_COMPLEMENT_MUTED, _DEFAULT_RANDOM_COMPLEMENT_MUTED)),
+            default_complements_enabled=bool(
+                    _value_or_default(data, _DEFAULT_COMPLEMENTS_ENABLED, _DEFAULT_DEFAULT_COMPLEMENTS_ENABLED)),
+            custom_complements_enabled=bool(
+                    _value_or_default(data, _CUSTOM_COMPLEMENTS_ENABLED, _DEFAULT_CUSTOM_COMPLEMENTS_ENABLED)),
+            shuffle_complements=bool(_value_or_default(data, _SHUFFLE_COMPLEMENTS, _DEFAULT_SHUFFLE_COMPLEMENTS)),
+            custom_complements=tuple(_as_list(data.get(_CUSTOM_COMPLEMENTS))),
+            username=data.get(_USERNAME),
+            complements_version=complements_version
+    )
+
+
 class Database:
     """
     The way to interact with the database
@@ -94,6 +228,595 @@ class Database:
         return await run_with_appropriate_awaiting(self.id_to_name_init, uid)
 
 
+class CacheStats(NamedTuple):
+    """
+    How much use the in-process channel settings cache is getting
+    """
+
+    hits: int
+    misses: int
+    size: int
+
+
+# The settings that decide which complements a channel uses (and in what order)
+_COMPLEMENTS_KEYS: frozenset[str] = frozenset((_CUSTOM_COMPLEMENTS, _CUSTOM_COMPLEMENTS_ENABLED,
+                                               _DEFAULT_COMPLEMENTS_ENABLED, _SHUFFLE_COMPLEMENTS))
+# Never hands out the same version twice, so that a channel which is dropped and cached again gets a fresh one
+_COMPLEMENTS_VERSIONS: Iterator[int] = itertools.count(1)
+
+
+class _SettingsCache:
+    """
+    Keeps every channel's settings in memory; entries are kept up to date by listening to changes made to the 'Users'
+    node rather than expiring, so reads served from here never have to go over the network
+    """
+
+    def __init__(self) -> None:
+        self._data: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._settings: Dict[str, ChannelSettings] = {}
+        self._complements_versions: Dict[str, int] = {}
+        self._hits: int = 0
+        self._misses: int = 0
+        # Bumped on every change, so that a read which raced with a change does not put stale data into the cache
+        self.generation: int = 0
+        self._listener: Optional[ListenerHandle] = None
+
+    @property
+    def is_running(self) -> bool:
+        """
+        Whether the cache is listening for changes; entries can only be trusted while it is
+        """
+        return self._listener is not None
+
+    def start(self) -> None:
+        """
+        Start listening for changes to the 'Users' node; the first event holds the whole node, which fills the cache
+        """
+        if self._listener is None:
+            self._listener = _BACKEND.listen(_USERS, self.on_event)
+
+    def stop(self) -> None:
+        """
+        Stop listening for changes and forget everything that was cached, as it can no longer be kept up to date
+        """
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        self._data.clear()
+        self._settings.clear()
+        self._complements_versions.clear()
+        self.generation += 1
+
+    def stats(self) -> CacheStats:
+        """
+        :return: the number of hits and misses so far, and how many channels are currently cached
+        """
+        return CacheStats(self._hits, self._misses, len(self._settings))
+
+    def get(self, userid: str) -> Optional[ChannelSettings]:
+        """
+        :param userid: the user id of the channel whose settings we want
+        :return: the channel's cached settings, or 'None' if they are not cached
+        """
+        settings: Optional[ChannelSettings] = self._settings.get(userid) if self.is_running else None
+        if settings is None:
+            self._misses += 1
+        else:
+            self._hits += 1
+        return settings
+
+    def get_value(self, userid: str, key: str) -> Tuple[bool, Any]:
+        """
+        :param userid: the user id of the channel whose setting we want
+        :param key: the database key of the setting
+        :return: whether the channel is cached, and if it is, the raw value stored under 'key'
+        """
+        if not self.is_running or userid not in self._settings:
+            self._misses += 1
+            return False, None
+        self._hits += 1
+        return True, (self._data[userid] or {}).get(key)
+
+    def store(self, userid: str, data: Optional[Dict[str, Any]], generation: int) -> ChannelSettings:
+        """
+        :param userid: the user id of the channel that was read from the database
+        :param data: the raw contents of the channel's node, as read from the database
+        :param generation: the value of 'self.generation' from before the read was started
+        :return: the channel's settings; they are only cached if nothing changed while the read was happening
+        """
+        if self.is_running and generation == self.generation:
+            self._cache(userid, data, True)
+            return self._settings[userid]
+        return _settings_from_data(userid, data)
+
+    def apply(self, userid: str, path: list[str], data: Any, is_patch: bool = False) -> None:
+        """
+        Writes through a change made to a channel's node, if the channel is cached
+        :param userid: the user id of the channel that was changed
+        :param path: where in the channel's node the change happened
+        :param data: the new data at 'path'
+        :param is_patch: whether 'data' is a set of children to update rather than a replacement
+        """
+        self.generation += 1
+        if userid in self._settings:
+            changes_complements: bool = not path or path[0] in _COMPLEMENTS_KEYS or \
+                (is_patch and isinstance(data, dict) and not _COMPLEMENTS_KEYS.isdisjoint(data))
+            self._cache(userid, apply_change(self._data[userid], path, data, is_patch), changes_complements)
+
+    def on_event(self, event_type: str, path: str, data: Any) -> None:
+        """
+        Applies a change reported by the listener on the 'Users' node
+        :param event_type: 'put' or 'patch'
+        :param path: the path of the change, relative to the 'Users' node
+        :param data: the new data at 'path'
+        """
+        parts: list[str] = split_path(path)
+        if not parts and event_type == "put":
+            self.generation += 1
+            self._data.clear()
+            self._settings.clear()
+            for userid, user_data in (data or {}).items():
+                self._cache(userid, user_data, True)
+        elif not parts:
+            for userid, user_data in (data or {}).items():
+                self._cache(userid, None, True)
+                self.apply(userid, [], user_data)
+        else:
+            if parts[0] not in self._settings:
+                self._cache(parts[0], None, True)
+            self.apply(parts[0], parts[1:], data, event_type == "patch")
+
+    def _cache(self, userid: str, data: Optional[Dict[str, Any]], changes_complements: bool) -> None:
+        """
+        :param userid: the user id of the channel to cache
+        :param data: the raw contents of the channel's node
+        :param changes_complements: whether the channel's complements may have changed, and so need a new version
+        """
+        if changes_complements or userid not in self._complements_versions:
+            self._complements_versions[userid] = next(_COMPLEMENTS_VERSIONS)
+        self._data[userid] = data
+        self._settings[userid] = _settings_from_data(userid, data, self._complements_versions[userid])
+
+
+_SETTINGS_CACHE: _SettingsCache = _SettingsCache()
+
+
+def start_settings_cache() -> None:
+    """
+    Starts caching every channel's settings in memory, kept up to date by listening for changes in the database
+    """
+    _SETTINGS_CACHE.start()
+
+
+def stop_settings_cache() -> None:
+    """
+    Stops caching channel settings; all reads go to the database again
+    """
+    _SETTINGS_CACHE.stop()
+
+
+def settings_cache_stats() -> CacheStats:
+    """
+    :return: the hit/miss counters and current size of the channel settings cache
+    """
+    return _SETTINGS_CACHE.stats()
+
+
+class _MirroredNode:
+    """
+    Keeps an in-memory copy of a node of the database; it is loaded once, and kept in sync by listening to changes
+    to the node and by having local writes applied to it
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path: str = path
+        # The node exactly as it is stored, so that changes to single children can be applied to it
+        self._data: Any = None
+        self._is_loaded: bool = False
+        self._generation: int = 0
+        self._listener: Optional[ListenerHandle] = None
+        # The load which is underway, shared by everything that needs the node in the meantime
+        self._loading: Optional[asyncio.Future] = None
+
+    def start(self) -> None:
+        """
+        Start listening for changes to the node; the first event holds the whole node
+        """
+        if self._listener is None:
+            self._listener = _BACKEND.listen(self._path, self.on_event)
+
+    def stop(self) -> None:
+        """
+        Stop listening for changes; the node will be loaded again the next time it is needed
+        """
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+        self._is_loaded = False
+        self._loading = None
+
+    async def load(self) -> None:
+        """
+        Reads the node from the database, unless it has already been read or is being listened to; everything that
+        needs the node while it is being read waits for that same read
+        """
+        if self._is_ready():
+            return
+        if self._loading is None or self._loading.done():
+            self._loading = asyncio.ensure_future(self._load())
+        # Shielded, so that one caller giving up does not cancel the load for the others
+        await asyncio.shield(self._loading)
+
+    def _is_ready(self) -> bool:
+        """
+        :return: whether the node is held in memory, so that it does not need loading
+        """
+        return self._is_loaded
+
+    async def _load(self) -> None:
+        """
+        Reads the node from the database
+        """
+        generation: int = self._generation
+        data = await _BACKEND.get(self._path)
+        if generation == self._generation:
+            self.replace(data)
+
+    def replace(self, data: Any) -> None:
+        """
+        :param data: the new contents of the node
+        """
+        self._generation += 1
+        self._data = data
+        self._is_loaded = True
+        self._rebuild()
+
+    def apply(self, path: list[str], data: Any, is_patch: bool = False) -> None:
+        """
+        Applies a change that was written to the node; if the node has not been loaded yet, a load that is already
+        underway is discarded instead, as it might not include the change
+        :param path: where, relative to the node, the change happened
+        :param data: the new data at 'path'
+        :param is_patch: whether 'data' is a set of children to update rather than a replacement
+        """
+        if self._is_loaded:
+            self.replace(apply_change(self._data, path, data, is_patch))
+        else:
+            self._generation += 1
+
+    def on_event(self, event_type: str, path: str, data: Any) -> None:
+        """
+        Applies a change reported by the listener on the node
+        :param event_type: 'put' or 'patch'
+        :param path: the path of the change, relative to the node
+        :param data: the new data at 'path'
+        """
+        parts: list[str] = split_path(path)
+        self.replace(apply_change(self._data, parts, data, event_type == "patch"))
+
+    def _rebuild(self) -> None:
+        """
+        Called whenever the node changes, so that anything derived from it can be brought up to date
+        """
+
+
+class _IgnoredIndex(_MirroredNode):
+    """
+    An in-memory set of the ids of all ignored users, so that checking whether someone is ignored needs no I/O
+    """
+
+    def __init__(self) -> None:
+        super().__init__(_IGNORED)
+        self._ids: set[str] = set()
+
+    def __contains__(self, userid: object) -> bool:
+        return userid in self._ids
+
+    def _rebuild(self) -> None:
+        self._ids = set(_as_list(self._data))
+
+
+class _JoinedIndex(_MirroredNode):  # pylint: disable=too-many-instance-attributes
+    """
+    An in-memory copy of the 'Joined' node, which maps the user id of every channel the bot is active in to the
+    channel's last known username ('True' if the username was never stored)
+    """
+
+    def __init__(self) -> None:
+        super().__init__(_JOINED)
+        self._joined: Dict[str, Any] = {}
+        # Whether the index is known to exist, because it was found in the database or was built out of 'Users'
+        self._is_built: bool = False
+
+    def __contains__(self, userid: object) -> bool:
+        return userid in self._joined
+
+    def __len__(self) -> int:
+        return len(self._joined)
+
+    def channels(self) -> Dict[str, Any]:
+        """
+        :return: the user ids of all joined channels, mapped to their last known usernames
+        """
+        return dict(self._joined)
+
+    def stop(self) -> None:
+        super().stop()
+        self._is_built = False
+
+    def _is_ready(self) -> bool:
+        return self._is_loaded and self._is_built
+
+    async def _load(self) -> None:
+        """
+        Loads the index, and builds it if it is empty and has not been built yet; an empty index may just as well mean
+        that no channel is joined, so it is only built once
+        """
+        if not self._is_loaded:
+            await super()._load()
+        if not self._is_built:
+            if not self._joined:
+                await self._build()
+            self._is_built = True
+
+    async def _build(self) -> None:
+        """
+        Builds the index out of the 'Users' node; only needed the first time, before the index existed
+        """
+        generation: int = self._generation
+        users: Optional[Dict[str, Any]] = await _BACKEND.get(_USERS)
+        joined: Dict[str, Any] = {userid: data.get(_USERNAME) or True
+                                  for userid, data in (users or {}).items()
+                                  if isinstance(data, dict) and data.get(_IS_JOINED)}
+        if joined:
+            await _BACKEND.update(_JOINED, joined)
+        if generation == self._generation:
+            self.replace(apply_change(self._data, [], joined, is_patch=True))
+
+    def _rebuild(self) -> None:
+        self._joined = dict(self._data) if isinstance(self._data, dict) else {}
+
+
+_IGNORED_INDEX: _IgnoredIndex = _IgnoredIndex()
+_JOINED_INDEX: _JoinedIndex = _JoinedIndex()
+
+
+def start_ignored_index() -> None:
+    """
+    Starts keeping the in-memory index of ignored users in sync by listening for changes in the database
+    """
+    _IGNORED_INDEX.start()
+
+
+def stop_ignored_index() -> None:
+    """
+    Stops listening for changes to ignored users
+    """
+    _IGNORED_INDEX.stop()
+
+
+def start_joined_index() -> None:
+    """
+    Starts keeping the in-memory index of joined channels in sync by listening for changes in the database
+    """
+    _JOINED_INDEX.start()
+
+
+def stop_joined_index() -> None:
+    """
+    Stops listening for changes to joined channels
+    """
+    _JOINED_INDEX.stop()
+
+
+async def open_connections() -> None:
+    """
+    Opens and warms up any connections to the database, so that the first requests are not slowed down by them
+    """
+    await _BACKEND.start()
+
+
+async def close_connections() -> None:
+    """
+    Closes all connections to the database
+    """
+    await _BACKEND.close()
+
+
+def use_backend(backend: StorageBackend) -> None:
+    """
+    :param backend: where all data should be read from and written to from now on
+    Switches to another storage backend (e.g. an in-memory one for tests and benchmarks); everything held in memory
+    about the old one is forgotten, and any listeners on it are stopped
+    """
+    global _BACKEND  # pylint: disable=global-statement
+    _SETTINGS_CACHE.stop()
+    _IGNORED_INDEX.stop()
+    _JOINED_INDEX.stop()
+    _BACKEND = backend
+
+
+class WriteBatch:
+    """
+    Collects writes to any number of locations, so that they can be sent as a single multi-path update: one round
+    trip, and nobody ever sees only some of the writes applied
+    """
+
+    def __init__(self) -> None:
+        # Kept free of overlapping paths, as the database rejects updates in which one path lies below another
+        self._writes: Dict[str, Any] = {}
+        self._on_commit: list[Callable[[], None]] = []
+        self._is_closed: bool = False
+
+    def __len__(self) -> int:
+        return len(self._writes)
+
+    @property
+    def is_closed(self) -> bool:
+        """
+        :return: whether the batch no longer takes writes, because it has been (or is being) committed or discarded
+        """
+        return self._is_closed
+
+    def close(self) -> None:
+        """
+        Stops the batch from taking any more writes
+        """
+        self._is_closed = True
+
+    def set(self, path: str, value: Any, on_commit: Optional[Callable[[], None]] = None) -> None:
+        """
+        :param path: the location to write to
+        :param value: the new data for 'path'; 'None' deletes it
+        :param on_commit: called once the batch has been written, e.g. to write the change through to a cache
+        """
+        if self._is_closed:
+            raise RuntimeError(f"Cannot write to {path} in a batch that is already closed")
+        parts: list[str] = split_path(path)
+        for existing in list(self._writes):
+            existing_parts: list[str] = split_path(existing)
+            if parts[:len(existing_parts)] == existing_parts:
+                # Already writing to this location or above it, so fold the write into that one
+                self._writes[existing] = apply_change(self._writes[existing], parts[len(existing_parts):], value)
+                break
+            if existing_parts[:len(parts)] == parts:
+                del self._writes[existing]
+        else:
+            self._writes[_path(*parts)] = value
+        if on_commit is not None:
+            self._on_commit.append(on_commit)
+
+    async def commit(self) -> None:
+        """
+        Closes the batch, and sends every collected write to the database in one request
+        """
+        self.close()
+        writes, on_commit = self._writes, self._on_commit
+        self._writes, self._on_commit = {}, []
+        if writes:
+            with span("database.commit", writes=len(writes)):
+                await _BACKEND.update("", writes)
+        for callback in on_commit:
+            callback()
+
+
+class _WriteCoalescer:
+    """
+    Holds on to writes made outside of any batch for a short time window, and sends everything that arrived within it
+    as a single batch
+    """
+
+    def __init__(self, window: float) -> None:
+        """
+        :param window: how long (in seconds) to wait for more writes after the first one; 0 turns coalescing off
+        """
+        self.window: float = window
+        self._batch: Optional[WriteBatch] = None
+        self._committed: Optional[asyncio.Future[None]] = None
+
+    async def set(self, path: str, value: Any, on_commit: Optional[Callable[[], None]] = None) -> None:
+        """
+        :param path: the location to write to
+        :param value: the new data for 'path'; 'None' deletes it
+        :param on_commit: called once the write has gone through
+        Returns once the batch holding the write has been committed
+        """
+        if self._batch is None or self._committed is None:
+            self._batch = WriteBatch()
+            self._committed = asyncio.get_running_loop().create_future()
+            asyncio.get_running_loop().create_task(self._commit_after_window(self._batch, self._committed))
+        self._batch.set(path, value, on_commit)
+        await asyncio.shield(self._committed)
+
+    async def _commit_after_window(self, batch: WriteBatch, committed: asyncio.Future[None]) -> None:
+        await asyncio.sleep(self.window)
+        if self._batch is batch:
+            self._batch, self._committed = None, None
+        try:
+            await batch.commit()
+            committed.set_result(None)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            committed.set_exception(error)
+
+
+_CURRENT_BATCH: ContextVar[Optional[WriteBatch]] = ContextVar("current_write_batch", default=None)
+_WRITE_COALESCER: _WriteCoalescer = _WriteCoalescer(float(DATABASE_WRITE_COALESCE_MS or 0) / 1000)
+
+
+def set_write_coalescing_window(window: float) -> None:
+    """
+    :param window: for how long (in seconds) writes made outside of any batch are held on to, so that all those made
+        within the window are sent together; 0 sends every write straight away
+    """
+    _WRITE_COALESCER.window = window
+
+
+@asynccontextmanager
+async def batched_writes() -> AsyncIterator[WriteBatch]:
+    """
+    Every write made inside of this context (including by tasks started inside of it) is collected and sent as one
+    multi-path update when the context is left; nothing is written if the context is left with an exception. Writes
+    made by such tasks after the context is left are no longer batched, and go through on their own. Batches do not
+    nest: an inner one simply joins the outer one. Reads made inside of the context do not see its writes yet
+    """
+    batch: Optional[WriteBatch] = _CURRENT_BATCH.get()
+    if batch is not None:
+        yield batch
+        return
+
+    batch = WriteBatch()
+    token = _CURRENT_BATCH.set(batch)
+    try:
+        yield batch
+    finally:
+        _CURRENT_BATCH.reset(token)
+        batch.close()
+    await batch.commit()
+
+
+async def _write(path: str, value: Any, on_commit: Optional[Callable[[], None]] = None) -> None:
+    """
+    :param path: the location to write to
+    :param value: the new data for 'path'; 'None' deletes it
+    :param on_commit: called once the write has gone through, e.g. to write the change through to a cache
+    Writes straight away, unless there is a batch to add the write to, or writes are being coalesced
+    """
+    batch: Optional[WriteBatch] = _CURRENT_BATCH.get()
+    if batch is not None and not batch.is_closed:
+        batch.set(path, value, on_commit)
+    elif _WRITE_COALESCER.window > 0:
+        await _WRITE_COALESCER.set(path, value, on_commit)
+    else:
+        await _BACKEND.set(path, value)
+        if on_commit is not None:
+            on_commit()
+
+
+async def _get_user_value(userid: Optional[str], key: str) -> Any:
+    """
+    :param userid: the user id of the channel whose setting we want
+    :param key: the database key of the setting
+    :return: the raw value stored under 'key' for the channel, from the cache if possible
+    """
+    assert userid
+    is_cached, value = _SETTINGS_CACHE.get_value(userid, key)
+    if is_cached:
+        return value
+    return await _BACKEND.get(_path(_USERS, userid, key))
+
+
+async def _set_user_value(userid: Optional[str], key: str, value: Any) -> None:
+    """
+    :param userid: the user id of the channel whose setting we are changing
+    :param key: the database key of the setting
+    :param value: the new value of the setting
+    Writes the setting to the database, and through the settings cache
+    """
+    assert userid
+    await _write(_path(_USERS, userid, key), value, lambda: _SETTINGS_CACHE.apply(userid, [key], value))
+
+
+@traced("database.is_user_ignored")
 async def is_user_ignored(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
         Union[Callable[[str], Optional[str]], Callable[[str], Awaitable[Optional[str]]]]] = None) -> bool:
     """
@@ -108,19 +831,19 @@ async def is_user_ignored(username: Optional[str] = None, userid: Optional[str]
     assert username or userid
     assert userid or name_to_id
 
-    users: list[str] = await _event_loop.run_in_executor(None, _IGNORED_DB_REF.get)
-    if users is None:
-        # No ignored users exist
-        return False
-
+    awaitables: Awaitables = Awaitables([_IGNORED_INDEX.load()])
     if not userid:
-        userid = await run_with_appropriate_awaiting(name_to_id, username)
+        awaitables.add_task(run_with_appropriate_awaiting(name_to_id, username))
+        _, userid = await awaitables.gather()
+    else:
+        await awaitables.gather()
 
-    return userid in users
+    return userid in _IGNORED_INDEX
 
 
+@traced("database.ignore")
 async def ignore(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
-        Union[Callable[[str], Optional[str]], Callable[[str], Awaitable[Optional[str]]]]] = None) -> None:
+        Union[Callable[[str], Optional[str]], Callable[[str], Awaitable[Optional[str]]]]] = None) -> bool:
     """
     At least one of 'username' or 'userid' must be specified, and if userid is not specified, name_to_id must be
     specified; userid is preferred whenever possible due to being guaranteed to never change
@@ -128,6 +851,7 @@ async def ignore(username: Optional[str] = None, userid: Optional[str] = None, n
     :param username: twitch username of the user we want to ignore
     :param userid: twitch user id of the user we want to ignore
     Adds the user to the ignored users list (so that they can't be complemented)
+    :return: whether the user was ignored before the change; checked within the same transaction as the change
     """
     assert username or userid
     assert userid or name_to_id
@@ -135,18 +859,23 @@ async def ignore(username: Optional[str] = None, userid: Optional[str] = None, n
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
 
-    def ignore_transaction(data: list[str]) -> list[str]:
-        if data is None:
-            data = []
-        if userid is not None:
+    was_ignored: bool = False
+
+    def ignore_transaction(data: Optional[list[str]]) -> list[str]:
+        nonlocal was_ignored
+        data = _as_list(data)
+        was_ignored = userid in data
+        if userid is not None and not was_ignored:
             data.append(userid)
         return data
 
-    await _event_loop.run_in_executor(None, _IGNORED_DB_REF.transaction, ignore_transaction)
+    _IGNORED_INDEX.replace(await _BACKEND.transaction(_IGNORED, ignore_transaction))
+    return was_ignored
 
 
+@traced("database.unignore")
 async def unignore(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
-        Union[Callable[[str], Optional[str]], Callable[[str], Awaitable[Optional[str]]]]] = None) -> None:
+        Union[Callable[[str], Optional[str]], Callable[[str], Awaitable[Optional[str]]]]] = None) -> bool:
     """
     At least one of 'username' or 'userid' must be specified, and if userid is not specified, name_to_id must be
     specified; userid is preferred whenever possible due to being guaranteed to never change
@@ -154,6 +883,7 @@ async def unignore(username: Optional[str] = None, userid: Optional[str] = None,
     :param username: the username of the user in consideration
     :param userid: the user id of the user in consideration
     Removes the user from the ignored users list (so that they can be complemented)
+    :return: whether the user was ignored before the change; checked within the same transaction as the change
     """
     assert username or userid
     assert userid or name_to_id
@@ -161,14 +891,44 @@ async def unignore(username: Optional[str] = None, userid: Optional[str] = None,
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
 
-    def unignore_transaction(data: list[str]) -> list[str]:
-        if userid:
+    was_ignored: bool = False
+
+    def unignore_transaction(data: Optional[list[str]]) -> list[str]:
+        nonlocal was_ignored
+        data = _as_list(data)
+        was_ignored = userid in data
+        if userid is not None and was_ignored:
             data.remove(userid)
         return data
 
-    await _event_loop.run_in_executor(None, _IGNORED_DB_REF.transaction, unignore_transaction)
+    _IGNORED_INDEX.replace(await _BACKEND.transaction(_IGNORED, unignore_transaction))
+    return was_ignored
+
+
+@traced("database.toggle_flag")
+async def toggle_flag(userid: str, flag: ChannelFlag, desired: bool) -> bool:
+    """
+    Sets one of the channel's flags, reading its old value within the same transaction, so that concurrent toggles
+    can never both believe that they made the change
+    :param userid: the user id of the channel in consideration
+    :param flag: the flag to set
+    :param desired: the value the flag should have
+    :return: the flag's value from before the change (its default if it was never set)
+    """
+    default: bool = _DEFAULT_USER[flag.value]
+    previous: bool = default
 
+    def toggle_transaction(current: Any) -> bool:
+        nonlocal previous
+        previous = default if current is None else bool(current)
+        return desired
 
+    await _BACKEND.transaction(_path(_USERS, userid, flag.value), toggle_transaction)
+    _SETTINGS_CACHE.apply(userid, [flag.value], desired)
+    return previous
+
+
+@traced("database.channel_exists")
 async def channel_exists(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
         Union[Callable[[str], Optional[str]], Callable[[str], Awaitable[Optional[str]]]]] = None) -> bool:
     """
@@ -182,20 +942,20 @@ async def channel_exists(username: Optional[str] = None, userid: Optional[str] =
     assert username or userid
     assert userid or name_to_id
 
-    awaitables: Awaitables = Awaitables([_event_loop.run_in_executor(None, _USERS_DB_REF.get, False, True)])
-    if not userid:
-        awaitables.add_task(run_with_appropriate_awaiting(name_to_id, username))
-
-    results = await awaitables.gather()
-    users: list[str]
     if userid:
-        users = results[0]
-    else:
-        users, userid = results
+        settings: Optional[ChannelSettings] = _SETTINGS_CACHE.get(userid)
+        if settings is not None:
+            return settings.exists
+
+    if not userid:
+        userid = await run_with_appropriate_awaiting(name_to_id, username)
+    assert userid
 
-    return (users is not None) and userid in users
+    # A shallow read of just this channel's node tells us whether it exists without downloading any of it
+    return await _BACKEND.get(_path(_USERS, userid), shallow=True) is not None
 
 
+@traced("database.is_channel_joined")
 async def is_channel_joined(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
         Union[Callable[[str], Optional[str]], Callable[[str], Awaitable[Optional[str]]]]] = None) -> bool:
     """
@@ -216,9 +976,10 @@ async def is_channel_joined(username: Optional[str] = None, userid: Optional[str
 
     # Inside the cast we could potentially get 'None', however, this should be treated as a false.
     #  Luckily, 'bool(None) == False'.
-    return bool(await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_IS_JOINED).get))
+    return bool(await _get_user_value(userid, _IS_JOINED))
 
 
+@traced("database.join_channel")
 async def join_channel(username: str, userid: Optional[str] = None, name_to_id: Optional[
         Union[Callable[[str], Optional[str]], Callable[[str], Awaitable[Optional[str]]]]] = None) -> None:
     """
@@ -231,20 +992,21 @@ async def join_channel(username: str, userid: Optional[str] = None, name_to_id:
     """
     assert userid or name_to_id
 
-    awaitables: Awaitables = Awaitables([])
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    if not await channel_exists(userid=userid):
-        awaitables.add_task(_event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).set, _DEFAULT_USER))
-        awaitables.add_task(_event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_USERNAME).set, username))
-        awaitables.add_task(_event_loop.run_in_executor(
-                None, _USERS_DB_REF.child(userid).child(_CREATED_AT).set, str(datetime.utcnow())))
-    else:
-        awaitables.add_task(_event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_IS_JOINED).set, True))
+    assert userid
+    is_new: bool = not await channel_exists(userid=userid)
 
-    await awaitables.gather()
+    async with batched_writes():
+        if is_new:
+            user: Dict[str, Any] = {**_DEFAULT_USER, _USERNAME: username, _CREATED_AT: str(datetime.utcnow())}
+            await _write(_path(_USERS, userid), user, lambda: _SETTINGS_CACHE.apply(userid, [], user))
+        else:
+            await _set_user_value(userid, _IS_JOINED, True)
+        await _write(_path(_JOINED, userid), username, lambda: _JOINED_INDEX.apply([userid], username))
 
 
+@traced("database.leave_channel")
 async def leave_channel(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
         Union[Callable[[str], Optional[str]], Callable[[str], Awaitable[Optional[str]]]]] = None) -> None:
     """
@@ -260,9 +1022,13 @@ async def leave_channel(username: Optional[str] = None, userid: Optional[str] =
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_IS_JOINED).set, False)
+    assert userid
+    async with batched_writes():
+        await _set_user_value(userid, _IS_JOINED, False)
+        await _write(_path(_JOINED, userid), None, lambda: _JOINED_INDEX.apply([userid], None))
 
 
+@traced("database.delete_channel")
 async def delete_channel(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
         Union[Callable[[str], Optional[str]], Callable[[str], Awaitable[Optional[str]]]]] = None) -> None:
     """
@@ -278,7 +1044,10 @@ async def delete_channel(username: Optional[str] = None, userid: Optional[str] =
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).delete)
+    assert userid
+    async with batched_writes():
+        await _write(_path(_USERS, userid), None, lambda: _SETTINGS_CACHE.apply(userid, [], None))
+        await _write(_path(_JOINED, userid), None, lambda: _JOINED_INDEX.apply([userid], None))
 
 
 async def get_joined_channels() -> list[str]:
@@ -286,21 +1055,53 @@ async def get_joined_channels() -> list[str]:
     :return: a list of all joined channels (in the form of a list of user IDs) where the bot is currently active
     """
 
-    all_users = await _event_loop.run_in_executor(None, _USERS_DB_REF.get, False, True)
-    joined_users: list[str] = []
-    if all_users is None:
-        return joined_users
-    for user in all_users:
-        if await _event_loop.run_in_executor(None, _USERS_DB_REF.child(user).child(_IS_JOINED).get):
-            joined_users.append(user)
-    return joined_users
+    await _JOINED_INDEX.load()
+    return list(_JOINED_INDEX.channels())
+
+
+async def get_joined_channel_usernames() -> Dict[str, Optional[str]]:
+    """
+    :return: the user ids of all joined channels, mapped to their last known usernames (None if never stored)
+    """
+    await _JOINED_INDEX.load()
+    return {userid: username if isinstance(username, str) else None
+            for userid, username in _JOINED_INDEX.channels().items()}
 
 
 async def number_of_joined_channels() -> int:
     """
     :return: The number of joined channels where the bot is currently active
     """
-    return len(await get_joined_channels())
+    await _JOINED_INDEX.load()
+    return len(_JOINED_INDEX)
+
+
+@traced("database.get_channel_settings")
+async def get_channel_settings(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
+        Union[Callable[[str], Optional[str]], Callable[[str], Awaitable[Optional[str]]]]] = None) -> ChannelSettings:
+    """
+    At least one of 'username' or 'userid' must be specified, and if userid is not specified, name_to_id must be
+    specified; userid is preferred whenever possible due to being guaranteed to never change
+    :param name_to_id: function that allows us to convert a username to a user id
+    :param username: the username of the user in consideration
+    :param userid: the user id of the user in consideration
+    :return: all of the channel's settings, read from the database in a single request
+    """
+    assert username or userid
+    assert userid or name_to_id
+
+    if not userid:
+        userid = await run_with_appropriate_awaiting(name_to_id, username)
+    assert userid
+
+    settings: Optional[ChannelSettings] = _SETTINGS_CACHE.get(userid)
+    CACHE_REQUESTS.inc(cache="channel_settings", result="miss" if settings is None else "hit")
+    if settings is not None:
+        return settings
+
+    generation: int = _SETTINGS_CACHE.generation
+    data: Optional[Dict[str, Any]] = await _BACKEND.get(_path(_USERS, userid))
+    return _SETTINGS_CACHE.store(userid, data, generation)
 
 
 async def set_tts_mute_prefix(prefix: str, username: Optional[str] = None, userid: Optional[str] = None,
@@ -320,7 +1121,7 @@ async def set_tts_mute_prefix(prefix: str, username: Optional[str] = None, useri
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_MUTE_PREFIX).set, prefix)
+    await _set_user_value(userid, _MUTE_PREFIX, prefix)
 
 
 async def get_tts_mute_prefix(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
@@ -338,7 +1139,7 @@ async def get_tts_mute_prefix(username: Optional[str] = None, userid: Optional[s
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    prefix: Optional[str] = await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_MUTE_PREFIX).get)
+    prefix: Optional[str] = await _get_user_value(userid, _MUTE_PREFIX)
     prefix = _DEFAULT_TTS_IGNORE_PREFIX if prefix is None else prefix
     return str(prefix)
 
@@ -360,7 +1161,7 @@ async def set_complement_chance(chance: float, username: Optional[str] = None, u
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_COMPLEMENT_CHANCE).set, chance)
+    await _set_user_value(userid, _COMPLEMENT_CHANCE, chance)
 
 
 async def get_complement_chance(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
@@ -379,7 +1180,7 @@ async def get_complement_chance(username: Optional[str] = None, userid: Optional
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
     chance: Optional[float] = \
-        await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_COMPLEMENT_CHANCE).get)
+        await _get_user_value(userid, _COMPLEMENT_CHANCE)
     chance = _DEFAULT_COMPLEMENT_CHANCE if chance is None else chance
     return float(chance)
 
@@ -401,8 +1202,7 @@ async def set_cmd_complement_enabled(is_enabled: bool, username: Optional[str] =
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_COMMAND_COMPLEMENT_ENABLED).set,
-                                      is_enabled)
+    await _set_user_value(userid, _COMMAND_COMPLEMENT_ENABLED, is_enabled)
 
 
 async def get_cmd_complement_enabled(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
@@ -421,7 +1221,7 @@ async def get_cmd_complement_enabled(username: Optional[str] = None, userid: Opt
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
     is_enabled: Optional[bool] = \
-        await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_COMMAND_COMPLEMENT_ENABLED).get)
+        await _get_user_value(userid, _COMMAND_COMPLEMENT_ENABLED)
     is_enabled = _DEFAULT_COMMAND_COMPLEMENT_ENABLED if is_enabled is None else is_enabled
     return bool(is_enabled)
 
@@ -443,7 +1243,7 @@ async def set_random_complement_enabled(is_enabled: bool, username: Optional[str
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_RANDOM_COMPLEMENT_ENABLED).set, is_enabled)
+    await _set_user_value(userid, _RANDOM_COMPLEMENT_ENABLED, is_enabled)
 
 
 async def get_random_complement_enabled(username: Optional[str] = None, userid: Optional[str] = None,
@@ -463,7 +1263,7 @@ async def get_random_complement_enabled(username: Optional[str] = None, userid:
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
     is_enabled: Optional[bool] = \
-        await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_RANDOM_COMPLEMENT_ENABLED).get)
+        await _get_user_value(userid, _RANDOM_COMPLEMENT_ENABLED)
     is_enabled = _DEFAULT_RANDOM_COMPLEMENT_ENABLED if is_enabled is None else is_enabled
     return bool(is_enabled)
 
@@ -485,6 +1285,7 @@ async def add_complement(complement: str, username: Optional[str] = None, userid
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
+    assert userid
 
     def add_transaction(data):
         if data is None:
@@ -492,8 +1293,8 @@ async def add_complement(complement: str, username: Optional[str] = None, userid
         data.append(complement)
         return data
 
-    await _event_loop.run_in_executor(
-            None, _USERS_DB_REF.child(userid).child(_CUSTOM_COMPLEMENTS).transaction, add_transaction)
+    complements = await _BACKEND.transaction(_path(_USERS, userid, _CUSTOM_COMPLEMENTS), add_transaction)
+    _SETTINGS_CACHE.apply(userid, [_CUSTOM_COMPLEMENTS], complements)
 
 
 def complements_to_remove(data: list[str], phrase: str) -> Tuple[list[str], list[str]]:
@@ -538,6 +1339,7 @@ async def remove_complements(username: Optional[str] = None, userid: Optional[st
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
+    assert userid
 
     def remove_transaction(data):
         if to_remove:
@@ -546,8 +1348,9 @@ async def remove_complements(username: Optional[str] = None, userid: Optional[st
             return data
         return to_keep or []
 
-    await _event_loop.run_in_executor(
-            None, _USERS_DB_REF.child(userid).child(_CUSTOM_COMPLEMENTS).transaction, remove_transaction)
+    complements = await _BACKEND.transaction(
+            _path(_USERS, userid, _CUSTOM_COMPLEMENTS), remove_transaction)
+    _SETTINGS_CACHE.apply(userid, [_CUSTOM_COMPLEMENTS], complements)
 
 
 async def remove_all_complements(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
@@ -565,7 +1368,9 @@ async def remove_all_complements(username: Optional[str] = None, userid: Optiona
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_CUSTOM_COMPLEMENTS).delete)
+    assert userid
+    await _write(_path(_USERS, userid, _CUSTOM_COMPLEMENTS), None,
+                 lambda: _SETTINGS_CACHE.apply(userid, [_CUSTOM_COMPLEMENTS], None))
 
 
 async def get_custom_complements(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
@@ -583,8 +1388,7 @@ async def get_custom_complements(username: Optional[str] = None, userid: Optiona
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    complements = await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_CUSTOM_COMPLEMENTS).get) or []
-    return complements
+    return _as_list(await _get_user_value(userid, _CUSTOM_COMPLEMENTS))
 
 
 async def is_cmd_complement_muted(username: Optional[str] = None, userid: Optional[str] = None, name_to_id: Optional[
@@ -602,7 +1406,7 @@ async def is_cmd_complement_muted(username: Optional[str] = None, userid: Option
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    is_muted = await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_COMMAND_COMPLEMENT_MUTED).get)
+    is_muted = await _get_user_value(userid, _COMMAND_COMPLEMENT_MUTED)
     if is_muted is None:
         return _DEFAULT_COMMAND_COMPLEMENT_MUTED
     return bool(is_muted)
@@ -625,7 +1429,7 @@ async def set_cmd_complement_is_muted(is_muted: bool, username: Optional[str] =
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_COMMAND_COMPLEMENT_MUTED).set, is_muted)
+    await _set_user_value(userid, _COMMAND_COMPLEMENT_MUTED, is_muted)
 
 
 async def are_random_complements_muted(username: Optional[str] = None, userid: Optional[str] = None,
@@ -644,7 +1448,7 @@ async def are_random_complements_muted(username: Optional[str] = None, userid: O
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    is_muted = await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_RANDOM_COMPLEMENT_MUTED).get)
+    is_muted = await _get_user_value(userid, _RANDOM_COMPLEMENT_MUTED)
     if is_muted is None:
         return _DEFAULT_RANDOM_COMPLEMENT_MUTED
     return bool(is_muted)
@@ -667,7 +1471,7 @@ async def set_random_complements_are_muted(are_muted: bool, username: Optional[s
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_RANDOM_COMPLEMENT_MUTED).set, are_muted)
+    await _set_user_value(userid, _RANDOM_COMPLEMENT_MUTED, are_muted)
 
 
 async def are_default_complements_enabled(username: Optional[str] = None, userid: Optional[str] = None,
@@ -687,7 +1491,7 @@ async def are_default_complements_enabled(username: Optional[str] = None, userid
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
     is_enabled: Optional[bool] = \
-        await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_DEFAULT_COMPLEMENTS_ENABLED).get)
+        await _get_user_value(userid, _DEFAULT_COMPLEMENTS_ENABLED)
     is_enabled = _DEFAULT_DEFAULT_COMPLEMENTS_ENABLED if is_enabled is None else is_enabled
     return bool(is_enabled)
 
@@ -709,7 +1513,7 @@ async def set_are_default_complements_enabled(are_enabled: bool, username: Optio
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_DEFAULT_COMPLEMENTS_ENABLED).set, are_enabled)
+    await _set_user_value(userid, _DEFAULT_COMPLEMENTS_ENABLED, are_enabled)
 
 
 async def set_are_custom_complements_enabled(are_enabled: bool, username: Optional[str] = None,
@@ -729,7 +1533,7 @@ async def set_are_custom_complements_enabled(are_enabled: bool, username: Option
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_CUSTOM_COMPLEMENTS_ENABLED).set, are_enabled)
+    await _set_user_value(userid, _CUSTOM_COMPLEMENTS_ENABLED, are_enabled)
 
 
 async def are_custom_complements_enabled(username: Optional[str] = None, userid: Optional[str] = None,
@@ -748,7 +1552,7 @@ async def are_custom_complements_enabled(username: Optional[str] = None, userid:
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    is_enabled = await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_CUSTOM_COMPLEMENTS_ENABLED).get)
+    is_enabled = await _get_user_value(userid, _CUSTOM_COMPLEMENTS_ENABLED)
     if is_enabled is None:
         return _DEFAULT_CUSTOM_COMPLEMENTS_ENABLED
     return bool(is_enabled)
@@ -769,7 +1573,7 @@ async def is_ignoring_bots(username: Optional[str] = None, userid: Optional[str]
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    is_ignoring = await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_SHOULD_IGNORE_BOTS).get)
+    is_ignoring = await _get_user_value(userid, _SHOULD_IGNORE_BOTS)
     if is_ignoring is None:
         return _DEFAULT_SHOULD_IGNORE_BOTS
     return bool(is_ignoring)
@@ -792,9 +1596,10 @@ async def set_should_ignore_bots(should_ignore_bots: bool, username: Optional[st
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_SHOULD_IGNORE_BOTS).set, should_ignore_bots)
+    await _set_user_value(userid, _SHOULD_IGNORE_BOTS, should_ignore_bots)
 
 
+@traced("database.set_username")
 async def set_username(
         new_username: str,
         username: Optional[str] = None,
@@ -818,8 +1623,13 @@ async def set_username(
 
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
+    assert userid
 
-    await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_USERNAME).set, new_username)
+    await _JOINED_INDEX.load()
+    async with batched_writes():
+        await _set_user_value(userid, _USERNAME, new_username)
+        if userid in _JOINED_INDEX:
+            await _write(_path(_JOINED, userid), new_username, lambda: _JOINED_INDEX.apply([userid], new_username))
 
 
 async def get_username(
@@ -842,4 +1652,60 @@ async def get_username(
     if not userid:
         userid = await run_with_appropriate_awaiting(name_to_id, username)
 
-    return await _event_loop.run_in_executor(None, _USERS_DB_REF.child(userid).child(_USERNAME).get)
+    return await _get_user_value(userid, _USERNAME)
+
+
+async def heartbeat(node_id: str, lease: float) -> None:
+    """
+    Marks a bot instance as alive for the next 'lease' seconds
+    :param node_id: the instance's id
+    :param lease: how long (in seconds) the instance counts as alive for if it sends no further heartbeat
+    """
+    await _BACKEND.set(_path(_NODES, node_id), time.time() + lease)
+
+
+async def live_nodes() -> list[str]:
+    """
+    :return: the ids of every bot instance whose heartbeat has not run out
+    """
+    nodes: Optional[Dict[str, Any]] = await _BACKEND.get(_NODES)
+    now: float = time.time()
+    return sorted(node_id for node_id, expires_at in (nodes or {}).items()
+                  if isinstance(expires_at, (int, float)) and expires_at > now)
+
+
+async def leave_cluster(node_id: str) -> None:
+    """
+    :param node_id: the id of a bot instance that is shutting down, so that others need not wait for its heartbeat
+        to run out before taking over its channels
+    """
+    await _BACKEND.delete(_path(_NODES, node_id))
+
+
+async def acquire_channel_lease(userid: str, node_id: str, alive: AbstractSet[str]) -> bool:
+    """
+    Makes a bot instance the one serving a channel, unless another instance that is still alive already is
+    :param userid: the user id of the channel in consideration
+    :param node_id: the id of the instance that wants to serve the channel
+    :param alive: the ids of the instances that are alive (see 'live_nodes'), looked up once for every channel being
+        claimed at the same time
+    :return: whether the instance now holds the channel's lease; checked within the same transaction as the change
+    """
+
+    def acquire_transaction(holder: Any) -> Any:
+        return node_id if holder is None or holder == node_id or holder not in alive else holder
+
+    return await _BACKEND.transaction(_path(_LEASES, userid), acquire_transaction) == node_id
+
+
+async def release_channel_lease(userid: str, node_id: str) -> None:
+    """
+    Lets other bot instances serve a channel, if the given instance was the one serving it
+    :param userid: the user id of the channel in consideration
+    :param node_id: the id of the instance that has stopped serving the channel
+    """
+
+    def release_transaction(holder: Any) -> Any:
+        return None if holder == node_id else holder
+
+    await _BACKEND.transaction(_path(_LEASES, userid), release_transaction)
@@ -0,0 +1,190 @@
+"""
+Joins channels no faster than Twitch allows (about 20 joins every 10 seconds per account), most important channels
+first, retrying joins that fail
+"""
+
+import asyncio
+import logging
+import random
+import time
+from enum import IntEnum
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from . import logs
+from .send_queue import TokenBucket
+
+_LOG: logging.Logger = logging.getLogger(logs.BOT)
+
+
+class JoinPriority(IntEnum):
+    """
+    How urgently a channel should be joined; lower values are joined first
+    """
+    REQUESTED = 0  # the streamer has just asked for the bot, and is waiting for it to show up
+    LIVE = 1  # the channel is live, so its chat is active right now
+    OFFLINE = 2
+
+
+class _PendingJoin(NamedTuple):
+    """
+    A channel waiting to be joined, or for Twitch to confirm that it was
+    """
+    priority: JoinPriority
+    last_active: float  # when someone last chatted in the channel (time.monotonic), if known; 0 otherwise
+    not_before: float  # when (time.monotonic) the join can next be tried, since failed joins are retried after a while
+    attempts: int  # how many times joining has failed so far
+    sent: bool = False  # whether the join was sent, and is waiting to be confirmed
+
+    def rank(self) -> Tuple[int, float]:
+        """
+        :return: how soon the channel should be joined, compared to others; lower is sooner
+        """
+        return self.priority, -self.last_active
+
+
+class JoinScheduler:  # pylint: disable=too-many-instance-attributes
+    """
+    A queue of channels to join, which are joined one at a time, as fast as the rate limit allows, most urgent first;
+    joins which fail (which Twitch does silently when it is sent too many) are retried with jittered exponential
+    backoff, up to MAX_ATTEMPTS times
+    """
+
+    PERIOD: float = 10.0
+    MAX_ATTEMPTS: int = 5
+    BASE_BACKOFF: float = 5.0
+    MAX_BACKOFF: float = 300.0
+
+    def __init__(self,
+                 join: Callable[[list[str]], Awaitable[None]],
+                 limit: int = 20,
+                 on_give_up: Optional[Callable[[str], None]] = None) -> None:
+        """
+        :param join: sends the joins for the given channels
+        :param limit: how many joins can be sent every PERIOD seconds
+        :param on_give_up: called with the name of each channel whose join was given up on
+        """
+        self._join: Callable[[list[str]], Awaitable[None]] = join
+        self._on_give_up: Optional[Callable[[str], None]] = on_give_up
+        # Half of the limit can be used in a burst, and the rest is spread out, so that no window of PERIOD seconds
+        #  ever holds more than 'limit' joins
+        self._bucket: TokenBucket = TokenBucket(limit // 2, (limit - limit // 2) / JoinScheduler.PERIOD)
+        self._joins: Dict[str, _PendingJoin] = {}
+        # When someone last chatted in each channel, so that the most active channels are joined again first
+        self._last_active: Dict[str, float] = {}
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._joiner: Optional[asyncio.Task] = None
+        # How many joins succeeded ('joined'), were retried ('retried') or were given up on ('gave_up')
+        self.outcome_counts: Dict[str, int] = {"joined": 0, "retried": 0, "gave_up": 0}
+
+    def progress(self) -> Dict[str, int]:
+        """
+        :return: how many channels are waiting to be joined ('queued'), and how many are waiting for Twitch to confirm
+            that they were joined ('in_flight')
+        """
+        in_flight: int = sum(pending.sent for pending in self._joins.values())
+        return {"queued": len(self._joins) - in_flight, "in_flight": in_flight}
+
+    def note_activity(self, channel: str) -> None:
+        """
+        :param channel: the name of a channel that someone just chatted in
+        """
+        self._last_active[channel] = time.monotonic()
+
+    def schedule(self, channel: str, priority: JoinPriority = JoinPriority.OFFLINE) -> bool:
+        """
+        Queues a channel to be joined; a channel that is already queued is moved up if 'priority' is more urgent
+        :param channel: the name of the channel to join
+        :param priority: how urgently the channel should be joined
+        :return: whether the channel was not already queued
+        """
+        channel = channel.lower()
+        queued: Optional[_PendingJoin] = self._joins.get(channel)
+        if queued is None:
+            self._joins[channel] = _PendingJoin(priority, self._last_active.get(channel, 0.0), 0.0, 0)
+        elif priority < queued.priority and not queued.sent:
+            # Asked for again, so there is no point in waiting out any backoff
+            self._joins[channel] = queued._replace(priority=priority, not_before=0.0)
+        self._wakeup.set()
+        if self._joiner is None or self._joiner.done():
+            self._joiner = asyncio.create_task(self._join_queued())
+        return queued is None
+
+    def cancel(self, channel: str) -> None:
+        """
+        :param channel: the name of a channel which should no longer be joined (e.g. because it is being left)
+        """
+        self._joins.pop(channel.lower(), None)
+
+    def joined(self, channel: str) -> None:
+        """
+        :param channel: the name of a channel that Twitch confirmed the bot has joined
+        """
+        pending: Optional[_PendingJoin] = self._joins.get(channel.lower())
+        if pending is not None and pending.sent:
+            del self._joins[channel.lower()]
+            self.outcome_counts["joined"] += 1
+
+    def failed(self, channel: str) -> None:
+        """
+        Queues a channel whose join failed to be tried again later, unless it has failed too many times already
+        :param channel: the name of the channel that could not be joined
+        """
+        channel = channel.lower()
+        pending: Optional[_PendingJoin] = self._joins.get(channel)
+        if pending is None or not pending.sent:
+            return
+        failures: int = pending.attempts + 1
+        if failures >= JoinScheduler.MAX_ATTEMPTS:
+            del self._joins[channel]
+            self.outcome_counts["gave_up"] += 1
+            _LOG.warning("Gave up joining %s after %d attempts", channel, failures)
+            if self._on_give_up is not None:
+                self._on_give_up(channel)
+            return
+        self.outcome_counts["retried"] += 1
+        # Jittered, so that channels which failed together are not all retried at the same moment
+        backoff: float = min(JoinScheduler.MAX_BACKOFF, JoinScheduler.BASE_BACKOFF * 2 ** (failures - 1))
+        self._joins[channel] = pending._replace(not_before=time.monotonic() + backoff * random.uniform(0.5, 1.5),
+                                                attempts=failures, sent=False)
+        self.schedule(channel, pending.priority)
+
+    async def _join_queued(self) -> None:
+        """
+        Joins queued channels as fast as the rate limit allows, until there are none left
+        """
+        while any(not pending.sent for pending in self._joins.values()):
+            self._wakeup.clear()
+            channel, wait = self._next_joinable(time.monotonic())
+            if channel is not None:
+                await self._send_join(channel)
+            else:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _next_joinable(self, now: float) -> Tuple[Optional[str], float]:
+        """
+        Takes the most urgent channel which is not waiting out a backoff off the queue
+        :return: the channel to join now, if there is one; otherwise, for how long (in seconds) nothing can be joined
+        """
+        wait: float = self._bucket.wait_time(now)
+        if wait > 0:
+            return None, wait
+        queued: list[Tuple[str, _PendingJoin]] = [(channel, pending) for channel, pending in self._joins.items()
+                                                  if not pending.sent]
+        ready: list[Tuple[str, _PendingJoin]] = [(channel, pending) for channel, pending in queued
+                                                 if pending.not_before <= now]
+        if not ready:
+            return None, min(pending.not_before for _, pending in queued) - now
+        channel, pending = min(ready, key=lambda item: item[1].rank())
+        self._bucket.take()
+        self._joins[channel] = pending._replace(sent=True)
+        return channel, 0.0
+
+    async def _send_join(self, channel: str) -> None:
+        try:
+            await self._join([channel])
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            _LOG.warning("Could not send the join for %s: %s", channel, error)
+            self.failed(channel)
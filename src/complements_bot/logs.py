@@ -0,0 +1,142 @@
+"""
+Sets up logging so that writing logs never blocks the event loop: records are handed to a queue, and written out as
+JSON lines by a background thread
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from ..env_reader import LOG_CHAT_SAMPLE_RATE, LOG_FILE, LOG_LEVEL, LOG_LEVELS
+
+# Every chat message seen by the bot is logged to this category, which is by far the busiest one
+CHAT: str = "complements_bot.chat"
+# Complements sent out
+COMPLEMENTS: str = "complements_bot.complements"
+# Replies to commands
+COMMANDS: str = "complements_bot.commands"
+# Anything else the bot wants to say
+BOT: str = "complements_bot.bot"
+# Messages which took too long to handle, along with where the time went
+TRACES: str = "complements_bot.traces"
+
+# The attributes every log record has; anything else on a record was passed in through 'extra'
+_RECORD_ATTRIBUTES: frozenset[str] = frozenset(logging.LogRecord("", 0, "", 0, "", None, None).__dict__) | {
+    "message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats each record as one line of JSON, including any fields passed in through 'extra'
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "category": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through only a random fraction of the records below WARNING; warnings and errors always get through
+    """
+
+    def __init__(self, rate: float) -> None:
+        """
+        :param rate: the fraction of records to let through, from 0 (none) to 1 (all)
+        """
+        super().__init__()
+        assert 0 <= rate <= 1
+        self.rate: float = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+def parse_levels(levels: Optional[str]) -> Dict[str, str]:
+    """
+    :param levels: comma-separated 'category=LEVEL' pairs, where category is one of 'chat', 'complements', 'commands',
+        'bot' or 'traces' (or the full name of any other logger), e.g. 'chat=WARNING,commands=DEBUG'
+    :return: the level of each logger named
+    """
+    parsed: Dict[str, str] = {}
+    for pair in (levels or "").split(","):
+        if "=" not in pair:
+            continue
+        category, level = (part.strip() for part in pair.split("=", 1))
+        parsed[category if "." in category else f"complements_bot.{category}"] = level.upper()
+    return parsed
+
+
+def configure_logging(filename: Optional[str] = None,
+                      level: str = "INFO",
+                      levels: Optional[Dict[str, str]] = None,
+                      chat_sample_rate: float = 1.0,
+                      *,
+                      max_bytes: int = 50_000_000,
+                      backup_count: int = 3) -> logging.handlers.QueueListener:
+    """
+    Routes all logging through a queue to a background thread, which writes JSON lines to stderr and, optionally, to a
+        rotating file
+    :param filename: the file to log to as well as stderr, if any; it is rotated once it reaches 'max_bytes'
+    :param level: the level of the root logger
+    :param levels: the levels of individual loggers, overriding 'level'
+    :param chat_sample_rate: the fraction of chat messages to log (below WARNING)
+    :param max_bytes: how large the log file may get before it is rotated
+    :param backup_count: how many rotated log files to keep
+    :return: the listener writing the logs; stop it before exiting, so that everything queued is written
+    """
+    formatter: JsonFormatter = JsonFormatter()
+    handlers: list[logging.Handler] = [logging.StreamHandler(sys.stderr)]
+    if filename:
+        handlers.append(logging.handlers.RotatingFileHandler(filename, maxBytes=max_bytes, backupCount=backup_count,
+                                                             encoding="utf-8"))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    root: logging.Logger = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level.upper())
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    chat_logger: logging.Logger = logging.getLogger(CHAT)
+    for log_filter in chat_logger.filters[:]:
+        if isinstance(log_filter, SamplingFilter):
+            chat_logger.removeFilter(log_filter)
+    if chat_sample_rate < 1:
+        chat_logger.addFilter(SamplingFilter(chat_sample_rate))
+
+    listener: logging.handlers.QueueListener = logging.handlers.QueueListener(log_queue, *handlers,
+                                                                              respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def configure_logging_from_env(file_suffix: str = "") -> logging.handlers.QueueListener:
+    """
+    'configure_logging', set up from the LOG_* settings
+    :param file_suffix: added to the end of LOG_FILE, so that several processes do not rotate the same file
+    :return: the listener writing the logs; stop it before exiting, so that everything queued is written
+    """
+    return configure_logging(f"{LOG_FILE}{file_suffix}" if LOG_FILE else None,
+                             LOG_LEVEL or "INFO",
+                             parse_levels(LOG_LEVELS),
+                             float(LOG_CHAT_SAMPLE_RATE or 1))
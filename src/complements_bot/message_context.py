@@ -0,0 +1,73 @@
+"""
+Remembers the lookups made while handling a chat message (user ids, channel settings, ignore status), so that the
+random complement and any command in the message share them instead of each making their own
+"""
+
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+from ..metrics import CACHE_REQUESTS
+
+_T = TypeVar("_T")
+
+
+class MessageContext:
+    """
+    The lookups made so far while handling one chat message; a lookup still underway is waited for rather than made
+    again
+    """
+
+    def __init__(self, message: Any) -> None:
+        """
+        :param message: the message being handled
+        """
+        self.message: Any = message
+        self._lookups: Dict[str, asyncio.Future] = {}
+
+    async def get(self, key: str, load: Callable[[], Awaitable[_T]]) -> _T:
+        """
+        :param key: what is being looked up, e.g. 'settings:<user id>'
+        :param load: makes the lookup, if it has not been made yet while handling the message
+        :return: the result of the lookup
+        """
+        lookup: Optional[asyncio.Future] = self._lookups.get(key)
+        CACHE_REQUESTS.inc(cache="message_context", result="miss" if lookup is None else "hit")
+        if lookup is None:
+            lookup = asyncio.ensure_future(load())
+            self._lookups[key] = lookup
+        # Shielded, so that one of the parts of handling the message giving up does not cancel it for the others
+        return await asyncio.shield(lookup)
+
+
+# The message currently being handled; tasks started while handling it copy this, so they share its lookups
+_CURRENT_MESSAGE: ContextVar[Optional[MessageContext]] = ContextVar("current_message", default=None)
+
+
+@contextmanager
+def handling(message: Any) -> Iterator[MessageContext]:
+    """
+    Shares lookups made about 'message' for as long as the body of the 'with' block runs
+    :param message: the message about to be handled
+    :return: the message's context
+    """
+    context: MessageContext = MessageContext(message)
+    token = _CURRENT_MESSAGE.set(context)
+    try:
+        yield context
+    finally:
+        _CURRENT_MESSAGE.reset(token)
+
+
+async def memoized(message: Any, key: str, load: Callable[[], Awaitable[_T]]) -> _T:
+    """
+    :param message: the message the lookup is being made for
+    :param key: what is being looked up; the same key must always mean the same lookup for the same message
+    :param load: makes the lookup
+    :return: the result of the lookup; made at most once while 'message' is being handled, and every time otherwise
+    """
+    context: Optional[MessageContext] = _CURRENT_MESSAGE.get()
+    if context is None or context.message is not message:
+        return await load()
+    return await context.get(key, load)
@@ -0,0 +1,196 @@
+"""
+Resolves Twitch usernames to user ids and back, with as few Helix requests as possible
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from ..metrics import CACHE_REQUESTS, HELIX_LATENCY
+
+
+class _ExpiringLRUCache:
+    """
+    A bounded mapping whose entries expire after a while; once full, the least recently used entry makes room
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size: int = max_size
+        self._entries: OrderedDict[str, Tuple[float, Optional[str]]] = OrderedDict()
+
+    def get(self, key: str) -> Tuple[bool, Optional[str]]:
+        """
+        :return: whether 'key' is cached (and not expired), and if it is, its value
+        """
+        entry: Optional[Tuple[float, Optional[str]]] = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def put(self, key: str, value: Optional[str], ttl: float) -> None:
+        """
+        :param key: what the value is looked up by
+        :param value: what to cache
+        :param ttl: for how long (in seconds) the entry can be trusted
+        """
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+
+class _BatchLoader:
+    """
+    Collects lookups made at about the same time, so that they can be sent together in as few requests as possible;
+    a key which is already being looked up is not looked up again, but waits for the lookup underway
+    """
+
+    def __init__(self, fetch: Callable[[list[str]], Awaitable[Dict[str, str]]], max_batch_size: int, delay: float) -> None:
+        """
+        :param fetch: looks up a list of keys, returning what was found for each of them
+        :param max_batch_size: how many keys may be looked up in a single request
+        :param delay: how long (in seconds) to wait for more lookups after the first one
+        """
+        self._fetch: Callable[[list[str]], Awaitable[Dict[str, str]]] = fetch
+        self._max_batch_size: int = max_batch_size
+        self._delay: float = delay
+        self._pending: Dict[str, asyncio.Future[Optional[str]]] = {}
+        self._in_flight: Dict[str, asyncio.Future[Optional[str]]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+
+    async def load(self, key: str) -> Optional[str]:
+        """
+        :return: what was found for 'key', or 'None' if nothing was
+        """
+        future: Optional[asyncio.Future[Optional[str]]] = self._in_flight.get(key) or self._pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._pending[key] = future
+            if self._flush_task is None:
+                self._flush_task = asyncio.create_task(self._flush())
+        return await asyncio.shield(future)
+
+    async def _flush(self) -> None:
+        """
+        Sends everything that was collected, in batches of at most 'max_batch_size' keys
+        """
+        await asyncio.sleep(self._delay)
+        pending, self._pending, self._flush_task = self._pending, {}, None
+        self._in_flight.update(pending)
+        keys: list[str] = list(pending)
+        await asyncio.gather(*(self._load_batch({key: pending[key] for key in keys[i:i + self._max_batch_size]})
+                               for i in range(0, len(keys), self._max_batch_size)))
+
+    async def _load_batch(self, futures: Dict[str, asyncio.Future[Optional[str]]]) -> None:
+        try:
+            found: Dict[str, str] = await self._fetch(list(futures))
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            for future in futures.values():
+                if not future.done():
+                    future.set_exception(error)
+        else:
+            for key, future in futures.items():
+                if not future.done():
+                    future.set_result(found.get(key))
+        finally:
+            for key in futures:
+                self._in_flight.pop(key, None)
+
+
+class UserResolver:
+    """
+    Turns usernames into user ids and back; lookups made at about the same time are sent as one Helix request of up
+    to 100 users, and results are cached in both directions
+    """
+
+    MAX_USERS_PER_REQUEST: int = 100
+
+    def __init__(self,
+                 fetch_users: Callable[..., Awaitable[list[Any]]],
+                 *,
+                 max_size: int = 10_000,
+                 ttl: float = 60.0 * 60.0,
+                 negative_ttl: float = 60.0,
+                 batch_delay: float = 0.0) -> None:
+        """
+        :param fetch_users: the bot's 'fetch_users', taking either 'names' or 'ids'
+        :param max_size: how many users to remember in each direction
+        :param ttl: for how long (in seconds) a found user is remembered; usernames can change, so not forever
+        :param negative_ttl: for how long (in seconds) a user that could not be found is remembered as such
+        :param batch_delay: how long (in seconds) to wait for more lookups before sending a request
+        """
+        self._fetch_users: Callable[..., Awaitable[list[Any]]] = fetch_users
+        self._ttl: float = ttl
+        self._negative_ttl: float = negative_ttl
+        self._ids: _ExpiringLRUCache = _ExpiringLRUCache(max_size)
+        self._names: _ExpiringLRUCache = _ExpiringLRUCache(max_size)
+        self._id_loader: _BatchLoader = _BatchLoader(self._fetch_ids, UserResolver.MAX_USERS_PER_REQUEST, batch_delay)
+        self._name_loader: _BatchLoader = _BatchLoader(self._fetch_names, UserResolver.MAX_USERS_PER_REQUEST, batch_delay)
+
+    async def name_to_id(self, username: str) -> Optional[str]:
+        """
+        :param username: the username of the user whose user id we want
+        :return: the user id of the specified user, if the user exists; otherwise 'None'
+        """
+        login: str = username.lower()
+        is_cached, userid = self._ids.get(login)
+        CACHE_REQUESTS.inc(cache="user_ids", result="hit" if is_cached else "miss")
+        if is_cached:
+            return userid
+        return await self._id_loader.load(login)
+
+    async def id_to_name(self, userid: str) -> Optional[str]:
+        """
+        :param userid: the user id of the user whose username we want
+        :return: the username of the specified user, if the user exists; otherwise 'None'
+        """
+        if not userid.isdigit():
+            return None
+        is_cached, username = self._names.get(userid)
+        CACHE_REQUESTS.inc(cache="usernames", result="hit" if is_cached else "miss")
+        if is_cached:
+            return username
+        return await self._name_loader.load(userid)
+
+    def remember(self, userid: str, username: str) -> None:
+        """
+        Caches a user whose id and username were learnt some other way (e.g. from a chat message)
+        """
+        self._ids.put(username.lower(), userid, self._ttl)
+        self._names.put(userid, username.lower(), self._ttl)
+
+    async def _fetch_ids(self, logins: list[str]) -> Dict[str, str]:
+        with HELIX_LATENCY.time(endpoint="users"):
+            users: list[Any] = await self._fetch_users(names=logins)
+        found: Dict[str, str] = {user.name.lower(): str(user.id) for user in users}
+        self._store(found.items(), logins, self._ids)
+        self._store(((userid, login) for login, userid in found.items()), [], self._names)
+        return found
+
+    async def _fetch_names(self, userids: list[str]) -> Dict[str, str]:
+        with HELIX_LATENCY.time(endpoint="users"):
+            users: list[Any] = await self._fetch_users(ids=list(map(int, userids)))
+        found: Dict[str, str] = {str(user.id): user.name.lower() for user in users}
+        self._store(((username, userid) for userid, username in found.items()), [], self._ids)
+        self._store(found.items(), userids, self._names)
+        return found
+
+    def _store(self, found: Any, looked_up: list[str], cache: _ExpiringLRUCache) -> None:
+        """
+        :param found: the (key, value) pairs that were found
+        :param looked_up: every key that was looked up; those not found are cached as missing
+        :param cache: where to cache the results
+        """
+        found_keys: set[str] = set()
+        for key, value in found:
+            found_keys.add(key)
+            cache.put(key, value, self._ttl)
+        for key in looked_up:
+            if key not in found_keys:
+                cache.put(key, None, self._negative_ttl)
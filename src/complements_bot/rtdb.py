@@ -0,0 +1,196 @@
+"""
+An asyncio client for the Firebase Realtime Database REST API, so that database requests do not each need a thread
+"""
+
+import asyncio
+import copy
+import json
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import aiohttp
+from firebase_admin import credentials
+
+from ..metrics import DATABASE_LATENCY
+from .tracing import span
+
+
+class RTDBError(Exception):
+    """
+    Raised when the database responds to a request with an error
+    """
+
+    def __init__(self, status: int, message: str) -> None:
+        super().__init__(f"{status}: {message}")
+        self.status: int = status
+
+
+class TransactionAbortedError(RTDBError):
+    """
+    Raised when a transaction could not be committed because the data kept changing underneath it
+    """
+
+    def __init__(self, path: str, tries: int) -> None:
+        super().__init__(409, f"transaction on '{path}' aborted after {tries} tries")
+
+
+class AsyncRTDBClient:
+    """
+    Talks to the database over a pool of kept-alive connections, with a limit on how many requests may be in flight
+    at once
+    """
+
+    # Refresh the access token this long before it expires, so that no request is sent with an expired one
+    TOKEN_REFRESH_MARGIN: timedelta = timedelta(minutes=5)
+    MAX_TRANSACTION_TRIES: int = 25
+
+    def __init__(self,
+                 database_url: str,
+                 credential: credentials.Certificate,
+                 *,
+                 max_connections: int = 20,
+                 max_concurrent_requests: int = 50,
+                 keepalive_timeout: float = 60.0,
+                 request_timeout: float = 10.0) -> None:
+        """
+        :param database_url: the URL of the database, as given in the Firebase console
+        :param credential: the service account credential used to authenticate requests
+        :param max_connections: the size of the connection pool
+        :param max_concurrent_requests: how many requests may be in flight at once; any more wait their turn
+        :param keepalive_timeout: how long (in seconds) an idle connection is kept open for
+        :param request_timeout: how long (in seconds) a single request may take
+        """
+        self._url: str = database_url.rstrip("/")
+        self._credential: credentials.Certificate = credential
+        self._connector_options: Dict[str, Any] = {"limit": max_connections, "keepalive_timeout": keepalive_timeout}
+        self._request_timeout: float = request_timeout
+        self._semaphore: asyncio.Semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._token: Optional[credentials.AccessTokenInfo] = None
+
+    async def start(self) -> None:
+        """
+        Opens the connection pool and warms it up, so that the first real request does not pay for fetching an access
+        token and setting up a TLS connection
+        """
+        await self._session_or_start()
+        await self.get("", shallow=True)
+
+    async def close(self) -> None:
+        """
+        Closes every connection in the pool
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def get(self, path: str, shallow: bool = False) -> Any:
+        """
+        :param path: the location in the database to read
+        :param shallow: if True, only the keys of the children are read, with 'True' in place of their values
+        :return: the data at 'path', or 'None' if there is none
+        """
+        params: Dict[str, str] = {"shallow": "true"} if shallow else {}
+        _, data, _ = await self._request("GET", path, params=params)
+        return data
+
+    async def get_with_etag(self, path: str) -> Tuple[Any, str]:
+        """
+        :param path: the location in the database to read
+        :return: the data at 'path', and the ETag that identifies this version of it
+        """
+        _, data, etag = await self._request("GET", path, headers={"X-Firebase-ETag": "true"})
+        assert etag
+        return data, etag
+
+    async def set(self, path: str, value: Any) -> None:
+        """
+        :param path: the location in the database to write to
+        :param value: the new data for 'path'; 'None' deletes it
+        """
+        await self._request("PUT", path, body=value, params={"print": "silent"})
+
+    async def update(self, path: str, values: Dict[str, Any]) -> None:
+        """
+        :param path: the location in the database to update
+        :param values: children of 'path' to write; the keys may themselves be paths, which makes this a single, atomic
+            write to many locations
+        """
+        await self._request("PATCH", path, body=values, params={"print": "silent"})
+
+    async def delete(self, path: str) -> None:
+        """
+        :param path: the location in the database to delete
+        """
+        await self._request("DELETE", path, params={"print": "silent"})
+
+    async def transaction(self, path: str, transaction_update: Callable[[Any], Any]) -> Any:
+        """
+        Atomically changes the data at 'path'; the write only goes through if nobody else wrote in between the read and
+        the write, otherwise 'transaction_update' is run again on the newer data
+        :param path: the location in the database to change
+        :param transaction_update: given the current data at 'path', returns the new data; an exception raised here
+            aborts the transaction
+        :return: the data that was written
+        """
+        data, etag = await self.get_with_etag(path)
+        for _ in range(AsyncRTDBClient.MAX_TRANSACTION_TRIES):
+            # Given a copy, as callers may change the data in place, which would hide the change from the check below
+            new_data = transaction_update(copy.deepcopy(data))
+            if new_data == data:
+                # Nothing would change, so there is nothing to write
+                return new_data
+            status, current, new_etag = await self._request(
+                    "PUT", path, body=new_data, headers={"if-match": etag, "X-Firebase-ETag": "true"}, ok_statuses=(412,)
+            )
+            if status != 412:
+                return new_data
+            # Someone else wrote to 'path' first; try again with what they wrote
+            assert new_etag
+            data, etag = current, new_etag
+        raise TransactionAbortedError(path, AsyncRTDBClient.MAX_TRANSACTION_TRIES)
+
+    async def _session_or_start(self) -> aiohttp.ClientSession:
+        """
+        :return: the session holding the connection pool; it is created if it does not exist yet
+        """
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(**self._connector_options),
+                    timeout=aiohttp.ClientTimeout(total=self._request_timeout)
+            )
+        return self._session
+
+    async def _access_token(self) -> str:
+        """
+        :return: an OAuth2 access token for the service account, refreshed (off the event loop) when close to expiring
+        """
+        token: Optional[credentials.AccessTokenInfo] = self._token
+        if token is None or token.expiry - AsyncRTDBClient.TOKEN_REFRESH_MARGIN < datetime.utcnow():
+            token = await asyncio.get_running_loop().run_in_executor(None, self._credential.get_access_token)
+            self._token = token
+        assert token
+        return token.access_token
+
+    async def _request(self,
+                       method: str,
+                       path: str,
+                       *,
+                       body: Any = None,
+                       params: Optional[Dict[str, str]] = None,
+                       headers: Optional[Dict[str, str]] = None,
+                       ok_statuses: Tuple[int, ...] = ()) -> Tuple[int, Any, Optional[str]]:
+        """
+        :return: the status code, the decoded body, and the ETag header (if any) of the response
+        """
+        session: aiohttp.ClientSession = await self._session_or_start()
+        all_headers: Dict[str, str] = {"Authorization": f"Bearer {await self._access_token()}", **(headers or {})}
+        data: Optional[str] = None if method in ("GET", "DELETE") else json.dumps(body)
+        with DATABASE_LATENCY.time(method=method), span(f"firebase.{method}", path=path):
+            async with self._semaphore:
+                async with session.request(method, f"{self._url}/{path.strip('/')}.json",
+                                           data=data, params=params, headers=all_headers) as response:
+                    text: str = await response.text()
+                    if response.status >= 400 and response.status not in ok_statuses:
+                        raise RTDBError(response.status, text)
+                    return response.status, (json.loads(text) if text else None), response.headers.get("ETag")
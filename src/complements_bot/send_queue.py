@@ -0,0 +1,272 @@
+"""
+Paces everything the bot sends to chat, so that it stays within Twitch's rate limits
+"""
+
+import asyncio
+import time
+from collections import Counter
+from enum import IntEnum
+from typing import Any, Dict, Optional, Protocol, Tuple
+
+from .tracing import traced
+
+
+class Destination(Protocol):
+    """
+    Anywhere a message can be sent to (e.g. a TwitchIO channel)
+    """
+
+    @property
+    def name(self) -> str:
+        """
+        :return: the name of the channel; messages to the same name share that channel's rate limit
+        """
+
+    async def send(self, content: str) -> Any:
+        """
+        :param content: the message to send
+        """
+
+
+class Priority(IntEnum):
+    """
+    In which order queued messages are sent; lower values go first
+    """
+
+    COMMAND_REPLY = 0
+    RANDOM_COMPLEMENT = 1
+
+
+class TokenBucket:
+    """
+    Allows bursts of up to 'capacity' messages, after which messages can only go out at 'rate' per second
+    """
+
+    def __init__(self, capacity: float, rate: float) -> None:
+        self._capacity: float = capacity
+        self._rate: float = rate
+        self._tokens: float = capacity
+        self._updated: float = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        """
+        :return: for how long (in seconds) from 'now' there will not be a token to take; 0 if one can be taken already
+        """
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated) * self._rate)
+        self._updated = now
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self._rate
+
+    def take(self) -> None:
+        """
+        Uses up a token; 'wait_time' must have just returned 0
+        """
+        self._tokens -= 1
+
+
+class _Outgoing:
+    """
+    A queued message, which may be made up of several messages joined together
+    """
+
+    def __init__(self,
+                 priority: Priority,
+                 destination: Destination,
+                 content: str,
+                 *,
+                 deadline: Optional[float],
+                 join_prefix: Optional[str],
+                 not_before: float) -> None:
+        """
+        :param priority: how urgent the message is compared to others waiting to be sent
+        :param destination: where to send the message
+        :param content: the message to send
+        :param deadline: when the message stops being worth sending, if ever
+        :param join_prefix: if not None, other messages starting with this prefix may be joined onto this one, without
+            repeating the prefix
+        :param not_before: the message is held until then, so that other messages get the chance to be joined onto it
+        """
+        self.priority: Priority = priority
+        self.destination: Destination = destination
+        self.content: str = content
+        self.deadline: Optional[float] = deadline
+        self.join_prefix: Optional[str] = join_prefix
+        self.not_before: float = not_before
+        # One future for each of the messages joined into this one
+        self.sent: list[asyncio.Future] = []
+
+    def join(self, content: str, priority: Priority, destination: Destination, join_prefix: str, max_length: int) -> bool:
+        """
+        :return: whether 'content' could be joined onto the end of this message (and if so, it has been); it can if both
+            are going to the same channel, with the same priority and prefix, and the result fits in 'max_length'
+        """
+        if (self.join_prefix is None or join_prefix != self.join_prefix or priority != self.priority or
+                destination.name != self.destination.name):
+            return False
+        joined: str = f"{self.content} {content[len(join_prefix):]}"
+        if len(joined) > max_length:
+            return False
+        self.content = joined
+        return True
+
+    def set_result(self, was_sent: bool) -> None:
+        """
+        Lets everyone waiting on any part of this message know whether it was sent
+        """
+        for sent in self.sent:
+            if not sent.done():
+                sent.set_result(was_sent)
+
+
+class SendQueue:
+    """
+    Sends messages in order of priority, no faster than Twitch allows: a connection may send 'limit' messages every 30
+    seconds (20 normally, 100 when the bot is a moderator or verified), and at most one message a second to any single
+    channel. Messages which are given a deadline are dropped if they cannot be sent in time. Optionally, messages which
+    allow it are held for a short while, so that others sent to the same channel meanwhile can be joined onto them and
+    go out as a single message
+    """
+
+    PERIOD: float = 30.0
+    CHANNEL_RATE: float = 1.0
+    # Twitch does not accept longer messages
+    MAX_MESSAGE_LENGTH: int = 500
+
+    def __init__(self, limit: int = 20, join_window: float = 0.0) -> None:
+        """
+        :param limit: how many messages the connection may send every 'PERIOD' seconds
+        :param join_window: for how long (in seconds) at most a message which allows others to be joined onto it is held
+            back, waiting for them; 0 never joins messages
+        """
+        assert limit >= 2
+        # Half the limit can go out in a burst, the other half refills over the period, so that no 'PERIOD' seconds
+        #  ever see more than 'limit' messages
+        self._connection_bucket: TokenBucket = TokenBucket(limit // 2, (limit - limit // 2) / SendQueue.PERIOD)
+        self._channel_buckets: Dict[str, TokenBucket] = {}
+        self._queue: list[_Outgoing] = []
+        self._wakeup: asyncio.Event = asyncio.Event()
+        self._sender: Optional[asyncio.Task] = None
+        self.join_window: float = join_window
+        # How many messages of each priority were sent, dropped, or joined onto another, keyed by (outcome, priority)
+        self.outcome_counts: Counter[Tuple[str, str]] = Counter()
+
+    def depth(self) -> Dict[str, int]:
+        """
+        :return: how many messages of each priority are waiting to be sent (counting joined messages as one)
+        """
+        depths: Dict[str, int] = {priority.name.lower(): 0 for priority in Priority}
+        for outgoing in self._queue:
+            depths[outgoing.priority.name.lower()] += 1
+        return depths
+
+    @traced("send_queue.send")
+    async def send(self,
+                   destination: Destination,
+                   content: str,
+                   priority: Priority = Priority.COMMAND_REPLY,
+                   timeout: Optional[float] = None,
+                   join_prefix: Optional[str] = None) -> bool:
+        """
+        :param destination: where to send the message
+        :param content: the message to send
+        :param priority: how urgent the message is compared to others waiting to be sent
+        :param timeout: for how long (in seconds) the message is worth sending; if None, it will wait as long as it takes
+        :param join_prefix: if not None, the message may be joined with others sent with the same prefix (which must
+            start each of them), which then only appears once, at the start of the joined message
+        :return: whether the message was sent (rather than dropped for being stale)
+        """
+        now: float = time.monotonic()
+        sent: asyncio.Future = asyncio.get_running_loop().create_future()
+        if self.join_window <= 0 or join_prefix is None or not content.startswith(join_prefix):
+            join_prefix = None
+        outgoing: Optional[_Outgoing] = None
+        if join_prefix is not None:
+            outgoing = next((queued for queued in self._queue
+                             if queued.join(content, priority, destination, join_prefix, SendQueue.MAX_MESSAGE_LENGTH)),
+                            None)
+        if outgoing is None:
+            outgoing = _Outgoing(priority, destination, content,
+                                 deadline=None if timeout is None else now + timeout,
+                                 join_prefix=join_prefix,
+                                 not_before=now + (self.join_window if join_prefix is not None else 0.0))
+            self._queue.append(outgoing)
+        else:
+            self.outcome_counts["joined", priority.name.lower()] += 1
+        outgoing.sent.append(sent)
+
+        self._wakeup.set()
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.create_task(self._send_queued())
+        return await sent
+
+    async def _send_queued(self) -> None:
+        """
+        Sends queued messages as fast as the rate limits allow, until there are none left
+        """
+        while self._queue:
+            self._wakeup.clear()
+            outgoing, wait = self._next_sendable(time.monotonic())
+            if outgoing is not None:
+                await self._deliver(outgoing)
+            elif wait > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    def _next_sendable(self, now: float) -> Tuple[Optional[_Outgoing], float]:
+        """
+        Drops stale messages, then takes the most urgent message which is neither being held back nor going to a
+            channel being rate limited off the queue
+        :return: the message to send now, if there is one; otherwise, for how long (in seconds) nothing can be sent
+        """
+        self._drop_stale(now)
+        wait: float = self._connection_bucket.wait_time(now)
+        if not self._queue or wait > 0:
+            return None, wait
+
+        wait = SendQueue.CHANNEL_RATE
+        # 'sorted' is stable, so messages of the same priority stay in the order in which they were queued
+        for outgoing in sorted(self._queue, key=lambda queued: queued.priority):
+            channel_bucket: TokenBucket = self._channel_bucket(outgoing.destination.name)
+            outgoing_wait: float = max(outgoing.not_before - now, channel_bucket.wait_time(now))
+            if outgoing_wait <= 0:
+                self._connection_bucket.take()
+                channel_bucket.take()
+                self._queue.remove(outgoing)
+                return outgoing, 0.0
+            wait = min(wait, outgoing_wait)
+        return None, wait
+
+    def _channel_bucket(self, channel: str) -> TokenBucket:
+        """
+        :return: the bucket limiting how fast messages can be sent to 'channel'
+        """
+        bucket: Optional[TokenBucket] = self._channel_buckets.get(channel)
+        if bucket is None:
+            bucket = TokenBucket(1, SendQueue.CHANNEL_RATE)
+            self._channel_buckets[channel] = bucket
+        return bucket
+
+    def _drop_stale(self, now: float) -> None:
+        """
+        Drops every queued message whose deadline has passed
+        """
+        fresh: list[_Outgoing] = []
+        for outgoing in self._queue:
+            if outgoing.deadline is not None and outgoing.deadline < now:
+                self.outcome_counts["dropped", outgoing.priority.name.lower()] += len(outgoing.sent)
+                outgoing.set_result(False)
+            else:
+                fresh.append(outgoing)
+        self._queue = fresh
+
+    async def _deliver(self, outgoing: _Outgoing) -> None:
+        try:
+            await outgoing.destination.send(outgoing.content)
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            for sent in outgoing.sent:
+                if not sent.done():
+                    sent.set_exception(error)
+        else:
+            self.outcome_counts["sent", outgoing.priority.name.lower()] += len(outgoing.sent)
+            outgoing.set_result(True)
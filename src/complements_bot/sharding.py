@@ -0,0 +1,303 @@
+"""
+Splits the joined channels between several bot processes on one host, so that chat throughput is not capped by what a
+single core can handle: a supervisor starts the workers, each of which only joins the channels it owns, and passes
+messages between them
+"""
+
+import asyncio
+import bisect
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import threading
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional
+
+from . import logs
+from .bot import ComplementsBot
+from .join_scheduler import JoinScheduler
+from .send_queue import SendQueue
+from ..app.app import run_hypercorn_app, set_metrics_source
+from ..env_reader import COMPLEMENT_BATCH_WINDOW_MS, TWITCH_JOIN_LIMIT, TWITCH_MESSAGE_LIMIT
+from ..metrics import REGISTRY, merge_rendered, monitor_event_loop_lag
+
+_LOG: logging.Logger = logging.getLogger(logs.BOT)
+
+
+class HashRing:
+    """
+    Consistent hashing: every node is placed at many pseudo-random points on a ring, and a key belongs to the node at
+    the first point at or after the key's own hash; so adding or removing one of N nodes only moves about 1/N of the keys
+    """
+
+    def __init__(self, nodes: Iterable[str] = (), virtual_nodes: int = 64) -> None:
+        """
+        :param nodes: the nodes to start with
+        :param virtual_nodes: at how many points each node is placed; more points spread keys more evenly
+        """
+        self._virtual_nodes: int = virtual_nodes
+        self._nodes: set[str] = set(nodes)
+        self._points: list[int] = []
+        self._owners: list[str] = []
+        self._rebuild()
+
+    @staticmethod
+    def hash(key: str) -> int:
+        """
+        :return: where on the ring 'key' is; unlike the built-in 'hash', the same in every process
+        """
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    @property
+    def nodes(self) -> frozenset[str]:
+        """
+        :return: every node on the ring
+        """
+        return frozenset(self._nodes)
+
+    def add(self, node: str) -> None:
+        """
+        :param node: the node to put on the ring
+        """
+        if node not in self._nodes:
+            self._nodes.add(node)
+            self._rebuild()
+
+    def remove(self, node: str) -> None:
+        """
+        :param node: the node to take off the ring
+        """
+        if node in self._nodes:
+            self._nodes.remove(node)
+            self._rebuild()
+
+    def owner(self, key: str) -> Optional[str]:
+        """
+        :return: the node 'key' belongs to, or None if there are no nodes
+        """
+        if not self._points:
+            return None
+        return self._owners[bisect.bisect_left(self._points, HashRing.hash(key)) % len(self._points)]
+
+    def _rebuild(self) -> None:
+        points: list[tuple[int, str]] = sorted((HashRing.hash(f"{node}#{i}"), node)
+                                               for node in self._nodes for i in range(self._virtual_nodes))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+
+class ShardMessage(NamedTuple):
+    """
+    What the supervisor and the workers tell each other
+    """
+    # 'join' or 'leave' a channel (sent by any worker to the supervisor, which passes it on to the worker owning the
+    #  channel), 'metrics' (a request for a worker's metrics) or 'metrics_reply'
+    kind: str
+    userid: str = ""
+    username: str = ""
+    request_id: int = 0
+    payload: str = ""
+
+
+def _read_messages(connection: Connection,
+                   loop: asyncio.AbstractEventLoop,
+                   handle: Callable[[ShardMessage], None],
+                   on_closed: Optional[Callable[[], None]] = None) -> None:
+    """
+    Reads messages off 'connection' in a background thread, handing each to 'handle' on the event loop
+    :param on_closed: called on the event loop once the other end of the connection goes away
+    """
+
+    def read() -> None:
+        while True:
+            try:
+                message: ShardMessage = connection.recv()
+            except (EOFError, OSError):
+                if on_closed is not None:
+                    loop.call_soon_threadsafe(on_closed)
+                return
+            loop.call_soon_threadsafe(handle, message)
+
+    threading.Thread(target=read, name="shard-messages", daemon=True).start()
+
+
+class ShardWorkerBot(ComplementsBot):
+    """
+    A bot which only complements in the channels of its shard; joins and leaves of other channels are passed on to
+    their owners through the supervisor
+    """
+
+    def __init__(self, index: int, workers: int, connection: Connection) -> None:
+        """
+        :param index: which of the workers this is, from 0
+        :param workers: how many workers there are
+        :param connection: this worker's end of its connection to the supervisor
+        """
+        super().__init__()
+        self._index: str = str(index)
+        self._ring: HashRing = HashRing(map(str, range(workers)))
+        self._supervisor_pipe: Connection = connection
+        self._tasks: set[asyncio.Task] = set()
+        # Twitch's rate limits are per account, so all workers have to share them
+        self.send_queue = SendQueue(max(2, int(TWITCH_MESSAGE_LIMIT or 20) // workers),
+                                    float(COMPLEMENT_BATCH_WINDOW_MS or 0) / 1000)
+        self.join_scheduler = JoinScheduler(self.join_channels, max(2, int(TWITCH_JOIN_LIMIT or 20) // workers),
+                                            self.connection_supervisor.gave_up)
+
+    async def start_services(self) -> None:
+        # The supervisor serves the API, with the metrics of every worker
+        _read_messages(self._supervisor_pipe, self.loop, self._handle)
+        await asyncio.gather(self.connect(), monitor_event_loop_lag())
+
+    def owns_channel(self, userid: str) -> bool:
+        return self._ring.owner(userid) == self._index
+
+    async def serve_channel(self, userid: str, username: str) -> None:
+        if self.owns_channel(userid):
+            await super().serve_channel(userid, username)
+        else:
+            self._supervisor_pipe.send(ShardMessage("join", userid, username))
+
+    async def stop_serving_channel(self, userid: str, username: str) -> None:
+        if self.owns_channel(userid):
+            await super().stop_serving_channel(userid, username)
+        else:
+            self._supervisor_pipe.send(ShardMessage("leave", userid, username))
+
+    def _handle(self, message: ShardMessage) -> None:
+        if message.kind == "metrics":
+            self._supervisor_pipe.send(ShardMessage("metrics_reply", request_id=message.request_id,
+                                                    payload=REGISTRY.render()))
+            return
+        if message.kind == "join":
+            task: asyncio.Task = self.loop.create_task(super().serve_channel(message.userid, message.username))
+        elif message.kind == "leave":
+            task = self.loop.create_task(super().stop_serving_channel(message.userid, message.username))
+        else:
+            return
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+
+def run_worker(index: int, workers: int, connection: Connection) -> None:
+    """
+    What each worker process runs
+    :param index: which of the workers this is, from 0
+    :param workers: how many workers there are
+    :param connection: this worker's end of its connection to the supervisor
+    """
+    log_listener = logs.configure_logging_from_env(f".{index}")
+    try:
+        ShardWorkerBot(index, workers, connection).run()
+    finally:
+        log_listener.stop()
+
+
+class ShardSupervisor:
+    """
+    Starts the worker processes (restarting any that stop), passes joins and leaves on to the worker owning the
+    channel, and serves the API, with the metrics of all workers merged together
+    """
+
+    RESTART_DELAY: float = 5.0
+    METRICS_TIMEOUT: float = 5.0
+
+    def __init__(self, workers: int) -> None:
+        """
+        :param workers: how many worker processes to split the channels between
+        """
+        assert workers >= 1
+        self._workers: int = workers
+        self._ring: HashRing = HashRing(map(str, range(workers)))
+        self._context: Any = multiprocessing.get_context("spawn")
+        self._processes: Dict[int, BaseProcess] = {}
+        self._connections: Dict[int, Connection] = {}
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._request_ids: itertools.count = itertools.count(1)
+
+    def start_worker(self, index: int) -> None:
+        """
+        :param index: which worker to start
+        """
+        connection, worker_connection = self._context.Pipe()
+        process: BaseProcess = self._context.Process(target=run_worker, args=(index, self._workers, worker_connection),
+                                                     name=f"complements-bot-{index}")
+        process.start()
+        worker_connection.close()
+        self._processes[index] = process
+        self._connections[index] = connection
+        _read_messages(connection, asyncio.get_running_loop(),
+                       self._handle,
+                       lambda: self._worker_stopped(index))
+
+    def _send(self, index: int, message: ShardMessage) -> bool:
+        """
+        :return: whether the message could be sent to the worker
+        """
+        try:
+            self._connections[index].send(message)
+        except OSError:
+            _LOG.warning("Could not send %s to worker %d", message.kind, index)
+            return False
+        return True
+
+    def _handle(self, message: ShardMessage) -> None:
+        if message.kind in ("join", "leave"):
+            owner: Optional[str] = self._ring.owner(message.userid)
+            assert owner is not None
+            self._send(int(owner), message)
+        elif message.kind == "metrics_reply":
+            future: Optional[asyncio.Future] = self._pending.pop(message.request_id, None)
+            if future is not None and not future.done():
+                future.set_result(message.payload)
+
+    def _worker_stopped(self, index: int) -> None:
+        process: BaseProcess = self._processes[index]
+        # Waiting for the process to exit blocks, so it is done off the event loop, which keeps serving the API
+        exited: asyncio.Future = asyncio.get_running_loop().run_in_executor(None, process.join, 1)
+        exited.add_done_callback(lambda _: self._restart_worker(index, process))
+
+    def _restart_worker(self, index: int, process: BaseProcess) -> None:
+        _LOG.warning("Worker %d stopped (exit code %s); restarting it in %ss", index, process.exitcode,
+                     ShardSupervisor.RESTART_DELAY)
+        asyncio.get_running_loop().call_later(ShardSupervisor.RESTART_DELAY, self.start_worker, index)
+
+    async def metrics(self) -> str:
+        """
+        :return: the metrics of every worker which answered in time, told apart by a 'worker' label
+        """
+        requests: Dict[str, asyncio.Future] = {}
+        for index in list(self._connections):
+            request_id: int = next(self._request_ids)
+            future: asyncio.Future = asyncio.get_running_loop().create_future()
+            self._pending[request_id] = future
+            if self._send(index, ShardMessage("metrics", request_id=request_id)):
+                requests[str(index)] = future
+            else:
+                del self._pending[request_id]
+        if requests:
+            await asyncio.wait(requests.values(), timeout=ShardSupervisor.METRICS_TIMEOUT)
+        for request_id, future in list(self._pending.items()):
+            if not future.done():
+                future.cancel()
+                del self._pending[request_id]
+        return merge_rendered({worker: future.result() for worker, future in requests.items()
+                               if future.done() and not future.cancelled()}, "worker")
+
+    async def run(self) -> None:
+        """
+        Starts every worker, then serves the API until stopped
+        """
+        for index in range(self._workers):
+            self.start_worker(index)
+        set_metrics_source(self.metrics)
+        await run_hypercorn_app()
+
+
+def run_supervisor(workers: int) -> None:
+    """
+    Runs the bot as 'workers' processes, each in a shard of the joined channels
+    """
+    asyncio.run(ShardSupervisor(workers).run())
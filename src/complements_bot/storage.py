@@ -0,0 +1,438 @@
+"""
+The storage backends that the database module can keep its data in; all of them store a JSON tree addressed by
+'/'-separated paths, following the same rules as the Firebase Realtime Database
+"""
+
+import asyncio
+import copy
+import json
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Optional, Protocol, Tuple
+
+from firebase_admin import credentials, db, initialize_app
+
+from .rtdb import AsyncRTDBClient
+
+# Called with the event type ('put' or 'patch'), the path of the change relative to the listened-to path, and the new
+# data at that path; always called on the event loop's thread
+ListenerCallback = Callable[[str, str, Any], None]
+
+
+class ListenerHandle(Protocol):
+    """
+    What listening to a path returns; closing it stops the callback from being called
+    """
+
+    def close(self) -> None:
+        """
+        Stop listening
+        """
+
+
+class StorageBackend(Protocol):
+    """
+    Everything the database module needs from wherever the data is actually stored
+    """
+
+    async def start(self) -> None:
+        """
+        Get ready to serve requests (e.g. open connections)
+        """
+
+    async def close(self) -> None:
+        """
+        Release anything held open by the backend
+        """
+
+    async def get(self, path: str, shallow: bool = False) -> Any:
+        """
+        :param path: the location to read
+        :param shallow: if True, only the keys of the children are read, with 'True' in place of their values
+        :return: the data at 'path', or 'None' if there is none
+        """
+
+    async def set(self, path: str, value: Any) -> None:
+        """
+        :param path: the location to write to
+        :param value: the new data for 'path'; 'None' deletes it
+        """
+
+    async def update(self, path: str, values: Dict[str, Any]) -> None:
+        """
+        :param path: the location to update
+        :param values: children of 'path' to write, whose keys may themselves be paths; all are written atomically
+        """
+
+    async def delete(self, path: str) -> None:
+        """
+        :param path: the location to delete
+        """
+
+    async def transaction(self, path: str, transaction_update: Callable[[Any], Any]) -> Any:
+        """
+        :param path: the location to change atomically
+        :param transaction_update: given the current data at 'path', returns the new data
+        :return: the data that was written
+        """
+
+    def listen(self, path: str, callback: ListenerCallback) -> ListenerHandle:
+        """
+        :param path: the location to listen to; the first event is a 'put' at '/' holding everything at 'path'
+        :param callback: called for every change at or below 'path'
+        :return: a handle through which to stop listening
+        """
+
+
+def split_path(path: str) -> list[str]:
+    """
+    :param path: a '/'-separated path
+    :return: the keys making up the path
+    """
+    return [part for part in path.split("/") if part]
+
+
+def apply_change(node: Any, path: list[str], data: Any, is_patch: bool = False) -> Any:
+    """
+    :param node: the (raw) data stored at some location
+    :param path: where, relative to 'node', the change happened
+    :param data: the new data at 'path' ('None' deletes it)
+    :param is_patch: if True, 'data' holds children to be updated rather than replacing everything at 'path'
+    :return: what 'node' looks like after the change, following the same rules as the Firebase database does
+    """
+    if not path:
+        if is_patch and isinstance(data, dict):
+            for key, value in data.items():
+                node = apply_change(node, split_path(key), value)
+            return node
+        return data
+
+    children: Dict[str, Any]
+    if isinstance(node, dict):
+        children = dict(node)
+    elif isinstance(node, list):
+        children = {str(i): value for i, value in enumerate(node) if value is not None}
+    else:
+        children = {}
+
+    child = apply_change(children.get(path[0]), path[1:], data, is_patch)
+    if child is None:
+        children.pop(path[0], None)
+    else:
+        children[path[0]] = child
+    # Just like in the database, a node with no children does not exist
+    return children or None
+
+
+def _normalised(node: Any) -> Any:
+    """
+    :param node: data as it is held by a local backend
+    :return: 'node' the way Firebase would hand it back: without empty children, and with any child whose keys are
+        (mostly consecutive) indices turned into a list
+    """
+    if isinstance(node, list):
+        node = {str(i): value for i, value in enumerate(node)}
+    if not isinstance(node, dict):
+        return node
+
+    children: Dict[str, Any] = {}
+    for key, value in node.items():
+        value = _normalised(value)
+        if value is not None:
+            children[key] = value
+    if not children:
+        return None
+    if all(key.isdigit() for key in children) and max(map(int, children)) < 2 * len(children):
+        as_list: list[Any] = [None] * (max(map(int, children)) + 1)
+        for key, value in children.items():
+            as_list[int(key)] = value
+        return as_list
+    return children
+
+
+def _shallow(node: Any) -> Any:
+    """
+    :return: the keys of the children of 'node' mapped to 'True', or 'node' itself if it has no children
+    """
+    if isinstance(node, list):
+        return {str(i): True for i, value in enumerate(node) if value is not None}
+    if isinstance(node, dict):
+        return {key: True for key in node}
+    return node
+
+
+class FirebaseBackend(StorageBackend):
+    """
+    Keeps the data in the Firebase Realtime Database; requests go through the asyncio REST client, and listening
+    through the Firebase SDK
+    """
+
+    def __init__(self, database_url: str, credential_paths: Iterable[str], **client_options: int) -> None:
+        """
+        :param database_url: the URL of the database, as given in the Firebase console
+        :param credential_paths: where to look for the service account file; the first one that exists is used
+        :param client_options: passed on to AsyncRTDBClient (e.g. connection and concurrency limits)
+        """
+        credential: Optional[credentials.Certificate] = None
+        for credential_path in credential_paths:
+            try:
+                credential = credentials.Certificate(credential_path)
+                break
+            except IOError:
+                continue
+        if credential is None:
+            raise IOError("No Firebase service account file found")
+        initialize_app(credential, {'databaseURL': database_url})
+        self._client: AsyncRTDBClient = AsyncRTDBClient(database_url, credential, **client_options)
+
+    async def start(self) -> None:
+        await self._client.start()
+
+    async def close(self) -> None:
+        await self._client.close()
+
+    async def get(self, path: str, shallow: bool = False) -> Any:
+        return await self._client.get(path, shallow)
+
+    async def set(self, path: str, value: Any) -> None:
+        await self._client.set(path, value)
+
+    async def update(self, path: str, values: Dict[str, Any]) -> None:
+        await self._client.update(path, values)
+
+    async def delete(self, path: str) -> None:
+        await self._client.delete(path)
+
+    async def transaction(self, path: str, transaction_update: Callable[[Any], Any]) -> Any:
+        return await self._client.transaction(path, transaction_update)
+
+    def listen(self, path: str, callback: ListenerCallback) -> ListenerHandle:
+        # The SDK calls us from its own thread, so hop over to the event loop's
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        return db.reference(f"/{path}").listen(
+                lambda event: loop.call_soon_threadsafe(callback, event.event_type, event.path, event.data)
+        )
+
+
+class _LocalListener:
+    """
+    A listener on a local backend
+    """
+
+    def __init__(self, listeners: list["_LocalListener"], path: list[str], callback: ListenerCallback) -> None:
+        self._listeners: list[_LocalListener] = listeners
+        self.path: list[str] = path
+        self.callback: ListenerCallback = callback
+        listeners.append(self)
+
+    def close(self) -> None:
+        """
+        Stop listening
+        """
+        if self in self._listeners:
+            self._listeners.remove(self)
+
+
+class _LocalBackend(StorageBackend):
+    """
+    The parts shared by backends which live in this process: since every write goes through here, listeners are
+    told about changes straight after they are made
+    """
+
+    def __init__(self) -> None:
+        self._listeners: list[_LocalListener] = []
+
+    async def start(self) -> None:
+        # Nothing needs to be opened for local backends
+        pass
+
+    def listen(self, path: str, callback: ListenerCallback) -> ListenerHandle:
+        listener: _LocalListener = _LocalListener(self._listeners, split_path(path), callback)
+
+        async def send_initial() -> None:
+            data = await self.get(path)
+            if listener in self._listeners:
+                callback("put", "/", data)
+
+        asyncio.get_running_loop().create_task(send_initial())
+        return listener
+
+    async def _notify(self, paths: Iterable[str]) -> None:
+        """
+        :param paths: the locations that were just written to
+        Tells every listener whose location overlaps with a written location about the change
+        """
+        for path in map(split_path, paths):
+            for listener in list(self._listeners):
+                if path[:len(listener.path)] == listener.path:
+                    relative: list[str] = path[len(listener.path):]
+                    listener.callback("put", "/" + "/".join(relative), await self.get("/".join(path)))
+                elif listener.path[:len(path)] == path:
+                    listener.callback("put", "/", await self.get("/".join(listener.path)))
+
+
+class MemoryBackend(_LocalBackend):
+    """
+    Keeps the data in a dict in memory; nothing survives a restart, which makes it useful for tests and benchmarks
+    """
+
+    def __init__(self, data: Any = None) -> None:
+        """
+        :param data: what the whole tree should start out as
+        """
+        super().__init__()
+        self._root: Any = copy.deepcopy(data)
+
+    async def close(self) -> None:
+        pass
+
+    async def get(self, path: str, shallow: bool = False) -> Any:
+        node: Any = self._root
+        for key in split_path(path):
+            if isinstance(node, list) and key.isdigit() and int(key) < len(node):
+                node = node[int(key)]
+            elif isinstance(node, dict):
+                node = node.get(key)
+            else:
+                return None
+        node = _normalised(copy.deepcopy(node))
+        return _shallow(node) if shallow else node
+
+    async def set(self, path: str, value: Any) -> None:
+        self._root = apply_change(self._root, split_path(path), copy.deepcopy(value))
+        await self._notify([path])
+
+    async def update(self, path: str, values: Dict[str, Any]) -> None:
+        self._root = apply_change(self._root, split_path(path), copy.deepcopy(values), is_patch=True)
+        await self._notify([f"{path}/{key}" for key in values])
+
+    async def delete(self, path: str) -> None:
+        await self.set(path, None)
+
+    async def transaction(self, path: str, transaction_update: Callable[[Any], Any]) -> Any:
+        # Nothing else can run in between the read and the write, as neither awaits anything
+        new_data = transaction_update(await self.get(path))
+        await self.set(path, new_data)
+        return new_data
+
+
+class SQLiteBackend(_LocalBackend):
+    """
+    Keeps the data in an SQLite database file, with one row per leaf of the tree (keyed by its full path); the file is
+    opened in WAL mode, and all statements are parameterised so that SQLite can reuse their prepared forms. Everything
+    below a path lies within ['path/', 'path0'), as '0' is the character straight after '/', so reading or replacing a
+    subtree is a range scan of the primary key
+    """
+
+    _CREATE_TABLE: str = "CREATE TABLE IF NOT EXISTS nodes (path TEXT PRIMARY KEY, value TEXT NOT NULL) WITHOUT ROWID"
+    _SELECT_LEAF: str = "SELECT value FROM nodes WHERE path = ?"
+    _SELECT_SUBTREE: str = "SELECT path, value FROM nodes WHERE path >= ? AND path < ?"
+    _DELETE_LEAF: str = "DELETE FROM nodes WHERE path = ?"
+    _DELETE_SUBTREE: str = "DELETE FROM nodes WHERE path >= ? AND path < ?"
+    _INSERT_LEAF: str = "INSERT OR REPLACE INTO nodes (path, value) VALUES (?, ?)"
+
+    def __init__(self, filename: str) -> None:
+        """
+        :param filename: the SQLite database file to use; created if it does not exist
+        """
+        super().__init__()
+        # Every statement runs on this one thread, so the connection is never used by two threads at once
+        self._executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-backend")
+        self._connection: sqlite3.Connection = sqlite3.connect(filename, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(SQLiteBackend._CREATE_TABLE)
+
+    async def close(self) -> None:
+        await self._run(self._connection.close)
+        self._executor.shutdown()
+
+    async def get(self, path: str, shallow: bool = False) -> Any:
+        node = await self._run(self._read, split_path(path))
+        return _shallow(node) if shallow else node
+
+    async def set(self, path: str, value: Any) -> None:
+        await self._run(self._write_all, [(split_path(path), value)])
+        await self._notify([path])
+
+    async def update(self, path: str, values: Dict[str, Any]) -> None:
+        await self._run(self._write_all, [(split_path(f"{path}/{key}"), value) for key, value in values.items()])
+        await self._notify([f"{path}/{key}" for key in values])
+
+    async def delete(self, path: str) -> None:
+        await self.set(path, None)
+
+    async def transaction(self, path: str, transaction_update: Callable[[Any], Any]) -> Any:
+        new_data = await self._run(self._transaction, split_path(path), transaction_update)
+        await self._notify([path])
+        return new_data
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Runs 'func' on the thread that owns the connection
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _read(self, path: list[str]) -> Any:
+        joined: str = "/".join(path)
+        leaf: Optional[Tuple[str]] = self._connection.execute(SQLiteBackend._SELECT_LEAF, (joined,)).fetchone()
+        if leaf is not None:
+            return json.loads(leaf[0])
+
+        bounds: Tuple[str, str] = SQLiteBackend._subtree_bounds(joined)
+        node: Any = None
+        for row_path, value in self._connection.execute(SQLiteBackend._SELECT_SUBTREE, bounds):
+            node = apply_change(node, split_path(row_path[len(bounds[0]):]), json.loads(value))
+        return _normalised(node)
+
+    def _write_all(self, writes: list[Tuple[list[str], Any]]) -> None:
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            for path, value in writes:
+                self._write(path, value)
+            self._connection.execute("COMMIT")
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+
+    def _write(self, path: list[str], value: Any) -> None:
+        joined: str = "/".join(path)
+        # Whatever was at or below 'path' is replaced, and no ancestor of 'path' can be a leaf any longer
+        self._connection.execute(SQLiteBackend._DELETE_LEAF, (joined,))
+        self._connection.execute(SQLiteBackend._DELETE_SUBTREE, SQLiteBackend._subtree_bounds(joined))
+        for i in range(len(path)):
+            self._connection.execute(SQLiteBackend._DELETE_LEAF, ("/".join(path[:i]),))
+        self._connection.executemany(SQLiteBackend._INSERT_LEAF, SQLiteBackend._leaves(path, value))
+
+    def _transaction(self, path: list[str], transaction_update: Callable[[Any], Any]) -> Any:
+        self._connection.execute("BEGIN IMMEDIATE")
+        try:
+            new_data = transaction_update(self._read(path))
+            self._write(path, new_data)
+            self._connection.execute("COMMIT")
+            return new_data
+        except BaseException:
+            self._connection.execute("ROLLBACK")
+            raise
+
+    @staticmethod
+    def _subtree_bounds(path: str) -> Tuple[str, str]:
+        """
+        :return: the range of keys that every path strictly below 'path' lies within
+        """
+        if not path:
+            return "", "\U0010ffff"
+        return f"{path}/", f"{path}0"
+
+    @staticmethod
+    def _leaves(path: list[str], value: Any) -> Iterable[Tuple[str, str]]:
+        """
+        :return: the (path, JSON-encoded value) pairs of every leaf of 'value', which is to be stored at 'path'
+        """
+        if isinstance(value, list):
+            value = {str(i): child for i, child in enumerate(value)}
+        if isinstance(value, dict):
+            for key, child in value.items():
+                yield from SQLiteBackend._leaves(path + split_path(str(key)), child)
+        elif value is not None:
+            yield "/".join(path), json.dumps(value)
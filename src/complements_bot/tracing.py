@@ -0,0 +1,127 @@
+"""
+Lightweight tracing of where the time handling a chat message goes: each traced stage records a span, nested under the
+span of the stage it was called from, and traces which take too long are written to the log as a tree
+"""
+
+import functools
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Coroutine, Dict, Iterator, Optional, ParamSpec, TypeVar
+
+from . import logs
+
+_T = TypeVar("_T")
+_U = ParamSpec("_U")
+
+_LOG: logging.Logger = logging.getLogger(logs.TRACES)
+
+
+class Span:
+    """
+    A timed stage of handling a message, along with the stages it was made up of
+    """
+
+    def __init__(self, name: str, attributes: Dict[str, Any]) -> None:
+        """
+        :param name: what the stage is, e.g. 'database.get_channel_settings'
+        :param attributes: anything else worth knowing about the stage, e.g. which channel it was for
+        """
+        self.name: str = name
+        self.attributes: Dict[str, Any] = attributes
+        self.started: float = time.perf_counter()
+        self.ended: Optional[float] = None
+        self.children: list[Span] = []
+
+    @property
+    def duration(self) -> float:
+        """
+        :return: how long (in seconds) the stage took, or has taken so far if it has not ended yet
+        """
+        return (self.ended if self.ended is not None else time.perf_counter()) - self.started
+
+    def render(self, depth: int = 0) -> str:
+        """
+        :return: the span and everything under it, one span per line, indented by how deeply it is nested; each line
+            says when (in milliseconds, relative to this span) the stage started and how long it took
+        """
+        return "\n".join(self._lines(self.started, depth))
+
+    def _lines(self, origin: float, depth: int) -> Iterator[str]:
+        attributes: str = "".join(f" {key}={value}" for key, value in self.attributes.items())
+        unfinished: str = "" if self.ended is not None else " (unfinished)"
+        yield (f"{'  ' * depth}{self.name} +{(self.started - origin) * 1000:.1f}ms "
+               f"{self.duration * 1000:.1f}ms{unfinished}{attributes}")
+        for child in self.children:
+            yield from child._lines(origin, depth + 1)  # pylint: disable=protected-access
+
+
+# The span of the stage currently running, if the message being handled is being traced; tasks started while handling
+#  a message copy this, so their spans end up in the same tree
+_CURRENT_SPAN: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+@contextmanager
+def trace(name: str, slow_threshold: Optional[float], **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Traces everything done in the body of the 'with' block; if it takes at least 'slow_threshold' seconds, the whole
+        tree of spans is logged
+    :param name: what is being traced, e.g. 'event_message'
+    :param slow_threshold: how long (in seconds) is too long; if None, nothing is traced
+    :param attributes: anything else worth knowing about what is being traced
+    :return: the root span, or None if nothing is traced
+    """
+    if slow_threshold is None:
+        yield None
+        return
+
+    root: Span = Span(name, attributes)
+    token = _CURRENT_SPAN.set(root)
+    try:
+        yield root
+    finally:
+        root.ended = time.perf_counter()
+        _CURRENT_SPAN.reset(token)
+        if root.duration >= slow_threshold:
+            _LOG.warning("Slow %s (%.1fms):\n%s", name, root.duration * 1000, root.render())
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Times the body of the 'with' block as a stage of whatever is being traced; does nothing if nothing is
+    :param name: what the stage is
+    :param attributes: anything else worth knowing about the stage
+    :return: the stage's span, or None if nothing is being traced
+    """
+    parent: Optional[Span] = _CURRENT_SPAN.get()
+    if parent is None:
+        yield None
+        return
+
+    child: Span = Span(name, attributes)
+    parent.children.append(child)
+    token = _CURRENT_SPAN.set(child)
+    try:
+        yield child
+    finally:
+        child.ended = time.perf_counter()
+        _CURRENT_SPAN.reset(token)
+
+
+def traced(name: str) -> Callable[[Callable[_U, Coroutine[Any, Any, _T]]], Callable[_U, Coroutine[Any, Any, _T]]]:
+    """
+    Makes every call of the decorated coroutine function a stage of whatever is being traced
+    :param name: what the stage is
+    """
+
+    def decorate(func: Callable[_U, Coroutine[Any, Any, _T]]) -> Callable[_U, Coroutine[Any, Any, _T]]:
+        @functools.wraps(func)
+        async def traced_func(*args: _U.args, **kwargs: _U.kwargs) -> _T:
+            with span(name):
+                return await func(*args, **kwargs)
+
+        return traced_func
+
+    return decorate
@@ -3,7 +3,9 @@ Useful functions that can be used generally anywhere across the program
 """
 
 import asyncio
+import random
 import re
+from array import array
 from typing import Awaitable, Callable, Optional, ParamSpec, TypeVar, Union, Coroutine
 
 _T = TypeVar("_T")
@@ -72,3 +74,35 @@ class Awaitables:
             return asyncio.gather(*self._tasks)
 
         raise asyncio.InvalidStateError("All tasks have already been gathered.")
+
+
+class ShuffleBag:
+    """
+    Hands out the indices 0 to size - 1 in a random order, each one exactly once, before starting over with a fresh
+    order; the order is kept as a compact array of indices, so drawing is O(1) amortised whatever is being indexed
+    """
+
+    def __init__(self, size: int) -> None:
+        """
+        :param size: how many indices there are to hand out
+        """
+        self.size: int = size
+        self._order: array = array("I", range(size))
+        self._position: int = size
+        self._last: Optional[int] = None
+
+    def draw(self) -> int:
+        """
+        :return: the next index; the same index is never handed out twice in a row (unless there is only one)
+        """
+        assert self.size > 0
+        if self._position >= self.size:
+            random.shuffle(self._order)
+            if self.size > 1 and self._order[0] == self._last:
+                # Do not repeat the last index of the previous order at the start of the new one
+                swap_with: int = random.randrange(1, self.size)
+                self._order[0], self._order[swap_with] = self._order[swap_with], self._order[0]
+            self._position = 0
+        self._last = self._order[self._position]
+        self._position += 1
+        return self._last
@@ -8,11 +8,11 @@ import os
 
 def is_env_read(var_str: str) -> Optional[str]:
     """
-    Tries to read from the environment the given variable; if it doesn't exist, it looks for it in the .env file. If
-    not found in either, returns an empty string.
+    Tries to read from the environment the given variable; if it doesn't exist, it looks for it in the .env file (if
+    there is one). If not found in either, returns None.
 
     :param var_str: the environment variable we are looking for
-    :return: the value of the environment variable, or empty string if it doesn't exist
+    :return: the value of the environment variable, or None if it doesn't exist
     """
 
     try:
@@ -22,7 +22,10 @@ def is_env_read(var_str: str) -> Optional[str]:
         try:
             env_file = open("src/.env", "r", encoding="utf-8")
         except OSError:
-            env_file = open("./.env", "r", encoding="utf-8")
+            try:
+                env_file = open("./.env", "r", encoding="utf-8")
+            except OSError:
+                return None
 
         for line in env_file:
             split_line = line.strip().split("=", 1)
@@ -39,3 +42,18 @@ def is_env_read(var_str: str) -> Optional[str]:
 TMI_TOKEN: Optional[str] = is_env_read('TMI_TOKEN')
 CLIENT_SECRET: Optional[str] = is_env_read('CLIENT_SECRET')
 DATABASE_URL: Optional[str] = is_env_read('DATABASE_URL')
+DATABASE_MAX_CONNECTIONS: Optional[str] = is_env_read('DATABASE_MAX_CONNECTIONS')
+DATABASE_MAX_CONCURRENT_REQUESTS: Optional[str] = is_env_read('DATABASE_MAX_CONCURRENT_REQUESTS')
+DATABASE_BACKEND: Optional[str] = is_env_read('DATABASE_BACKEND')
+DATABASE_SQLITE_PATH: Optional[str] = is_env_read('DATABASE_SQLITE_PATH')
+DATABASE_WRITE_COALESCE_MS: Optional[str] = is_env_read('DATABASE_WRITE_COALESCE_MS')
+TWITCH_MESSAGE_LIMIT: Optional[str] = is_env_read('TWITCH_MESSAGE_LIMIT')
+COMPLEMENT_BATCH_WINDOW_MS: Optional[str] = is_env_read('COMPLEMENT_BATCH_WINDOW_MS')
+LOG_FILE: Optional[str] = is_env_read('LOG_FILE')
+LOG_LEVEL: Optional[str] = is_env_read('LOG_LEVEL')
+LOG_LEVELS: Optional[str] = is_env_read('LOG_LEVELS')
+LOG_CHAT_SAMPLE_RATE: Optional[str] = is_env_read('LOG_CHAT_SAMPLE_RATE')
+SLOW_MESSAGE_THRESHOLD_MS: Optional[str] = is_env_read('SLOW_MESSAGE_THRESHOLD_MS')
+TWITCH_JOIN_LIMIT: Optional[str] = is_env_read('TWITCH_JOIN_LIMIT')
+SHARD_WORKERS: Optional[str] = is_env_read('SHARD_WORKERS')
+NODE_ID: Optional[str] = is_env_read('NODE_ID')
@@ -0,0 +1,228 @@
+"""
+A small registry of metrics about where the bot spends its time, rendered in Prometheus' text format
+"""
+
+import asyncio
+import bisect
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, Mapping, Optional, Tuple
+
+# A metric's labels, as sorted (name, value) pairs
+Labels = Tuple[Tuple[str, str], ...]
+
+# From a millisecond up to 10 seconds, which covers everything from a cache hit to a slow Helix request
+_LATENCY_BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(labels: Mapping[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _sample(name: str, labels: Labels, value: float) -> str:
+    """
+    :return: one line of a metric, e.g. 'name{label="value"} 1'
+    """
+    rendered_labels: str = ",".join(f'{key}="{_escape(str(label))}"' for key, label in labels)
+    return f"{name}{{{rendered_labels}}} {value:g}" if labels else f"{name} {value:g}"
+
+
+class Metric:
+    """
+    Anything that can be rendered as a metric
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str) -> None:
+        """
+        :param name: the name of the metric, e.g. 'complements_bot_messages_total'
+        :param documentation: what the metric measures
+        :param kind: 'counter', 'gauge' or 'histogram'
+        """
+        self.name: str = name
+        self.documentation: str = documentation
+        self.kind: str = kind
+
+    def samples(self) -> Iterable[str]:
+        """
+        :return: the lines of the metric's current values
+        """
+        raise NotImplementedError
+
+    def render(self) -> str:
+        """
+        :return: the metric in Prometheus' text format
+        """
+        return "\n".join([f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}",
+                          *self.samples()])
+
+
+class Counter(Metric):
+    """
+    A value, per set of labels, that only ever goes up
+    """
+
+    def __init__(self, name: str, documentation: str) -> None:
+        super().__init__(name, documentation, "counter")
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """
+        :param amount: how much to add
+        :param labels: which of the counter's values to add to
+        """
+        key: Labels = _labels(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        """
+        :return: the counter's value for the given labels
+        """
+        return self._values.get(_labels(labels), 0.0)
+
+    def samples(self) -> Iterable[str]:
+        return (_sample(self.name, labels, value) for labels, value in self._values.items())
+
+
+class Histogram(Metric):
+    """
+    How many observations, per set of labels, fell into each of a set of buckets (e.g. how long requests took)
+    """
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = _LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, "histogram")
+        self._buckets: Tuple[float, ...] = buckets
+        # For each set of labels: how many observations fell into each bucket (the last one being +Inf), and their sum
+        self._values: Dict[Labels, Tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """
+        :param value: what was observed (e.g. how many seconds something took)
+        :param labels: which of the histogram's sets of buckets to count the observation in
+        """
+        counts, total = self._values.setdefault(_labels(labels), ([0] * (len(self._buckets) + 1), [0.0]))
+        counts[bisect.bisect_left(self._buckets, value)] += 1
+        total[0] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """
+        Observes how many seconds the body of the 'with' block took
+        """
+        started: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def count(self, **labels: str) -> int:
+        """
+        :return: how many observations were made for the given labels
+        """
+        values: Optional[Tuple[list[int], list[float]]] = self._values.get(_labels(labels))
+        return 0 if values is None else sum(values[0])
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total) in self._values.items():
+            cumulative: int = 0
+            for bound, count in zip((*self._buckets, math.inf), counts):
+                cumulative += count
+                yield _sample(f"{self.name}_bucket", (*labels, ("le", "+Inf" if bound == math.inf else f"{bound:g}")),
+                              cumulative)
+            yield _sample(f"{self.name}_sum", labels, total[0])
+            yield _sample(f"{self.name}_count", labels, cumulative)
+
+
+class Collected(Metric):
+    """
+    A metric whose values are read from somewhere else whenever the metrics are rendered (e.g. the length of a queue)
+    """
+
+    def __init__(self, name: str, documentation: str, kind: str,
+                 collect: Callable[[], Iterable[Tuple[Mapping[str, str], float]]]) -> None:
+        """
+        :param collect: returns each of the metric's values, along with its labels
+        """
+        super().__init__(name, documentation, kind)
+        self._collect: Callable[[], Iterable[Tuple[Mapping[str, str], float]]] = collect
+
+    def samples(self) -> Iterable[str]:
+        return (_sample(self.name, _labels(labels), value) for labels, value in self._collect())
+
+
+class Registry:
+    """
+    All the metrics which get exported
+    """
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        """
+        Adds a metric to those exported, replacing any other of the same name
+        :return: the metric
+        """
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        :return: every metric, in Prometheus' text format
+        """
+        return "".join(f"{metric.render()}\n" for metric in self._metrics.values())
+
+
+def merge_rendered(rendered: Mapping[str, str], label: str) -> str:
+    """
+    Merges the metrics of several processes into one set, telling them apart by a label
+    :param rendered: each process' metrics, in Prometheus' text format, by the value of 'label' to give them
+    :param label: the name of the label telling the processes apart, e.g. 'worker'
+    :return: all of the metrics, in Prometheus' text format, with each metric's description given once
+    """
+    headers: Dict[str, list[str]] = {}
+    samples: Dict[str, list[str]] = {}
+    for value, text in rendered.items():
+        family: str = ""
+        for line in text.splitlines():
+            if line.startswith("# "):
+                family = line.split(" ", 3)[2]
+                if line not in headers.setdefault(family, []):
+                    headers[family].append(line)
+            elif line:
+                name_and_labels, sample = line.rsplit(" ", 1)
+                name, _, labels = name_and_labels.partition("{")
+                added: str = f'{label}="{_escape(value)}"'
+                samples.setdefault(family, []).append(
+                        f"{name}{{{added},{labels} {sample}" if labels else f"{name}{{{added}}} {sample}")
+    return "".join(f"{line}\n" for family, lines in headers.items() for line in [*lines, *samples.get(family, [])])
+
+
+REGISTRY: Registry = Registry()
+
+COMMAND_LATENCY: Histogram = Histogram("complements_bot_command_seconds", "How long each command took to run")
+DATABASE_LATENCY: Histogram = Histogram("complements_bot_database_request_seconds",
+                                        "How long each request to the Firebase Realtime Database took")
+HELIX_LATENCY: Histogram = Histogram("complements_bot_helix_request_seconds", "How long each Helix request took")
+CACHE_REQUESTS: Counter = Counter("complements_bot_cache_requests_total",
+                                  "How many lookups each cache answered ('hit') or had to pass on ('miss')")
+EVENT_LOOP_LAG: Histogram = Histogram("complements_bot_event_loop_lag_seconds",
+                                      "How late the event loop got round to a task scheduled to run at a given time")
+for _metric in (COMMAND_LATENCY, DATABASE_LATENCY, HELIX_LATENCY, CACHE_REQUESTS, EVENT_LOOP_LAG):
+    REGISTRY.register(_metric)
+
+
+async def monitor_event_loop_lag(interval: float = 1.0) -> None:
+    """
+    Measures, forever, how much later than asked for a sleep wakes up; the difference is how long the event loop was
+        too busy to run anything else
+    :param interval: how long (in seconds) to sleep between measurements
+    """
+    while True:
+        started: float = time.perf_counter()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG.observe(max(0.0, time.perf_counter() - started - interval))
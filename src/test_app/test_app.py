@@ -0,0 +1,21 @@
+"""
+Tests for app.py file
+"""
+
+import asyncio
+
+from src.app.app import app
+
+
+def test_metrics_endpoint() -> None:
+    """
+    Tests that '/metrics' serves the metrics in Prometheus' text format
+    """
+
+    async def run() -> None:
+        response = await app.test_client().get("/metrics")
+        assert response.status_code == 200
+        assert response.content_type.startswith("text/plain; version=0.0.4")
+        assert "# TYPE complements_bot_command_seconds histogram" in await response.get_data(as_text=True)
+
+    asyncio.run(run())
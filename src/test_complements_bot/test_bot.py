@@ -2,8 +2,12 @@
 Tests for bot.py file
 """
 
+import asyncio
+from types import SimpleNamespace
 from typing import List
 
+from twitchio.websocket import WSConnection
+
 from src.complements_bot import ComplementsBot
 
 
@@ -15,3 +19,40 @@ def test_is_bot_name_ends_in_bot() -> None:
     names_to_test: List[str] = ["somebot", "ThatBot", "someOTHERBOT", "bOT"]
     for name in names_to_test:
         assert ComplementsBot.is_bot(name)
+
+
+class _StubConnection(WSConnection):
+    """
+    TwitchIO's connection, with a fake websocket and without actually connecting
+    """
+
+    def __init__(self, closed: bool) -> None:
+        super().__init__(loop=asyncio.get_running_loop(), heartbeat=None, client=None)
+        self.connects: int = 0
+        self.closes: int = 0
+        self._websocket = SimpleNamespace(closed=closed, close=self._close_websocket)
+
+    async def _close_websocket(self) -> None:
+        self.closes += 1
+        self._websocket.closed = True
+
+    async def _connect(self) -> None:
+        self.connects += 1
+
+
+def test_reconnect() -> None:
+    """
+    Tests that reconnecting closes an open connection, and leaves a closed one to TwitchIO, which is already opening
+    a new one
+    """
+
+    async def run() -> None:
+        bot = ComplementsBot()
+        for closed in (False, True):
+            connection = _StubConnection(closed)
+            bot._connection = connection  # pylint: disable=protected-access
+            await bot.reconnect()
+            assert (connection.closes, connection.connects) == (0 if closed else 1, 0)
+            assert not bot.is_connected()
+
+    asyncio.run(run())
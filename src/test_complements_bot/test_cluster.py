@@ -0,0 +1,72 @@
+"""
+Tests for cluster.py file
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+import pytest
+
+from src.complements_bot import database
+from src.complements_bot.cluster import ChannelCoordinator
+from src.complements_bot.storage import MemoryBackend
+
+
+def test_rebalancing(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Tests that instances sharing a database split the joined channels between them, and that a channel is never served
+    by two instances at once while they are handed over as instances come and go
+    """
+
+    served_by: Dict[str, str] = {}
+    live_node_reads: list[bool] = []
+    live_nodes = database.live_nodes
+
+    async def counted_live_nodes() -> list[str]:
+        live_node_reads.append(True)
+        return await live_nodes()
+
+    def coordinator(node_id: str) -> ChannelCoordinator:
+        async def serve(userid: str, _username: str) -> None:
+            assert userid not in served_by
+            served_by[userid] = node_id
+
+        async def stop_serving(userid: str, _username: str) -> None:
+            assert served_by.pop(userid) == node_id
+
+        async def id_to_name(userid: str) -> Optional[str]:
+            return f"user{userid}"
+
+        return ChannelCoordinator(node_id, serve, stop_serving, id_to_name)
+
+    async def run() -> None:
+        channels: Dict[str, object] = {str(userid): f"user{userid}" for userid in range(100000, 100300)}
+        channels["100300"] = True  # joined before usernames were stored
+        database.use_backend(MemoryBackend({"Joined": channels}))
+        first, second, third = coordinator("a"), coordinator("b"), coordinator("c")
+
+        await first.step()
+        await second.step()
+        await first.step()
+        await second.step()
+        assert len(served_by) == 301 and served_by["100300"] in ("a", "b")
+        # Which instances are alive is read once a step, not once for every channel claimed
+        assert len(live_node_reads) == 4
+        assert 50 < len(first.serving) < 250
+
+        # Channels moving to the new instance are only taken once their old owner has handed them over
+        assert await third.step() == {}
+        assert not third.serving
+        await first.step()
+        await second.step()
+        # Each step reports the channels it started serving, so that their usernames can be checked
+        assert await third.step() == third.serving
+        assert len(served_by) == 301 and 30 < len(third.serving) < 170
+
+        await third.leave()
+        await first.step()
+        await second.step()
+        assert len(served_by) == 301 and set(served_by.values()) == {"a", "b"}
+
+    monkeypatch.setattr(database, "live_nodes", counted_live_nodes)
+    asyncio.run(run())
@@ -0,0 +1,54 @@
+"""
+Tests for complement_stream.py file
+"""
+
+import asyncio
+from typing import Optional, Tuple
+
+from src.complements_bot.complement_stream import ComplementStream
+
+
+def test_complement_stream():
+    """
+    Tests that a 'ComplementStream' refills itself in the background, drops complements drawn for an old version, and
+    stops refilling while there are no complements to draw
+    """
+
+    async def run() -> None:
+        version: int = 1
+        fills: list[int] = []
+
+        async def fill(count: int) -> Tuple[Optional[int], list[str]]:
+            fills.append(count)
+            return version, [f"v{version} #{i}" for i in range(count) if version != 3]
+
+        stream = ComplementStream(fill, size=4, low_water_mark=2)
+        assert stream.pop(version) is None
+        await asyncio.sleep(0)
+        assert fills == [4] and len(stream) == 4
+
+        assert stream.pop(version) == "v1 #0"
+        assert stream.pop(version) == "v1 #1"
+        assert stream.pop(version) == "v1 #2"
+        await asyncio.sleep(0)
+        assert fills == [4, 3] and len(stream) == 4
+
+        version = 2
+        assert stream.pop(version) is None
+        await asyncio.sleep(0)
+        assert stream.pop(version) == "v2 #0"
+
+        # Every complement was removed
+        version = 3
+        fills.clear()
+        for _ in range(3):
+            assert stream.pop(version) is None
+            await asyncio.sleep(0)
+        assert fills == [4]
+
+        version = 4
+        assert stream.pop(version) is None
+        await asyncio.sleep(0)
+        assert fills == [4, 4] and len(stream) == 4
+
+    asyncio.run(run())
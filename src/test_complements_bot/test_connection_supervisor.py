@@ -0,0 +1,83 @@
+"""
+Tests for connection_supervisor.py file
+"""
+
+import asyncio
+import time
+
+from src.complements_bot.connection_supervisor import ConnectionSupervisor
+
+
+class _FakeBot:
+    """
+    A bot whose connection and channels the tests control
+    """
+
+    def __init__(self) -> None:
+        self.alive: bool = True
+        self.joined: set[str] = set()
+        self.rejoined: list[str] = []
+        self.reconnects: int = 0
+
+    def is_connected(self) -> bool:
+        """
+        :return: whether the connection to chat is open
+        """
+        return self.alive
+
+    def joined_channel_names(self) -> set[str]:
+        """
+        :return: the names of the channels the bot is in
+        """
+        return self.joined
+
+    def rejoin(self, channels: list[str]) -> int:
+        """
+        :return: how many of the channels were not already waiting to be joined
+        """
+        self.rejoined.extend(channels)
+        return len(channels)
+
+    async def reconnect(self) -> None:
+        """
+        Counts the reconnects
+        """
+        self.reconnects += 1
+
+
+def test_reconnect_and_rejoin() -> None:
+    """
+    Tests that only lost channels which were not given up on are rejoined, that a silent connection is replaced with
+    exponential backoff, and that a closed one is left to TwitchIO
+    """
+
+    async def run() -> None:
+        bot = _FakeBot()
+        supervisor = ConnectionSupervisor(bot)
+        supervisor.wanted.update(("a", "b", "c"))
+        bot.joined = {"a", "c"}
+
+        await supervisor.check(0.0)
+        assert bot.rejoined == ["b"] and bot.reconnects == 0
+        supervisor.parted("c")
+        supervisor.parted("left")
+        assert bot.rejoined == ["b", "c"]
+
+        bot.alive = False
+        await supervisor.check(1.0)
+        assert bot.reconnects == 0
+
+        bot.alive = True
+        silent: float = time.monotonic() + ConnectionSupervisor.SILENCE_TIMEOUT
+        await supervisor.check(silent)
+        await supervisor.check(silent + ConnectionSupervisor.BASE_BACKOFF / 2)
+        await supervisor.check(silent + ConnectionSupervisor.BASE_BACKOFF)
+        await supervisor.check(silent + ConnectionSupervisor.BASE_BACKOFF * 2)
+        assert bot.reconnects == 2
+
+        supervisor.gave_up("B")
+        supervisor.connected()
+        assert bot.rejoined == ["b", "c", "a", "c"]
+        assert supervisor.outcome_counts == {"reconnects": 2, "rejoins": 4, "stalls": 0}
+
+    asyncio.run(run())
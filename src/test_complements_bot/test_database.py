@@ -2,8 +2,13 @@
 Tests for database.py file
 """
 
+import asyncio
+from collections import Counter
+from typing import Any, Dict
+
 from src.complements_bot import database
-from .testing_commons import BOT_ID
+from src.complements_bot.storage import MemoryBackend
+from .testing_commons import BOT_ID, BOT_NICK
 
 
 def test_channel_exists() -> None:
@@ -12,3 +17,183 @@ def test_channel_exists() -> None:
     """
 
     assert database.channel_exists(userid=BOT_ID)
+
+
+def test_channel_exists_offline() -> None:
+    """
+    Tests the 'channel_exists' function of database against the in-memory backend
+    """
+
+    async def run() -> None:
+        database.use_backend(MemoryBackend())
+        assert not await database.channel_exists(userid=BOT_ID)
+        await database.join_channel(BOT_NICK, userid=BOT_ID)
+        assert await database.channel_exists(userid=BOT_ID)
+        assert await database.get_joined_channels() == [BOT_ID]
+
+    asyncio.run(run())
+
+
+class _ReadCountingBackend(MemoryBackend):
+    """
+    An in-memory backend that counts how many times each location is read, and is slow to answer reads
+    """
+
+    def __init__(self, data: Any = None) -> None:
+        super().__init__(data)
+        self.reads: Counter[str] = Counter()
+
+    async def get(self, path: str, shallow: bool = False) -> Any:
+        self.reads[path] += 1
+        # Takes a moment, as a read over the network would, so that other reads can start in the meantime
+        await asyncio.sleep(0.01)
+        return await super().get(path, shallow)
+
+
+def test_ignored_index_loaded_once() -> None:
+    """
+    Tests that looking up ignored users while the index of them is being loaded waits for that load, rather than
+    reading the whole node again
+    """
+
+    async def run() -> None:
+        backend: _ReadCountingBackend = _ReadCountingBackend({"Ignored": ["100000"]})
+        database.use_backend(backend)
+        assert await asyncio.gather(*(database.is_user_ignored(userid=userid) for userid in ("100000", "100002"))) \
+            == [True, False]
+        assert backend.reads["Ignored"] == 1
+
+    asyncio.run(run())
+
+
+def test_joined_index_built_once() -> None:
+    """
+    Tests that the index of joined channels is built out of 'Users' only once, by a single read shared between
+    everything that needs it at the same time, even when no channel turns out to be joined
+    """
+
+    async def run() -> None:
+        backend: _ReadCountingBackend = _ReadCountingBackend({"Users": {"100000": {"is_joined": True,
+                                                                                   "last_known_username": "someone"},
+                                                              "100002": {"is_joined": False}}})
+        database.use_backend(backend)
+        assert await asyncio.gather(*(database.get_joined_channels() for _ in range(3))) == [["100000"]] * 3
+        assert backend.reads["Users"] == 1
+
+        backend = _ReadCountingBackend()
+        database.use_backend(backend)
+        for _ in range(3):
+            assert await database.number_of_joined_channels() == 0
+        assert backend.reads["Users"] == 1
+
+    asyncio.run(run())
+
+
+def test_batched_writes() -> None:
+    """
+    Tests that writes made inside 'batched_writes' (and within the coalescing window) reach the backend as one update
+    """
+
+    class CountingBackend(MemoryBackend):
+        """
+        An in-memory backend that counts how many writes reach it
+        """
+
+        def __init__(self) -> None:
+            super().__init__()
+            self.writes: int = 0
+
+        async def set(self, path: str, value: Any) -> None:
+            self.writes += 1
+            await super().set(path, value)
+
+        async def update(self, path: str, values: Dict[str, Any]) -> None:
+            self.writes += 1
+            await super().update(path, values)
+
+    async def run() -> None:
+        backend: CountingBackend = CountingBackend()
+        database.use_backend(backend)
+        await database.join_channel(BOT_NICK, userid=BOT_ID)
+        assert backend.writes == 1
+
+        async with database.batched_writes():
+            await database.set_complement_chance(50.0, userid=BOT_ID)
+            await database.set_username("someone_else", userid=BOT_ID)
+            await database.leave_channel(userid=BOT_ID)
+        assert backend.writes == 2
+        assert await database.get_complement_chance(userid=BOT_ID) == 50.0
+        assert await database.get_username(userid=BOT_ID) == "someone_else"
+        assert not await database.is_channel_joined(userid=BOT_ID)
+        assert await database.get_joined_channels() == []
+
+        # A task started inside of the batch which writes after it was committed writes on its own
+        finished: asyncio.Event = asyncio.Event()
+
+        async def write_late() -> None:
+            await finished.wait()
+            await database.set_complement_chance(25.0, userid=BOT_ID)
+
+        async with database.batched_writes():
+            late: asyncio.Task = asyncio.create_task(write_late())
+        finished.set()
+        await late
+        assert backend.writes == 3
+        assert await database.get_complement_chance(userid=BOT_ID) == 25.0
+
+        database.set_write_coalescing_window(0.01)
+        await asyncio.gather(database.set_complement_chance(1.0, userid=BOT_ID),
+                             database.set_should_ignore_bots(False, userid=BOT_ID))
+        database.set_write_coalescing_window(0)
+        assert backend.writes == 4
+
+    asyncio.run(run())
+
+
+def test_toggle_flag() -> None:
+    """
+    Tests that of several concurrent toggles of the same flag, exactly one sees the old value
+    """
+
+    async def run() -> None:
+        database.use_backend(MemoryBackend())
+        await database.join_channel(BOT_NICK, userid=BOT_ID)
+        previous = await asyncio.gather(*(database.toggle_flag(BOT_ID, database.ChannelFlag.SHOULD_IGNORE_BOTS, False)
+                                          for _ in range(5)))
+        assert sorted(previous) == [False, False, False, False, True]
+        assert not await database.is_ignoring_bots(userid=BOT_ID)
+
+        assert not await database.ignore(userid=BOT_ID)
+        assert await database.ignore(userid=BOT_ID)
+        assert await database.unignore(userid=BOT_ID)
+        assert not await database.unignore(userid=BOT_ID)
+
+    asyncio.run(run())
+
+
+def test_complements_version() -> None:
+    """
+    Tests that a cached channel's complements version changes with its complements, and only with them
+    """
+
+    async def run() -> None:
+        database.use_backend(MemoryBackend())
+        database.start_settings_cache()
+        await asyncio.sleep(0)
+        await database.join_channel(BOT_NICK, userid=BOT_ID)
+        version = (await database.get_channel_settings(userid=BOT_ID)).complements_version
+        assert version is not None
+
+        await database.set_complement_chance(50.0, userid=BOT_ID)
+        assert (await database.get_channel_settings(userid=BOT_ID)).complements_version == version
+
+        await database.add_complement("you are great", userid=BOT_ID)
+        settings = await database.get_channel_settings(userid=BOT_ID)
+        assert settings.complements_version != version
+        assert settings.custom_complements == ("you are great",)
+
+        await database.toggle_flag(BOT_ID, database.ChannelFlag.CUSTOM_COMPLEMENTS_ENABLED, False)
+        assert (await database.get_channel_settings(userid=BOT_ID)).complements_version != settings.complements_version
+        database.stop_settings_cache()
+
+    asyncio.run(run())
@@ -0,0 +1,69 @@
+"""
+Tests for join_scheduler.py file
+"""
+
+import asyncio
+
+import pytest
+
+from src.complements_bot.join_scheduler import JoinPriority, JoinScheduler
+
+
+def test_join_order() -> None:
+    """
+    Tests that channels are joined most urgent first, no faster than the limit allows, and that failed joins are retried
+    """
+
+    async def run() -> None:
+        sent: list[str] = []
+
+        async def join(channels: list[str]) -> None:
+            sent.extend(channels)
+
+        scheduler = JoinScheduler(join, limit=20)
+        scheduler.note_activity("busy")
+        for channel in ("quiet", *(f"other{i}" for i in range(7)), "busy", "Live"):
+            scheduler.schedule(channel)
+        scheduler.schedule("live", JoinPriority.LIVE)
+        scheduler.schedule("streamer", JoinPriority.REQUESTED)
+        await asyncio.sleep(0.01)
+        # Only half of the limit goes out in one burst
+        assert sent[:3] == ["streamer", "live", "busy"] and len(sent) == 10
+        assert scheduler.progress() == {"queued": 1, "in_flight": 10}
+
+        scheduler.joined("streamer")
+        scheduler.failed("live")
+        assert scheduler.outcome_counts == {"joined": 1, "retried": 1, "gave_up": 0}
+        # Asking for a channel again skips its backoff
+        scheduler.schedule("live", JoinPriority.REQUESTED)
+        scheduler.cancel("quiet")
+        await asyncio.sleep(JoinScheduler.PERIOD / 10 + 0.1)
+        assert sent[10:] == ["live"]
+        assert scheduler.progress() == {"queued": 1, "in_flight": 8}
+
+    asyncio.run(run())
+
+
+def test_give_up(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Tests that a channel which keeps failing to be joined is given up on after MAX_ATTEMPTS, and that this is reported
+    """
+
+    async def run() -> None:
+        sent: list[str] = []
+        given_up: list[str] = []
+
+        async def join(channels: list[str]) -> None:
+            sent.extend(channels)
+
+        scheduler = JoinScheduler(join, limit=20, on_give_up=given_up.append)
+        scheduler.schedule("Gone")
+        for _ in range(JoinScheduler.MAX_ATTEMPTS):
+            await asyncio.sleep(0.01)
+            scheduler.failed("gone")
+        assert sent == ["gone"] * JoinScheduler.MAX_ATTEMPTS and given_up == ["gone"]
+        assert scheduler.outcome_counts == {"joined": 0, "retried": JoinScheduler.MAX_ATTEMPTS - 1, "gave_up": 1}
+        assert scheduler.progress() == {"queued": 0, "in_flight": 0}
+
+    monkeypatch.setattr(JoinScheduler, "BASE_BACKOFF", 0.0)
+    asyncio.run(run())
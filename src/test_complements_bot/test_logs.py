@@ -0,0 +1,48 @@
+"""
+Tests for logs.py file
+"""
+
+import json
+import logging
+import os
+import tempfile
+
+from src.complements_bot import logs
+
+
+def test_parse_levels() -> None:
+    """
+    Tests that 'parse_levels' turns categories into logger names
+    """
+
+    assert logs.parse_levels("chat=warning, commands=DEBUG,some.module=ERROR,nonsense") == {
+        logs.CHAT: "WARNING", logs.COMMANDS: "DEBUG", "some.module": "ERROR"}
+    assert not logs.parse_levels(None)
+
+
+def test_configure_logging() -> None:
+    """
+    Tests that logs are written to file as JSON lines, and that chat messages are sampled
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename: str = os.path.join(directory, "bot.log")
+        listener = logs.configure_logging(filename, "INFO", {logs.COMMANDS: "WARNING"}, chat_sample_rate=0)
+        try:
+            logging.getLogger(logs.CHAT).info("%s said: %s", "someone", "hi", extra={"channel": "somewhere"})
+            logging.getLogger(logs.CHAT).warning("chat is on fire")
+            logging.getLogger(logs.COMMANDS).info("not logged")
+            logging.getLogger(logs.COMPLEMENTS).info("%s was complemented", "someone", extra={"channel": "somewhere"})
+        finally:
+            listener.stop()
+            logging.getLogger().handlers.clear()
+            logging.getLogger(logs.CHAT).filters.clear()
+            logging.getLogger(logs.COMMANDS).setLevel(logging.NOTSET)
+
+        with open(filename, "r", encoding="utf-8") as log_file:
+            entries = [json.loads(line) for line in log_file]
+
+    assert [entry["message"] for entry in entries] == ["chat is on fire", "someone was complemented"]
+    assert entries[1]["category"] == logs.COMPLEMENTS
+    assert entries[1]["channel"] == "somewhere"
+    assert entries[1]["level"] == "INFO"
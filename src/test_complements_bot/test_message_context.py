@@ -0,0 +1,36 @@
+"""
+Tests for message_context.py file
+"""
+
+import asyncio
+
+from src.complements_bot import message_context
+
+
+def test_memoized() -> None:
+    """
+    Tests that a lookup is made once per message handled, however many times and from however many tasks it is asked for
+    """
+
+    async def run() -> None:
+        loads: list[str] = []
+
+        async def load() -> str:
+            loads.append("settings")
+            await asyncio.sleep(0)
+            return "loaded"
+
+        message, other_message = object(), object()
+        with message_context.handling(message):
+            results = await asyncio.gather(*(message_context.memoized(message, "settings", load) for _ in range(3)))
+            assert results == ["loaded"] * 3
+            assert await message_context.memoized(message, "settings", load) == "loaded"
+            assert len(loads) == 1
+
+            await message_context.memoized(other_message, "settings", load)
+            assert len(loads) == 2
+
+        await message_context.memoized(message, "settings", load)
+        assert len(loads) == 3
+
+    asyncio.run(run())
@@ -0,0 +1,58 @@
+"""
+Tests for metrics.py file
+"""
+
+from src.metrics import Collected, Counter, Histogram, Registry, merge_rendered
+
+
+def test_render() -> None:
+    """
+    Tests that a 'Registry' renders its metrics in Prometheus' text format
+    """
+
+    registry = Registry()
+    requests = Counter("requests_total", "Requests")
+    latency = Histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    for metric in (requests, latency, Collected("depth", "Depth", "gauge", lambda: [({"queue": 'a"b'}, 3)])):
+        registry.register(metric)
+
+    requests.inc(method="GET")
+    requests.inc(2, method="GET")
+    latency.observe(0.05, kind="x")
+    latency.observe(0.5, kind="x")
+    latency.observe(5, kind="x")
+
+    assert requests.value(method="GET") == 3
+    assert latency.count(kind="x") == 3
+    assert registry.render().splitlines() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{method="GET"} 3',
+        "# HELP latency_seconds Latency",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{kind="x",le="0.1"} 1',
+        'latency_seconds_bucket{kind="x",le="1"} 2',
+        'latency_seconds_bucket{kind="x",le="+Inf"} 3',
+        'latency_seconds_sum{kind="x"} 5.55',
+        'latency_seconds_count{kind="x"} 3',
+        "# HELP depth Depth",
+        "# TYPE depth gauge",
+        'depth{queue="a\\"b"} 3',
+    ]
+
+
+def test_merge_rendered() -> None:
+    """
+    Tests that the metrics of several processes are merged with a label telling them apart, describing each metric once
+    """
+
+    rendered = {worker: f"# HELP total Total\n# TYPE total counter\ntotal{{kind=\"x\"}} {worker}\ntotal 1\n"
+                for worker in ("0", "1")}
+    assert merge_rendered(rendered, "worker").splitlines() == [
+        "# HELP total Total",
+        "# TYPE total counter",
+        'total{worker="0",kind="x"} 0',
+        'total{worker="0"} 1',
+        'total{worker="1",kind="x"} 1',
+        'total{worker="1"} 1',
+    ]
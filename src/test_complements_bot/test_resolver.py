@@ -0,0 +1,50 @@
+"""
+Tests for resolver.py file
+"""
+
+import asyncio
+from typing import Any, NamedTuple, Optional
+
+from src.complements_bot.resolver import UserResolver
+from .testing_commons import BOT_ID, BOT_NICK
+
+
+class _User(NamedTuple):
+    """
+    The parts of a twitchio User that the resolver looks at
+    """
+
+    id: int
+    name: str
+
+
+def test_user_resolver() -> None:
+    """
+    Tests that concurrent lookups are coalesced into batches of at most 100 users, and that results are cached
+    """
+
+    requests: list[dict[str, Any]] = []
+
+    async def fetch_users(names: Optional[list[str]] = None, ids: Optional[list[int]] = None) -> list[_User]:
+        requests.append({"names": names, "ids": ids})
+        await asyncio.sleep(0)
+        if names is not None:
+            return [_User(int(name[4:]), name) for name in names if name.startswith("user")]
+        return [_User(userid, f"user{userid}") for userid in ids or []]
+
+    async def run() -> None:
+        resolver: UserResolver = UserResolver(fetch_users)
+        userids = await asyncio.gather(*(resolver.name_to_id(f"User{i % 120}") for i in range(300)))
+        assert userids == [str(i % 120) for i in range(300)]
+        assert len(requests) == 2 and all(len(request["names"]) <= 100 for request in requests)
+
+        assert await resolver.id_to_name("5") == "user5"
+        assert await resolver.name_to_id("nobody") is None
+        assert await resolver.name_to_id("nobody") is None
+        assert len(requests) == 3
+
+        resolver.remember(BOT_ID, BOT_NICK)
+        assert await resolver.id_to_name(BOT_ID) == BOT_NICK
+        assert len(requests) == 3
+
+    asyncio.run(run())
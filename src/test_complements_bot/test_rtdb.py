@@ -0,0 +1,82 @@
+"""
+Tests for rtdb.py file
+"""
+
+import asyncio
+from typing import Any, Callable, Dict, Optional, Tuple, cast
+
+from firebase_admin import credentials
+
+from src.complements_bot import database
+from src.complements_bot.rtdb import AsyncRTDBClient
+from src.complements_bot.storage import MemoryBackend
+
+
+class _FakeRTDBClient(AsyncRTDBClient):
+    """
+    A client whose requests are answered from an in-memory backend instead of over the network
+    """
+
+    def __init__(self, backend: MemoryBackend) -> None:
+        super().__init__("https://example.firebaseio.com", cast(credentials.Certificate, None))
+        self._backend: MemoryBackend = backend
+        self._version: int = 0
+        self.puts: int = 0
+
+    async def _request(self,
+                       method: str,
+                       path: str,
+                       *,
+                       body: Any = None,
+                       params: Optional[Dict[str, str]] = None,
+                       headers: Optional[Dict[str, str]] = None,
+                       ok_statuses: Tuple[int, ...] = ()) -> Tuple[int, Any, Optional[str]]:
+        if method == "PUT":
+            if (headers or {}).get("if-match", str(self._version)) != str(self._version):
+                return 412, await self._backend.get(path), str(self._version)
+            self.puts += 1
+            self._version += 1
+            await self._backend.set(path, body)
+        return 200, await self._backend.get(path), str(self._version)
+
+
+class _RESTTransactionBackend(MemoryBackend):
+    """
+    An in-memory backend whose transactions go through the REST client's transaction logic
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.client: _FakeRTDBClient = _FakeRTDBClient(MemoryBackend())
+
+    async def get(self, path: str, shallow: bool = False) -> Any:
+        return await self.client.get(path, shallow)
+
+    async def transaction(self, path: str, transaction_update: Callable[[Any], Any]) -> Any:
+        return await self.client.transaction(path, transaction_update)
+
+
+def test_transaction_changing_data_in_place() -> None:
+    """
+    Tests that transactions which change the data they are given in place (as adding and removing complements do)
+    are still written
+    """
+
+    async def run() -> None:
+        backend: _RESTTransactionBackend = _RESTTransactionBackend()
+        database.use_backend(backend)
+        userid: str = "100000"
+
+        await database.add_complement("a", userid=userid)
+        await database.add_complement("b", userid=userid)
+        assert backend.client.puts == 2
+        await database.remove_complements(userid=userid, to_remove=["a"])
+        assert backend.client.puts == 3
+        database.use_backend(backend)
+        assert await database.get_custom_complements(userid=userid) == ["b"]
+
+        # Transactions which change nothing are not written
+        assert await backend.transaction("Users", lambda data: data) == {userid: {"custom_complements": ["b"]}}
+        assert backend.client.puts == 3
+
+    asyncio.run(run())
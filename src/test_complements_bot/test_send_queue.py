@@ -0,0 +1,81 @@
+"""
+Tests for send_queue.py file
+"""
+
+import asyncio
+
+from src.complements_bot.send_queue import Priority, SendQueue
+
+
+class _Channel:
+    """
+    Stands in for a TwitchIO channel, remembering everything sent to it
+    """
+
+    def __init__(self, name: str, sent: list[str]) -> None:
+        self.name: str = name
+        self._sent: list[str] = sent
+
+    async def send(self, content: str) -> None:
+        """
+        :param content: the message to send
+        """
+        self._sent.append(content)
+
+
+def test_send_queue() -> None:
+    """
+    Tests that 'SendQueue' sends command replies before random complements, paces each channel, and drops stale
+    random complements
+    """
+
+    async def run() -> None:
+        sent: list[str] = []
+        first, second = _Channel("first", sent), _Channel("second", sent)
+        queue = SendQueue(limit=20)
+        SendQueue.CHANNEL_RATE = 20.0  # so that the test does not have to wait whole seconds
+
+        results = await asyncio.gather(
+                queue.send(first, "complement 1", Priority.RANDOM_COMPLEMENT, 1.0),
+                queue.send(first, "reply 1"),
+                queue.send(second, "reply 2"),
+                queue.send(first, "stale complement", Priority.RANDOM_COMPLEMENT, 0.0),
+                queue.send(first, "complement 2", Priority.RANDOM_COMPLEMENT, 1.0),
+        )
+        assert results == [True, True, True, False, True]
+        assert sent == ["reply 1", "reply 2", "complement 1", "complement 2"]
+        assert queue.outcome_counts["sent", "command_reply"] == 2
+        assert queue.outcome_counts["dropped", "random_complement"] == 1
+        assert queue.depth() == {"command_reply": 0, "random_complement": 0}
+
+    rate: float = SendQueue.CHANNEL_RATE
+    try:
+        asyncio.run(run())
+    finally:
+        SendQueue.CHANNEL_RATE = rate
+
+
+def test_send_queue_joins_messages() -> None:
+    """
+    Tests that 'SendQueue' joins messages to the same channel made within its join window, keeping the prefix only once
+    """
+
+    async def run() -> None:
+        sent: list[str] = []
+        first, second = _Channel("first", sent), _Channel("second", sent)
+        queue = SendQueue(limit=20, join_window=0.05)
+
+        results = await asyncio.gather(
+                queue.send(first, "! @a nice", Priority.RANDOM_COMPLEMENT, None, "! "),
+                queue.send(second, "! @b cool", Priority.RANDOM_COMPLEMENT, None, "! "),
+                queue.send(first, "! @c great", Priority.RANDOM_COMPLEMENT, None, "! "),
+                queue.send(first, "@d unmuted", Priority.RANDOM_COMPLEMENT, None, ""),
+                queue.send(first, "! " + "x" * SendQueue.MAX_MESSAGE_LENGTH, Priority.RANDOM_COMPLEMENT, None, "! "),
+        )
+        assert all(results)
+        assert sent[:2] == ["! @a nice @c great", "! @b cool"]
+        assert len(sent) == 4
+        assert queue.outcome_counts["joined", "random_complement"] == 1
+        assert queue.outcome_counts["sent", "random_complement"] == 5
+
+    asyncio.run(run())
@@ -0,0 +1,89 @@
+"""
+Tests for sharding.py file
+"""
+
+import asyncio
+import multiprocessing
+import time
+from collections import Counter
+from typing import Optional
+
+import pytest
+
+from src.complements_bot.sharding import HashRing, ShardMessage, ShardSupervisor, ShardWorkerBot
+
+
+def test_hash_ring() -> None:
+    """
+    Tests that a 'HashRing' spreads keys over its nodes, and that adding a node only moves keys onto that node
+    """
+
+    assert HashRing().owner("1") is None
+    ring = HashRing(["0", "1", "2"])
+    keys = [str(userid) for userid in range(3000)]
+    owners = {key: ring.owner(key) for key in keys}
+    assert all(500 < count < 1500 for count in Counter(owners.values()).values())
+
+    ring.add("3")
+    moved = [key for key in keys if ring.owner(key) != owners[key]]
+    assert all(ring.owner(key) == "3" for key in moved)
+    assert 400 < len(moved) < 1200
+
+    ring.remove("3")
+    assert all(ring.owner(key) == owners[key] for key in keys)
+
+
+def test_worker_forwards_other_shards() -> None:
+    """
+    Tests that a worker keeps its own chat connection, and passes joins and leaves of channels in other shards on to
+    the supervisor
+    """
+
+    async def run() -> None:
+        worker_pipe, supervisor_pipe = multiprocessing.Pipe()
+        bot = ShardWorkerBot(0, 2, worker_pipe)
+        assert not bot.is_connected()
+
+        ring = HashRing(["0", "1"])
+        other = next(str(userid) for userid in range(100000, 100100) if ring.owner(str(userid)) == "1")
+        assert not bot.owns_channel(other)
+        await bot.serve_channel(other, "someone")
+        await bot.stop_serving_channel(other, "someone")
+        assert supervisor_pipe.recv() == ShardMessage("join", other, "someone")
+        assert supervisor_pipe.recv() == ShardMessage("leave", other, "someone")
+
+    asyncio.run(run())
+
+
+class _SlowProcess:
+    """
+    A worker process which takes a while to be joined
+    """
+    exitcode: int = 1
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        """
+        Blocks for a while, as joining a process which has not quite exited yet does
+        """
+        time.sleep(min(timeout or 0.2, 0.2))
+
+
+def test_supervisor_restarts_worker(monkeypatch: pytest.MonkeyPatch) -> None:
+    """
+    Tests that a worker which stopped is restarted, without the supervisor's event loop waiting for it to exit
+    """
+
+    async def run() -> None:
+        supervisor = ShardSupervisor(1)
+        restarted: asyncio.Event = asyncio.Event()
+        monkeypatch.setattr(supervisor, "start_worker", lambda _index: restarted.set())
+        supervisor._processes[0] = _SlowProcess()  # type: ignore  # pylint: disable=protected-access
+
+        started: float = time.monotonic()
+        supervisor._worker_stopped(0)  # pylint: disable=protected-access
+        await asyncio.sleep(0)
+        assert time.monotonic() - started < 0.1 and not restarted.is_set()
+        await asyncio.wait_for(restarted.wait(), 1)
+
+    monkeypatch.setattr(ShardSupervisor, "RESTART_DELAY", 0.0)
+    asyncio.run(run())
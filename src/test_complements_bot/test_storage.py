@@ -0,0 +1,54 @@
+"""
+Tests for storage.py file
+"""
+
+import asyncio
+import os
+import tempfile
+from typing import Any
+
+from src.complements_bot.storage import MemoryBackend, SQLiteBackend, StorageBackend
+
+
+async def _exercise_backend(backend: StorageBackend) -> None:
+    """
+    Runs the same reads and writes against 'backend', checking that it behaves the way the Firebase database does
+    """
+    events: list[tuple[str, str, Any]] = []
+    listener = backend.listen("Users/1", lambda event_type, path, data: events.append((event_type, path, data)))
+    await asyncio.sleep(0)
+
+    await backend.set("Users/1", {"is_joined": True, "custom_complements": ["a", "b"]})
+    await backend.update("Users", {"1/complement_chance": 5.0, "2/is_joined": False})
+    assert await backend.get("Users/1") == {"is_joined": True, "custom_complements": ["a", "b"], "complement_chance": 5.0}
+    assert await backend.get("Users", shallow=True) == {"1": True, "2": True}
+
+    assert await backend.transaction("Users/1/custom_complements", lambda data: data + ["c"]) == ["a", "b", "c"]
+    await backend.delete("Users/2/is_joined")
+    assert await backend.get("Users/2") is None
+    listener.close()
+
+    assert events[0] == ("put", "/", None)
+    assert events[-1] == ("put", "/custom_complements", ["a", "b", "c"])
+
+
+def test_memory_backend() -> None:
+    """
+    Tests reading, writing and listening with the in-memory backend
+    """
+
+    asyncio.run(_exercise_backend(MemoryBackend()))
+
+
+def test_sqlite_backend() -> None:
+    """
+    Tests reading, writing and listening with the SQLite backend
+    """
+
+    async def run(filename: str) -> None:
+        backend: SQLiteBackend = SQLiteBackend(filename)
+        await _exercise_backend(backend)
+        await backend.close()
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(run(os.path.join(directory, "test.sqlite3")))
@@ -0,0 +1,43 @@
+"""
+Tests for tracing.py file
+"""
+
+import asyncio
+import logging
+
+import pytest
+
+from src.complements_bot import logs, tracing
+
+
+@tracing.traced("stage")
+async def _stage(children: int) -> None:
+    await asyncio.gather(*(_stage(0) for _ in range(children)))
+
+
+def test_trace(caplog: pytest.LogCaptureFixture) -> None:
+    """
+    Tests that spans nest under the stage they were started from, even across tasks, and that slow traces are logged
+    """
+
+    async def run() -> None:
+        with tracing.trace("message", 0.0, channel="somewhere") as root:
+            await _stage(2)
+            with tracing.span("sync"):
+                pass
+        assert root is not None
+        assert [child.name for child in root.children] == ["stage", "sync"]
+        assert [child.name for child in root.children[0].children] == ["stage", "stage"]
+
+        with tracing.trace("untraced", None) as nothing:
+            await _stage(1)
+        assert nothing is None
+
+    with caplog.at_level(logging.WARNING, logger=logs.TRACES):
+        asyncio.run(run())
+    assert len(caplog.records) == 1
+    lines = caplog.records[0].getMessage().splitlines()
+    assert lines[0].startswith("Slow message")
+    assert lines[1].startswith("message +0.0ms") and lines[1].endswith("channel=somewhere")
+    assert [(len(line) - len(line.lstrip()), line.split()[0]) for line in lines[2:]] == [
+        (2, "stage"), (4, "stage"), (4, "stage"), (2, "sync")]
@@ -2,7 +2,7 @@
 Tests for utilities.py file
 """
 
-from src.complements_bot.utilities import run_with_appropriate_awaiting, remove_chars
+from src.complements_bot.utilities import ShuffleBag, run_with_appropriate_awaiting, remove_chars
 
 
 def test_run_with_appropriate_awaiting():
@@ -20,3 +20,15 @@ def test_remove_chars():
     """
 
     assert remove_chars(" []{{{]/rteybhdrty   .,.5464   thjfg ??>~~``") == "rteybhdrty5464thjfg"
+
+
+def test_shuffle_bag():
+    """
+    Tests that the 'ShuffleBag' of utilities hands out every index once per round, never twice in a row
+    """
+
+    bag = ShuffleBag(5)
+    draws = [bag.draw() for _ in range(50)]
+    for i in range(0, 50, 5):
+        assert sorted(draws[i:i + 5]) == [0, 1, 2, 3, 4]
+    assert all(first != second for first, second in zip(draws, draws[1:]))
@@ -0,0 +1,12 @@
+import os
+
+from src.complements_bot.logs import configure_logging_from_env
+from src.complements_bot.sharding import run_supervisor
+from src.env_reader import SHARD_WORKERS
+
+if __name__ == "__main__":
+    log_listener = configure_logging_from_env()
+    try:
+        run_supervisor(int(SHARD_WORKERS or os.cpu_count() or 1))
+    finally:
+        log_listener.stop()